@@ -0,0 +1,50 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# TIEMPOS DE ARRANQUE: CADA marca() REGISTRA CUANTO TARDO LA ETAPA DESDE LA MARCA ANTERIOR
+# EL RELOJ EMPIEZA AL IMPORTAR ESTE MODULO, POR ESO DEBE SER LO PRIMERO QUE IMPORTA main.py
+# LAS INICIALIZACIONES PEREZOSAS (POR EJ. GEMINI) SE REGISTRAN APARTE CON registrar(), NO SUMAN AL ARRANQUE
+
+_inicio = time.perf_counter()
+_lock = threading.Lock()
+_ultima_marca = _inicio
+_etapas = []
+_diferidas = []
+
+# FUNCION PARA CERRAR UNA ETAPA DEL ARRANQUE: marca("importaciones") DESPUES DE LOS import
+def marca(nombre: str) -> float:
+    global _ultima_marca
+    ahora = time.perf_counter()
+    with _lock:
+        duracion = ahora - _ultima_marca
+        _etapas.append((nombre, duracion))
+        _ultima_marca = ahora
+    return duracion
+
+# FUNCION PARA REGISTRAR EL COSTO DE UNA INICIALIZACION DIFERIDA, QUE OCURRE DESPUES DEL ARRANQUE (EN EL PRIMER USO)
+def registrar(nombre: str, segundos: float):
+    with _lock:
+        _diferidas.append((nombre, segundos))
+    logger.info(f"Inicialización diferida '{nombre}' completada en {segundos * 1000:.0f}ms.")
+
+def elapsed() -> float:
+    return time.perf_counter() - _inicio
+
+# FUNCION PARA ARMAR EL REPORTE: TOTAL HASTA AHORA, CADA ETAPA CON SU PORCENTAJE Y LAS INICIALIZACIONES DIFERIDAS
+def report() -> str:
+    total = elapsed()
+    with _lock:
+        etapas = list(_etapas)
+        diferidas = list(_diferidas)
+    lineas = [f"Arranque listo en {total * 1000:.0f}ms:"]
+    for nombre, duracion in etapas:
+        lineas.append(f"  - {nombre}: {duracion * 1000:.0f}ms ({duracion / total * 100 if total else 0:.0f}%)")
+    for nombre, duracion in diferidas:
+        lineas.append(f"  - {nombre} (diferida, en el primer uso): {duracion * 1000:.0f}ms")
+    return "\n".join(lineas)
+
+def log_report():
+    logger.info(report())
@@ -0,0 +1,129 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+
+from cache_respuestas import LRUTTLCache
+
+# AUTENTICACION POR PIN: HASH DEL PIN, COMPARACION EN TIEMPO CONSTANTE, SESIONES VERIFICADAS Y BLOQUEO POR INTENTOS FALLIDOS
+# TRAS UN PIN CORRECTO EL USUARIO QUEDA VERIFICADO AUTH_SESSION_TTL_S SEGUNDOS Y NO SE LE VUELVE A PEDIR EL PIN
+
+PIN_HASH_ITERATIONS = int(os.getenv("PIN_HASH_ITERATIONS", "100000"))
+AUTH_SESSION_TTL_S = float(os.getenv("AUTH_SESSION_TTL_S", "300"))
+MAX_FAILED_ATTEMPTS = int(os.getenv("MAX_FAILED_PIN_ATTEMPTS", "3"))
+LOCKOUT_S = float(os.getenv("PIN_LOCKOUT_S", "300"))
+# VENTANA EN LA QUE SE CUENTAN LOS PINES INCORRECTOS, PASADA ESTA EDAD DESDE EL PRIMER FALLO EL CONTEO SE REINICIA
+FAILED_PIN_WINDOW_S = float(os.getenv("FAILED_PIN_WINDOW_S", str(LOCKOUT_S)))
+PIN_CACHE_TTL_S = float(os.getenv("PIN_CACHE_TTL_S", "120"))
+MAX_CACHED_USERS = int(os.getenv("AUTH_MAX_CACHED_USERS", "10000"))
+
+_HASH_PREFIX = "pbkdf2_sha256"
+
+_verified_sessions = LRUTTLCache(MAX_CACHED_USERS, AUTH_SESSION_TTL_S)
+# PIN (HASH) GUARDADO DE CADA USUARIO, EVITA VOLVER A LEERLO DE LA DB ENTRE EL PEDIDO DEL PIN Y SU VERIFICACION
+_stored_pins = LRUTTLCache(MAX_CACHED_USERS, PIN_CACHE_TTL_S)
+_failed_lock = threading.Lock()
+# telegram_id -> (FALLOS, MONOTONIC DEL PRIMER FALLO, BLOQUEADO HASTA O 0), COMO MAXIMO MAX_CACHED_USERS USUARIOS
+_failed_attempts = {}
+
+# FUNCION PARA GENERAR EL HASH QUE SE GUARDA EN users.pin (FORMATO: pbkdf2_sha256$ITERACIONES$SAL$HASH)
+def hash_pin(pin: str) -> str:
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", pin.encode("utf-8"), salt, PIN_HASH_ITERATIONS)
+    return f"{_HASH_PREFIX}${PIN_HASH_ITERATIONS}${salt.hex()}${digest.hex()}"
+
+def is_hashed(stored_pin: str) -> bool:
+    return stored_pin.startswith(_HASH_PREFIX + "$")
+
+# FUNCION PARA VERIFICAR EL PIN INGRESADO CONTRA EL GUARDADO, SIEMPRE EN TIEMPO CONSTANTE
+# ACEPTA PINES VIEJOS EN TEXTO PLANO (ANTERIORES AL HASH), EL LLAMADOR DEBE RE-GUARDARLOS CON hash_pin
+def verify_pin(stored_pin: str, entered_pin: str) -> bool:
+    if not stored_pin:
+        return False
+    if not is_hashed(stored_pin):
+        return hmac.compare_digest(stored_pin.encode("utf-8"), entered_pin.encode("utf-8"))
+    try:
+        _, iterations, salt_hex, digest_hex = stored_pin.split("$")
+        digest = hashlib.pbkdf2_hmac("sha256", entered_pin.encode("utf-8"), bytes.fromhex(salt_hex), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(digest.hex(), digest_hex)
+
+def get_cached_pin(telegram_id: int):
+    return _stored_pins.get(telegram_id)
+
+def cache_pin(telegram_id: int, stored_pin: str):
+    _stored_pins.put(telegram_id, stored_pin)
+
+def forget_pin(telegram_id: int):
+    _stored_pins.invalidate(telegram_id)
+
+# SESIONES VERIFICADAS: SE OTORGAN TRAS UN PIN CORRECTO Y VENCEN SOLAS
+def is_verified(telegram_id: int) -> bool:
+    return _verified_sessions.get(telegram_id) is not None
+
+def grant_session(telegram_id: int):
+    _verified_sessions.put(telegram_id, True)
+
+def revoke_session(telegram_id: int):
+    _verified_sessions.invalidate(telegram_id)
+
+# FUNCION QUE DEVUELVE LOS SEGUNDOS QUE LE QUEDAN DE BLOQUEO AL USUARIO (0 SI PUEDE INTENTAR)
+def lockout_remaining(telegram_id: int) -> float:
+    with _failed_lock:
+        entry = _failed_attempts.get(telegram_id)
+        if not entry:
+            return 0.0
+        ahora = time.monotonic()
+        if _vencido(entry, ahora):
+            del _failed_attempts[telegram_id]
+            return 0.0
+        failures, _, locked_until = entry
+        return max(locked_until - ahora, 0.0) if failures >= MAX_FAILED_ATTEMPTS else 0.0
+
+# FUNCION PARA REGISTRAR UN PIN INCORRECTO, AL LLEGAR A MAX_FAILED_ATTEMPTS DENTRO DE FAILED_PIN_WINDOW_S SE BLOQUEA AL USUARIO LOCKOUT_S SEGUNDOS
+# LOS FALLOS MAS VIEJOS QUE LA VENTANA NO CUENTAN: EL CONTEO VUELVE A EMPEZAR DESDE ESTE FALLO
+def register_failure(telegram_id: int) -> int:
+    with _failed_lock:
+        ahora = time.monotonic()
+        entry = _failed_attempts.get(telegram_id)
+        if entry is None or _vencido(entry, ahora):
+            if len(_failed_attempts) >= MAX_CACHED_USERS:
+                _podar(ahora)
+            failures, first_failure = 0, ahora
+        else:
+            failures, first_failure, _ = entry
+        failures += 1
+        locked_until = ahora + LOCKOUT_S if failures >= MAX_FAILED_ATTEMPTS else 0.0
+        _failed_attempts[telegram_id] = (failures, first_failure, locked_until)
+        return failures
+
+def reset_failures(telegram_id: int):
+    with _failed_lock:
+        _failed_attempts.pop(telegram_id, None)
+
+# UN REGISTRO VENCE CUANDO TERMINA SU BLOQUEO O, SIN BLOQUEO, CUANDO SU PRIMER FALLO SALE DE LA VENTANA
+def _vencido(entry: tuple, ahora: float) -> bool:
+    _, first_failure, locked_until = entry
+    if locked_until:
+        return locked_until <= ahora
+    return ahora - first_failure >= FAILED_PIN_WINDOW_S
+
+# SE LLAMA CON _failed_lock TOMADO AL LLENARSE EL REGISTRO: QUITA LOS VENCIDOS Y, SI SIGUE LLENO, LOS MAS VIEJOS
+def _podar(ahora: float):
+    for telegram_id in [tid for tid, entry in _failed_attempts.items() if _vencido(entry, ahora)]:
+        del _failed_attempts[telegram_id]
+    while len(_failed_attempts) >= MAX_CACHED_USERS:
+        del _failed_attempts[next(iter(_failed_attempts))]
+
+def auth_stats() -> dict:
+    with _failed_lock:
+        ahora = time.monotonic()
+        locked = sum(1 for entry in _failed_attempts.values() if entry[0] >= MAX_FAILED_ATTEMPTS and not _vencido(entry, ahora))
+    return {
+        "verified_sessions": len(_verified_sessions),
+        "cached_pins": _stored_pins.stats(),
+        "locked_users": locked,
+    }
@@ -0,0 +1,273 @@
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import autenticacion
+import main
+from db import conexiones, migraciones
+
+# BENCHMARK DE CARGA SIN CONEXION: REPRODUCE MENSAJES SINTETICOS CONTRA LOS HANDLERS DE main.py
+# EL BOT Y EL MODELO DE GEMINI SE REEMPLAZAN POR STUBS (EL MODELO CON LATENCIA CONFIGURABLE)
+# REPORTA p50/p95/p99, MENSAJES POR SEGUNDO Y CONSULTAS A LA DB POR ESCENARIO, Y GUARDA TODO EN JSON
+# SE EJECUTA CON: python -m benchmarks.bench_handlers --messages 2000 --concurrency 8 --output resultados.json
+# PARA COMPARAR CONTRA UNA CORRIDA ANTERIOR: --compare resultados_anteriores.json
+
+NS = types.SimpleNamespace
+
+PIN_BENCHMARK = "1234"
+PREGUNTAS_GENERALES = [
+    "¿Qué tarjetas ofrecen?",
+    "¿Conviene un plazo fijo?",
+    "¿Cuáles son las tasas de interés?",
+    "Quiero saber los beneficios tarjeta de crédito",
+    "¿Qué tipos de tarjeta tienen?",
+]
+MENSAJES_FALLBACK = ["Hola, ¿cómo estás?", "¿Abren los sábados?", "Contame un chiste"]
+
+# MEZCLA DE TRAFICO POR DEFECTO (ESCENARIO: PESO)
+MEZCLA_POR_DEFECTO = {
+    "start": 5,
+    "setpin": 2,
+    "saldo_pin": 15,
+    "saldo_sesion": 15,
+    "prestamo_pin": 8,
+    "simulacion": 10,
+    "general": 25,
+    "fallback": 20,
+}
+
+# STUB DEL MODELO: DEVUELVE UNA RESPUESTA CON LA MISMA FORMA QUE LA DE GEMINI TRAS latency_s SEGUNDOS
+class StubModel:
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt_content, stream=False):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency_s)
+        texto = "Respuesta simulada de IceCash para el benchmark."
+        candidate = NS(finish_reason=NS(name="STOP"), content=NS(parts=[NS(text=texto)]), safety_ratings=[])
+        return NS(candidates=[candidate])
+
+# STUB DEL BOT: NO ENVIA NADA, SOLO CUENTA LOS MENSAJES QUE SE HABRIAN ENVIADO
+class StubBot:
+    def __init__(self):
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def _contar(self):
+        with self._lock:
+            self.sent += 1
+
+    def reply_to(self, message, text, **kwargs):
+        self._contar()
+        return NS(chat=message.chat, message_id=1)
+
+    def send_message(self, chat_id, text, **kwargs):
+        self._contar()
+        return NS(chat=NS(id=chat_id), message_id=1)
+
+    def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        self._contar()
+
+    def send_document(self, chat_id, document, **kwargs):
+        self._contar()
+
+def _mensaje(texto: str, telegram_id: int):
+    return NS(
+        text=texto,
+        content_type="text",
+        chat=NS(id=telegram_id),
+        from_user=NS(id=telegram_id, first_name=f"Usuario{telegram_id}", username=f"user{telegram_id}"),
+    )
+
+# FUNCION PARA CREAR UNA DB TEMPORAL CON EL ESQUEMA ACTUAL Y users USUARIOS CON CUENTAS, MOVIMIENTOS Y PRESTAMOS
+def crear_db_benchmark(path: str, users: int, movimientos_por_cuenta: int, rng: random.Random) -> list:
+    conn = sqlite3.connect(path)
+    migraciones.migrate(conn)
+    pin_hash = autenticacion.hash_pin(PIN_BENCHMARK)
+    telegram_ids = list(range(100000, 100000 + users))
+    inicio = datetime(2025, 1, 1)
+    with conn:
+        for telegram_id in telegram_ids:
+            conn.execute("INSERT INTO users (telegram_id, name, pin) VALUES (?, ?, ?)", (telegram_id, f"Usuario{telegram_id}", pin_hash))
+            for nombre, moneda in (("Ahorro Pesos IceCash", "UYU"), ("Corriente Dólares IceCash", "USD")):
+                cursor = conn.execute("INSERT INTO cuentas (telegram_id, name, dinero, currency) VALUES (?, ?, ?, ?)",
+                                      (telegram_id, nombre, round(rng.uniform(0, 100000), 2), moneda))
+                conn.executemany(
+                    "INSERT INTO hmovimientos (telegram_id, account_id, name, dinero, timestamp) VALUES (?, ?, ?, ?, ?)",
+                    [(telegram_id, cursor.lastrowid, "Movimiento", round(rng.uniform(-5000, 5000), 2),
+                      (inicio + timedelta(minutes=rng.randint(0, 500000))).strftime('%Y-%m-%d %H:%M:%S'))
+                     for _ in range(movimientos_por_cuenta)])
+            conn.execute("INSERT INTO prestamos (telegram_id, name, dinero, dineroEntregado, due_date) VALUES (?, ?, ?, ?, ?)",
+                         (telegram_id, "Préstamo Consumo", 50000, 10000, "2026-12-31"))
+    conn.close()
+    return telegram_ids
+
+# ESCENARIOS: CADA UNO ES UNA INTERACCION COMPLETA (EL FLUJO CON PIN SON DOS MENSAJES)
+def _escenario(nombre: str, telegram_id: int, rng: random.Random) -> int:
+    if nombre == "start":
+        main.send_welcome(_mensaje("/start", telegram_id))
+        return 1
+    if nombre == "setpin":
+        main.set_pin_command(_mensaje(f"/setpin {PIN_BENCHMARK}", telegram_id))
+        return 1
+    if nombre in ("saldo_pin", "prestamo_pin"):
+        autenticacion.revoke_session(telegram_id)
+        main.handle_non_command_message(_mensaje("Quiero ver mi saldo" if nombre == "saldo_pin" else "mis prestamos", telegram_id))
+        main.handle_non_command_message(_mensaje(PIN_BENCHMARK, telegram_id))
+        return 2
+    if nombre == "saldo_sesion":
+        autenticacion.grant_session(telegram_id)
+        main.handle_non_command_message(_mensaje("¿Cuánto tengo en mi cuenta?", telegram_id))
+        return 1
+    if nombre == "simulacion":
+        main.handle_non_command_message(_mensaje(f"¿Cuánto pagaría si pido {rng.randint(1, 50) * 10000} en {rng.choice([12, 24, 36])} cuotas?", telegram_id))
+        return 1
+    if nombre == "general":
+        main.handle_non_command_message(_mensaje(rng.choice(PREGUNTAS_GENERALES), telegram_id))
+        return 1
+    if nombre == "fallback":
+        main.handle_non_command_message(_mensaje(rng.choice(MENSAJES_FALLBACK), telegram_id))
+        return 1
+    raise ValueError(f"Escenario desconocido: {nombre}")
+
+def _percentil(valores_ordenados: list, p: float) -> float:
+    if not valores_ordenados:
+        return 0.0
+    indice = min(len(valores_ordenados) - 1, max(0, round(p / 100 * len(valores_ordenados) + 0.5) - 1))
+    return valores_ordenados[indice]
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+def run(messages: int, concurrency: int, llm_latency_s: float, users: int, movimientos: int, mix: dict, seed: int) -> dict:
+    rng = random.Random(seed)
+    tmpdir = tempfile.mkdtemp(prefix="bench_bot_")
+    db_path = os.path.join(tmpdir, "bench.db")
+    telegram_ids = crear_db_benchmark(db_path, users, movimientos, rng)
+    conexiones.init_pool(db_path, max(concurrency, 1))
+
+    stub_model = StubModel(llm_latency_s)
+    stub_bot = StubBot()
+    main.model = stub_model
+    main.bot = stub_bot
+
+    # CADA SENTENCIA SQL SE ATRIBUYE AL ESCENARIO QUE ESTA CORRIENDO EN ESE HILO
+    actual = threading.local()
+    consultas = {nombre: 0 for nombre in mix}
+    consultas_lock = threading.Lock()
+
+    def _trace(sql: str):
+        nombre = getattr(actual, "escenario", None)
+        if nombre and sql.lstrip()[:6].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+            with consultas_lock:
+                consultas[nombre] += 1
+
+    conexiones.set_trace_callback(_trace)
+
+    nombres = list(mix)
+    plan = [(rng.choices(nombres, weights=[mix[n] for n in nombres])[0], rng.choice(telegram_ids), rng.random()) for _ in range(messages)]
+    latencias = {nombre: [] for nombre in nombres}
+    mensajes_enviados = {nombre: 0 for nombre in nombres}
+    latencias_lock = threading.Lock()
+
+    def _ejecutar(item):
+        nombre, telegram_id, semilla = item
+        actual.escenario = nombre
+        inicio = time.perf_counter()
+        cantidad = _escenario(nombre, telegram_id, random.Random(semilla))
+        duracion = time.perf_counter() - inicio
+        actual.escenario = None
+        with latencias_lock:
+            latencias[nombre].append(duracion)
+            mensajes_enviados[nombre] += cantidad
+
+    inicio_total = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(_ejecutar, plan))
+    duracion_total = time.perf_counter() - inicio_total
+    conexiones.set_trace_callback(None)
+
+    escenarios = {}
+    for nombre in nombres:
+        valores = sorted(latencias[nombre])
+        if not valores:
+            continue
+        escenarios[nombre] = {
+            "interactions": len(valores),
+            "messages": mensajes_enviados[nombre],
+            "p50_ms": _percentil(valores, 50) * 1000,
+            "p95_ms": _percentil(valores, 95) * 1000,
+            "p99_ms": _percentil(valores, 99) * 1000,
+            "mean_ms": sum(valores) / len(valores) * 1000,
+            "db_queries_per_interaction": consultas[nombre] / len(valores),
+        }
+    total_mensajes = sum(mensajes_enviados.values())
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "messages": messages, "concurrency": concurrency, "llm_latency_s": llm_latency_s,
+            "users": users, "movements_per_account": movimientos, "mix": mix, "seed": seed,
+        },
+        "duration_s": duracion_total,
+        "messages_per_s": total_mensajes / duracion_total if duracion_total else 0.0,
+        "interactions_per_s": messages / duracion_total if duracion_total else 0.0,
+        "llm_calls": stub_model.calls,
+        "replies_sent": stub_bot.sent,
+        "pool": conexiones.pool_stats(),
+        "scenarios": escenarios,
+    }
+
+def imprimir(resultado: dict, anterior: dict = None):
+    print(f"commit {resultado['commit']} | {resultado['messages_per_s']:.1f} msg/s | "
+          f"{resultado['interactions_per_s']:.1f} interacciones/s | llamadas LLM {resultado['llm_calls']}")
+    print(f"{'escenario':<14} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'consultas':>10}" + ("  Δp95" if anterior else ""))
+    for nombre, datos in resultado["scenarios"].items():
+        linea = (f"{nombre:<14} {datos['interactions']:>6} {datos['p50_ms']:>9.2f} {datos['p95_ms']:>9.2f} "
+                 f"{datos['p99_ms']:>9.2f} {datos['db_queries_per_interaction']:>10.2f}")
+        previo = (anterior or {}).get("scenarios", {}).get(nombre)
+        if previo and previo["p95_ms"]:
+            linea += f"  {(datos['p95_ms'] - previo['p95_ms']) / previo['p95_ms'] * 100:+.1f}%"
+        print(linea)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark offline de los handlers del bot.")
+    parser.add_argument("--messages", type=int, default=1000, help="Cantidad de interacciones a reproducir.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Hilos que atienden mensajes en paralelo.")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Latencia simulada de Gemini en segundos.")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--movements", type=int, default=50, help="Movimientos por cuenta en la DB sintética.")
+    parser.add_argument("--mix", type=json.loads, default=MEZCLA_POR_DEFECTO, help='JSON {"escenario": peso}.')
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="Archivo JSON donde guardar los resultados.")
+    parser.add_argument("--compare", help="JSON de una corrida anterior para comparar p95.")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    resultado = run(args.messages, args.concurrency, args.llm_latency, args.users, args.movements, args.mix, args.seed)
+    anterior = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            anterior = json.load(f)
+    imprimir(resultado, anterior)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.output}")
@@ -0,0 +1,53 @@
+import argparse
+import random
+import string
+import timeit
+
+from intenciones import IntentEngine, check_keywords
+
+# MICRO-BENCHMARK: check_keywords (BUSQUEDA LINEAL, UNA PASADA POR LISTA) CONTRA IntentEngine (UNA SOLA PASADA AHO-CORASICK)
+# SE EJECUTA CON: python -m benchmarks.bench_intenciones [--sizes 20 200 2000 20000]
+
+MENSAJES = [
+    "Hola, ¿cuánto tengo en mi cuenta?",
+    "Quiero ver mis últimos movimientos por favor",
+    "¿Cuál es la tasa para préstamos personales?",
+    "¿Qué tarjetas ofrecen para viajar al exterior?",
+    "Buenas tardes, necesito hablar con alguien sobre un tema que no tiene nada que ver con el banco",
+]
+
+# FUNCION PARA GENERAR PALABRAS CLAVE SINTETICAS (SE MEZCLAN CON ALGUNAS REALES PARA QUE HAYA COINCIDENCIAS)
+def _palabras_clave(cantidad: int, rng: random.Random) -> list:
+    reales = ["saldo", "movimientos", "préstamo", "tarjeta de crédito", "tasas de interés"]
+    sinteticas = [
+        " ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))) for _ in range(rng.randint(1, 3)))
+        for _ in range(max(cantidad - len(reales), 0))
+    ]
+    return sinteticas + reales
+
+def run(sizes: list, repeat: int):
+    rng = random.Random(42)
+    print(f"{'keywords':>10} {'check_keywords (us/msg)':>25} {'IntentEngine (us/msg)':>23} {'speedup':>9}")
+    for size in sizes:
+        listas = [_palabras_clave(size // 3 or 1, rng) for _ in range(3)]
+        engine = IntentEngine({f"intent_{i}": lista for i, lista in enumerate(listas)})
+
+        def lineal():
+            for mensaje in MENSAJES:
+                for lista in listas:
+                    check_keywords(mensaje, lista)
+
+        def compilado():
+            for mensaje in MENSAJES:
+                engine.intents(mensaje)
+
+        t_lineal = min(timeit.repeat(lineal, number=repeat, repeat=3)) / (repeat * len(MENSAJES)) * 1e6
+        t_compilado = min(timeit.repeat(compilado, number=repeat, repeat=3)) / (repeat * len(MENSAJES)) * 1e6
+        print(f"{size:>10} {t_lineal:>25.2f} {t_compilado:>23.2f} {t_lineal / t_compilado:>8.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara check_keywords con el motor de intenciones compilado.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[45, 450, 4500, 45000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
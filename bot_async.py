@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from telebot.async_telebot import AsyncTeleBot
+
+import arranque
+import autenticacion
+import cache_respuestas
+import interacciones
+import main
+import memoria_conversacion
+import metricas
+import planificador_llm
+import proveedor_llm
+from db import baseDatos, conexiones, extractos, simuladorPrestamos
+
+# MODO ASINCRONO DEL BOT: UN SOLO PROCESO ATIENDE MUCHAS CONVERSACIONES A LA VEZ
+# LAS LLAMADAS A GEMINI NO BLOQUEAN (generate_content_async) Y SE LIMITAN CON UN SEMAFORO
+# EL TRABAJO CON SQLITE SE EJECUTA EN UN POOL DE HILOS PARA NO TRABAR EL EVENT LOOP
+# SE INICIA CON: python bot_async.py
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(conexiones.POOL_SIZE)))
+
+bot = metricas.instrument_bot(AsyncTeleBot(main.TELEGRAM_TOKEN))
+db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+_llm_semaphore = None
+
+# FUNCION PARA EJECUTAR UNA FUNCION DE LA DB EN EL POOL DE HILOS Y ESPERAR SU RESULTADO SIN BLOQUEAR
+async def run_db(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, partial(func, *args))
+
+# EL SEMAFORO SE CREA DENTRO DEL EVENT LOOP QUE LO VA A USAR
+def _get_llm_semaphore() -> asyncio.Semaphore:
+    global _llm_semaphore
+    if _llm_semaphore is None:
+        _llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _llm_semaphore
+
+# FUNCION PARA LLAMAR A GEMINI SIN BLOQUEAR, COMO MAXIMO LLM_MAX_CONCURRENCY LLAMADAS EN VUELO
+async def generate_content(prompt_content: str):
+    async with _get_llm_semaphore():
+        with metricas.timer("bot_llm_request_seconds", mode="async"):
+            return await main.model.generate_content_async(prompt_content)
+
+@bot.message_handler(commands=['start'])
+async def send_welcome(message):
+    logger.info(f"Comando /start recibido de {message.from_user.username} (ID: {message.from_user.id})")
+    interacciones.record(message.from_user.id, "start")
+    await run_db(main.insert_user, message.from_user.id, message.from_user.first_name)
+    await bot.reply_to(message, f'¡Hola {message.from_user.first_name}! Bienvenido a IceCash su banco de confianza\nDime en que puedo ayudarte hoy.')
+
+@bot.message_handler(commands=['help'])
+async def send_help(message):
+    logger.info(f"Comando /help recibido de {message.from_user.username}")
+    interacciones.record(message.from_user.id, "help")
+    await bot.reply_to(message, main.HELP_TEXT)
+
+@bot.message_handler(commands=['setpin'])
+async def set_pin_command(message):
+    interacciones.record(message.from_user.id, "setpin")
+    new_pin_parts = message.text.split(maxsplit=1)
+    if len(new_pin_parts) < 2:
+        await bot.reply_to(message, "Por favor, proporciona un PIN. Ejemplo: `/setpin 1234`")
+        return
+    new_pin = new_pin_parts[1].strip()
+    if not new_pin.isdigit() or len(new_pin) != 4:
+        await bot.reply_to(message, "El PIN debe ser numérico y de 4 dígitos. Ejemplo: `/setpin 1234`")
+        return
+    try:
+        updated = await run_db(main.update_user_pin, message.from_user.id, new_pin)
+    except Exception as e:
+        logger.error(f"Error de BD al configurar PIN para {message.from_user.id}: {e}")
+        await bot.reply_to(message, "Ocurrió un error al intentar configurar tu PIN.")
+        return
+    if updated:
+        await bot.reply_to(message, f"¡Tu PIN ha sido configurado/actualizado a {new_pin}!")
+        logger.info(f"PIN actualizado para usuario {message.from_user.id}")
+    else:
+        await bot.reply_to(message, "No pude actualizar tu PIN. Asegúrate de haber iniciado el bot con /start primero.")
+
+# MISMO FLUJO QUE main.handle_non_command_message (PIN, ACCIONES CON PIN Y GEMINI) PERO SIN BLOQUEAR EL EVENT LOOP
+@bot.message_handler(func=lambda message: message.text is not None and not message.text.startswith('/'))
+async def handle_non_command_message(message):
+    user_input = message.text.strip()
+    telegram_id = message.from_user.id
+    user_info = f"{message.from_user.first_name}"
+    pending = main.pending_pin_sessions
+
+    # PRIMER BLOQUE: EL MENSAJE ES UN PIN PARA UNA ACCION PENDIENTE
+    pending_action = await run_db(pending.pop, telegram_id) if user_input.isdigit() and len(user_input) == 4 else None
+    if pending_action in main.PIN_PROTECTED_ACTIONS:
+        interacciones.record(telegram_id, "pin")
+        lockout_s = autenticacion.lockout_remaining(telegram_id)
+        if lockout_s:
+            metricas.inc("bot_pin_outcomes_total", outcome="bloqueado")
+            await bot.reply_to(message, f"Demasiados intentos fallidos. Por seguridad, intenta de nuevo en {int(lockout_s // 60) + 1} minuto(s).")
+            return
+        try:
+            stored_pin = await run_db(main.get_user_pin, telegram_id)
+            if not stored_pin:
+                metricas.inc("bot_pin_outcomes_total", outcome="sin_pin")
+                await bot.reply_to(message, "Parece que no uso el comando /start para iniciar o no tienes un PIN configurado. Por favor, usa el comando `/setpin TU_PIN_DE_4_DIGITOS` para crear uno.")
+            elif await run_db(main.check_pin, telegram_id, user_input, stored_pin):
+                await bot.send_message(message.chat.id, "PIN correcto. Accediendo a tu información...")
+                db_data_message, reply_markup = await run_db(main.run_protected_action, pending_action, telegram_id)
+                await bot.send_message(message.chat.id, db_data_message or "No pude recuperar la información solicitada en este momento.",
+                                       reply_markup=reply_markup)
+            else:
+                await bot.send_message(message.chat.id, "PIN incorrecto. Por seguridad, no se mostrará la información.")
+        except Exception as e_pin_processing:
+            logger.error(f"Error procesando el PIN ingresado para {user_info}: {e_pin_processing}", exc_info=True)
+            await bot.reply_to(message, "Ocurrió un error al verificar tu PIN. Intenta de nuevo.")
+        return
+
+    # SEGUNDO Y TERCER BLOQUE: ACCIONES QUE REQUIEREN PIN
+    action_after_pin = None
+    intents = main.detect_intents(user_input)
+    interacciones.record(telegram_id, interacciones.intent_label(intents))
+    if "simulacion" in intents or ("prestamo" in intents and simuladorPrestamos.is_simulation_request(user_input)):
+        await bot.reply_to(message, await run_db(main.get_loan_simulation, telegram_id, user_input))
+        return
+    if "saldo" in intents:
+        action_after_pin = "saldo"
+    elif "prestamo" in intents:
+        action_after_pin = "prestamo"
+    if action_after_pin:
+        if autenticacion.is_verified(telegram_id):
+            metricas.inc("bot_pin_outcomes_total", outcome="sesion_verificada")
+            db_data_message, reply_markup = await run_db(main.run_protected_action, action_after_pin, telegram_id)
+            await bot.send_message(message.chat.id, db_data_message or "No pude recuperar la información solicitada en este momento.",
+                                   reply_markup=reply_markup)
+            return
+        try:
+            if await run_db(main.get_user_pin, telegram_id):
+                await bot.send_message(message.chat.id, "Por seguridad, por favor, envía tu PIN de 4 dígitos para continuar.")
+                await run_db(pending.set, telegram_id, action_after_pin)
+                logger.info(f"Usuario {user_info} puesto en espera de PIN para '{action_after_pin}'.")
+            else:
+                await bot.send_message(message.chat.id, "Para esta acción necesitas un PIN. Por favor, configúralo con `/setpin TU_PIN_DE_4_DIGITOS` e intenta de nuevo.")
+        except Exception as e_prepare_pin:
+            logger.error(f"Error preparando para pedir PIN para {user_info}: {e_prepare_pin}", exc_info=True)
+            await bot.reply_to(message, "Hubo un problema al preparar la consulta. Intenta de nuevo.")
+        return
+
+    # CUARTO BLOQUE: CONSULTA GENERAL (CON CACHE) O FALLBACK CON GEMINI
+    is_general_question = "general" in intents
+    if is_general_question:
+        cached_answer = await run_db(cache_respuestas.get_cached_answer, user_input, user_info)
+        if cached_answer:
+            await bot.reply_to(message, cached_answer)
+            await run_db(memoria_conversacion.add_exchange, telegram_id, user_input, cached_answer)
+            return
+    history, history_tokens = await run_db(memoria_conversacion.build_history, telegram_id)
+    prompt_content = main.build_prompt(user_input, user_info, is_general_question, history)
+    memoria_conversacion.record_prompt(prompt_content, history_tokens)
+    try:
+        response = await generate_content(prompt_content)
+        reply_text, is_valid_answer = main.gemini_reply_text(response, user_info, prompt_content)
+        await bot.reply_to(message, reply_text)
+        if is_general_question and is_valid_answer and not history:
+            await run_db(cache_respuestas.store_answer, user_input, user_info, reply_text)
+        if is_valid_answer:
+            await run_db(memoria_conversacion.add_exchange, telegram_id, user_input, reply_text)
+    except planificador_llm.LLMUnavailable as e_unavailable:
+        logger.warning(f"Gemini no disponible para {user_info}, se responde sin IA: {e_unavailable}")
+        await bot.reply_to(message, main.LLM_UNAVAILABLE_MESSAGE)
+    except Exception as e_gemini:
+        metricas.inc("bot_llm_errors_total")
+        logger.error(f"Error CRÍTICO al interactuar con Gemini API para {user_info}: {e_gemini}", exc_info=True)
+        await bot.reply_to(message, main.GEMINI_ERROR_MESSAGE)
+
+# BOTONES DEL EXTRACTO, MISMO FLUJO QUE main.statement_page_callback / main.statement_export_callback
+@bot.callback_query_handler(func=lambda call: call.data and call.data.startswith(extractos.CALLBACK_PAGE_PREFIX))
+async def statement_page_callback(call):
+    telegram_id = call.from_user.id
+    interacciones.record(telegram_id, "extracto_pagina")
+    if not autenticacion.is_verified(telegram_id):
+        await bot.answer_callback_query(call.id, main.STATEMENT_SESSION_EXPIRED, show_alert=True)
+        return
+    try:
+        cursor = extractos.decode_cursor(call.data)
+    except ValueError:
+        logger.warning(f"callback_data de extracto inválido de {telegram_id}: {call.data!r}")
+        await bot.answer_callback_query(call.id, "No pude leer la página pedida.")
+        return
+    text, markup = await run_db(main.get_statement_page, telegram_id, cursor)
+    await bot.answer_callback_query(call.id)
+    await bot.send_message(call.message.chat.id, text, reply_markup=markup)
+
+@bot.callback_query_handler(func=lambda call: call.data == extractos.CALLBACK_EXPORT)
+async def statement_export_callback(call):
+    telegram_id = call.from_user.id
+    interacciones.record(telegram_id, "extracto_csv")
+    if not autenticacion.is_verified(telegram_id):
+        await bot.answer_callback_query(call.id, main.STATEMENT_SESSION_EXPIRED, show_alert=True)
+        return
+    await bot.answer_callback_query(call.id, "Preparando tu extracto...")
+    try:
+        archivo, cantidad, total_bytes = await run_db(main.export_statement, telegram_id)
+    except Exception as e:
+        logger.error(f"Error al exportar el extracto de {telegram_id}: {e}")
+        await bot.send_message(call.message.chat.id, "Hubo un error al generar tu extracto.")
+        return
+    with archivo:
+        if total_bytes > extractos.TELEGRAM_MAX_DOCUMENT_BYTES:
+            await bot.send_message(call.message.chat.id, "Tu extracto es demasiado grande para enviarlo por Telegram. Contacta a soporte para recibirlo.")
+            return
+        await bot.send_document(call.message.chat.id, archivo, caption=f"Extracto completo: {cantidad} movimientos.",
+                                visible_file_name=extractos.export_file_name(telegram_id))
+
+async def run():
+    logger.info(f"Iniciando el bot en modo asíncrono (máx. {LLM_MAX_CONCURRENCY} llamadas a Gemini en paralelo)...")
+    try:
+        await bot.infinity_polling(logger_level=logging.INFO)
+    finally:
+        await bot.close_session()
+        db_executor.shutdown(wait=True)
+        interacciones.stop()
+        conexiones.close_pool()
+        logger.info("El bot asíncrono se ha detenido.")
+
+if __name__ == "__main__":
+    main.check_credentials()
+    baseDatos.setup_database()
+    arranque.marca("migraciones de la base de datos")
+    main.start_background_services()
+    arranque.marca("servicios en segundo plano")
+    if proveedor_llm.GEMINI_WARMUP:
+        main.model.warm_up_in_background()
+    arranque.log_report()
+    asyncio.run(run())
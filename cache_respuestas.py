@@ -0,0 +1,176 @@
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+
+from db import conexiones
+
+logger = logging.getLogger(__name__)
+
+# CACHE DE RESPUESTAS DE GEMINI PARA LAS CONSULTAS GENERALES (TARJETAS, PLAZO FIJO, TASAS)
+# LA CLAVE ES LA PREGUNTA NORMALIZADA, ASI DOS USUARIOS QUE PREGUNTAN LO MISMO COMPARTEN LA RESPUESTA
+
+FAQ_CACHE_MAX_ENTRIES = int(os.getenv("FAQ_CACHE_MAX_ENTRIES", "1000"))
+FAQ_CACHE_TTL_S = float(os.getenv("FAQ_CACHE_TTL_S", str(6 * 3600)))
+FAQ_CACHE_PERSIST = os.getenv("FAQ_CACHE_PERSIST", "0") == "1"
+
+# MARCA QUE REEMPLAZA EL NOMBRE DEL USUARIO DENTRO DE LA RESPUESTA GUARDADA
+NOMBRE_PLACEHOLDER = "\x00NOMBRE\x00"
+NOMBRE_MIN_CHARS = 3
+
+# CACHE EN MEMORIA CON EXPULSION LRU (TAMAÑO MAXIMO) Y TTL (EDAD MAXIMA), SEGURA ENTRE HILOS
+class LRUTTLCache:
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl_s: float = None):
+        expires_at = time.monotonic() + (self.ttl_s if ttl_s is None else ttl_s)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key) -> bool:
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    # TAMAÑO APROXIMADO EN MEMORIA DE CLAVES Y VALORES GUARDADOS (EN BYTES)
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sys.getsizeof(self._data) + sum(
+                sys.getsizeof(key) + _peso_aprox(value) for key, (_, value) in self._data.items()
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+# LOS VALORES QUE SON COLECCIONES (POR EJ. UN BUFFER DE MENSAJES) SE MIDEN CON SU CONTENIDO
+def _peso_aprox(value) -> int:
+    if isinstance(value, (list, tuple, deque)):
+        return sys.getsizeof(value) + sum(_peso_aprox(item) for item in value)
+    return sys.getsizeof(value)
+
+_cache = LRUTTLCache(FAQ_CACHE_MAX_ENTRIES, FAQ_CACHE_TTL_S)
+_persistent_hits = 0
+
+# FUNCION PARA NORMALIZAR LA PREGUNTA: MINUSCULAS, SIN TILDES, SIN SIGNOS, SIN EL NOMBRE DEL USUARIO Y ESPACIOS COLAPSADOS
+def normalize_question(text: str, user_name: str = "") -> str:
+    texto = _sin_tildes(text.lower())
+    if user_name:
+        nombre = _sin_tildes(user_name.lower()).strip()
+        if nombre:
+            texto = re.sub(rf"\b{re.escape(nombre)}\b", " ", texto)
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return " ".join(texto.split())
+
+def _sin_tildes(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+# FUNCION PARA BUSCAR UNA RESPUESTA YA GENERADA, PRIMERO EN MEMORIA Y LUEGO (SI ESTA ACTIVADO) EN SQLITE
+def get_cached_answer(user_input: str, user_name: str):
+    global _persistent_hits
+    clave = normalize_question(user_input, user_name)
+    if not clave:
+        return None
+    respuesta = _cache.get(clave)
+    if respuesta is None and FAQ_CACHE_PERSIST:
+        respuesta, restante = _leer_persistente(clave)
+        if respuesta is not None:
+            _persistent_hits += 1
+            _cache.put(clave, respuesta, ttl_s=restante)
+    if respuesta is None:
+        return None
+    return respuesta.replace(NOMBRE_PLACEHOLDER, user_name)
+
+# FUNCION PARA GUARDAR UNA RESPUESTA VALIDA DE GEMINI, EL NOMBRE DEL USUARIO SE GUARDA COMO MARCA
+def store_answer(user_input: str, user_name: str, answer: str):
+    clave = normalize_question(user_input, user_name)
+    if not clave or not answer:
+        return
+    if user_name and user_name.strip():
+        nombre = user_name.strip()
+        # UN NOMBRE MUY CORTO ("Al", "Bo") PUEDE SER PARTE DEL TEXTO GENERAL, ESA RESPUESTA NO SE COMPARTE
+        if len(nombre) < NOMBRE_MIN_CHARS:
+            return
+        # SOLO LA PALABRA COMPLETA: "Ana" NO TOCA "Anabel" NI "mañana"
+        answer = re.sub(rf"(?<!\w){re.escape(nombre)}(?!\w)", NOMBRE_PLACEHOLDER, answer)
+    _cache.put(clave, answer)
+    if FAQ_CACHE_PERSIST:
+        _guardar_persistente(clave, answer)
+
+def _leer_persistente(clave: str):
+    try:
+        with conexiones.get_connection() as conn:
+            row = conn.execute("SELECT respuesta, expira FROM cache_respuestas WHERE clave = ?", (clave,)).fetchone()
+            if row and row[1] <= time.time():
+                conn.execute("DELETE FROM cache_respuestas WHERE clave = ?", (clave,))
+                conn.commit()
+                return None, 0
+    except sqlite3.Error as e:
+        logger.error(f"Error al leer la cache persistente de respuestas: {e}")
+        return None, 0
+    if not row:
+        return None, 0
+    return row[0], row[1] - time.time()
+
+def _guardar_persistente(clave: str, answer: str):
+    try:
+        with conexiones.get_connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO cache_respuestas (clave, respuesta, expira) VALUES (?, ?, ?)",
+                         (clave, answer, time.time() + FAQ_CACHE_TTL_S))
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Error al guardar en la cache persistente de respuestas: {e}")
+
+# FUNCION PARA CONSULTAR LOS CONTADORES DE LA CACHE (ACIERTOS, FALLOS, EXPULSIONES)
+def cache_stats() -> dict:
+    stats = _cache.stats()
+    stats["persistent_hits"] = _persistent_hits
+    stats["persist"] = FAQ_CACHE_PERSIST
+    return stats
@@ -0,0 +1,42 @@
+import os
+
+from cache_respuestas import LRUTTLCache
+
+# CACHE POR USUARIO DE LOS RESUMENES YA FORMATEADOS DE CUENTAS/MOVIMIENTOS Y PRESTAMOS
+# UNA CONSULTA REPETIDA DE SALDO NO TOCA LA DB NI VUELVE A FORMATEAR LAS FECHAS
+# CUALQUIER CODIGO QUE ESCRIBA EN cuentas, hmovimientos O prestamos DEBE LLAMAR A invalidate_user
+
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "5000"))
+USER_CACHE_TTL_S = float(os.getenv("USER_CACHE_TTL_S", "300"))
+
+RESUMEN_CUENTAS = "cuentas"
+RESUMEN_PRESTAMOS = "prestamos"
+
+# QUE RESUMEN QUEDA DESACTUALIZADO AL ESCRIBIR EN CADA TABLA
+_RESUMENES_POR_TABLA = {
+    "cuentas": (RESUMEN_CUENTAS,),
+    "hmovimientos": (RESUMEN_CUENTAS,),
+    "prestamos": (RESUMEN_PRESTAMOS,),
+}
+
+_cache = LRUTTLCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_S)
+
+def get_summary(kind: str, telegram_id: int):
+    return _cache.get((kind, telegram_id))
+
+def store_summary(kind: str, telegram_id: int, summary: str):
+    _cache.put((kind, telegram_id), summary)
+
+# FUNCION PARA INVALIDAR LOS RESUMENES DE UN USUARIO, SIN TABLAS SE INVALIDA TODO LO DEL USUARIO
+def invalidate_user(telegram_id: int, *tables: str):
+    kinds = set()
+    for table in tables or _RESUMENES_POR_TABLA:
+        kinds.update(_RESUMENES_POR_TABLA[table])
+    for kind in kinds:
+        _cache.invalidate((kind, telegram_id))
+
+# FUNCION PARA CONSULTAR LAS METRICAS DE LA CACHE (TASA DE ACIERTOS Y MEMORIA APROXIMADA)
+def cache_stats() -> dict:
+    stats = _cache.stats()
+    stats["memory_bytes"] = _cache.memory_bytes()
+    return stats
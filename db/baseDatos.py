@@ -1,78 +1,36 @@
 import sqlite3
 import logging
+import sys
+
+from db import libroMayor, migraciones
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 DB_NAME = 'datos_del_usuario.db'
 
-def setup_database_and_insert_examples():
-    conn = None  
+# FUNCION PARA DEJAR EL ESQUEMA AL DIA SIN BORRAR DATOS, SE EJECUTA EN CADA ARRANQUE DEL BOT
+def setup_database():
+    conn = None
     try:
         conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
         logger.info(f"Conectado a la base de datos '{DB_NAME}'.")
+        migraciones.migrate(conn)
+    except sqlite3.Error as e:
+        logger.error(f"Error de SQLite al migrar el esquema: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
 
-        # --- Eliminar tablas si existen (para poder re-ejecutar el script) ---
-        logger.info("Eliminando tablas existentes (si las hay)...")
-        cursor.execute("DROP TABLE IF EXISTS hmovimientos")
-        cursor.execute("DROP TABLE IF EXISTS prestamos")
-        cursor.execute("DROP TABLE IF EXISTS cuentas")
-        cursor.execute("DROP TABLE IF EXISTS users")
-        logger.info("Tablas anteriores eliminadas.")
-
-        # --- Crear Tabla users ---
-        cursor.execute('''
-            CREATE TABLE users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_id INTEGER UNIQUE NOT NULL,
-                name TEXT,
-                pin TEXT DEFAULT NULL  -- Nueva columna para el PIN (ej. '1234')
-            )
-        ''')
-        logger.info("Tabla 'users' creada.")
-        
-        # --- Crear Tabla cuentas ---
-        cursor.execute('''
-            CREATE TABLE cuentas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                dinero REAL NOT NULL DEFAULT 0,
-                currency TEXT,
-                FOREIGN KEY (telegram_id) REFERENCES users (telegram_id)
-            )
-        ''')
-        logger.info("Tabla 'cuentas' creada.")
-
-        # --- Crear Tabla hmovimientos ---
-        cursor.execute('''
-            CREATE TABLE hmovimientos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_id INTEGER NOT NULL,
-                account_id INTEGER NOT NULL,
-                name TEXT NOT NULL, 
-                dinero REAL NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (telegram_id) REFERENCES users (telegram_id),
-                FOREIGN KEY (account_id) REFERENCES cuentas (id)
-            )
-        ''')
-        logger.info("Tabla 'hmovimientos' creada.")
-
-        # --- Crear Tabla prestamos ---
-        cursor.execute('''
-            CREATE TABLE prestamos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                dinero REAL NOT NULL,
-                dineroEntregado REAL DEFAULT 0,
-                due_date DATE,
-                FOREIGN KEY (telegram_id) REFERENCES users (telegram_id)
-            )
-        ''')
-        logger.info("Tabla 'prestamos' creada.")
+# FUNCION PARA INSERTAR LOS DATOS DE EJEMPLO, ES OPCIONAL Y SOLO SE EJECUTA CON: python -m db.baseDatos --seed
+# NO BORRA NADA, SI EL USUARIO DE PRUEBA YA TIENE CUENTAS NO VUELVE A INSERTAR
+def insert_examples():
+    conn = None
+    try:
+        conn = sqlite3.connect(DB_NAME)
+        migraciones.migrate(conn)
+        cursor = conn.cursor()
 
         # --- Insertar datos de ejemplo ---
         logger.info("Insertando datos de ejemplo...")
@@ -80,28 +38,36 @@ def setup_database_and_insert_examples():
         user_name_prueba = "Agustin" 
 
         # 1. Insertar usuario de prueba
-        cursor.execute("INSERT INTO users (telegram_id, name, pin) VALUES (?, ?, ?)",
+        cursor.execute("INSERT OR IGNORE INTO users (telegram_id, name, pin) VALUES (?, ?, ?)",
                     (TU_TELEGRAM_ID_DE_PRUEBA, user_name_prueba, "1234")) 
+
+        cursor.execute("SELECT 1 FROM cuentas WHERE telegram_id = ? LIMIT 1", (TU_TELEGRAM_ID_DE_PRUEBA,))
+        if cursor.fetchone():
+            conn.commit()
+            logger.info("El usuario de prueba ya tiene datos de ejemplo, no se insertan de nuevo.")
+            return
         
         # 2. Insertar cuentas para el usuario de prueba
-        cursor.execute("INSERT INTO cuentas (telegram_id, name, dinero, currency) VALUES (?, ?, ?, ?)",
-                    (TU_TELEGRAM_ID_DE_PRUEBA, "Ahorro Pesos IceCash", 17000, "UYU"))
+        cursor.execute("INSERT INTO cuentas (telegram_id, name, dinero, currency, saldo_centavos) VALUES (?, ?, ?, ?, ?)",
+                    (TU_TELEGRAM_ID_DE_PRUEBA, "Ahorro Pesos IceCash", 17000, "UYU", 1700000))
         cuenta_pesos_id = cursor.lastrowid # Obtenemos el ID de la cuenta recién insertada
 
         # Cuenta en Dólares
-        cursor.execute("INSERT INTO cuentas (telegram_id, name, dinero, currency) VALUES (?, ?, ?, ?)",
-                    (TU_TELEGRAM_ID_DE_PRUEBA, "Corriente Dólares IceCash", 550.75, "USD"))
+        cursor.execute("INSERT INTO cuentas (telegram_id, name, dinero, currency, saldo_centavos) VALUES (?, ?, ?, ?, ?)",
+                    (TU_TELEGRAM_ID_DE_PRUEBA, "Corriente Dólares IceCash", 550.75, "USD", 55075))
         cuenta_dolares_id = cursor.lastrowid
 
         # 3. Insertar movimientos para la cuenta en pesos (usando cuenta_pesos_id)
         movimientos_data = [
-            (TU_TELEGRAM_ID_DE_PRUEBA, cuenta_pesos_id, "Compra Supermercado", -1250.50),
-            (TU_TELEGRAM_ID_DE_PRUEBA, cuenta_pesos_id, "Pago Factura Luz", -850.00),
-            (TU_TELEGRAM_ID_DE_PRUEBA, cuenta_pesos_id, "Depósito Nómina", 25000.00),
-            (TU_TELEGRAM_ID_DE_PRUEBA, cuenta_pesos_id, "Retiro Cajero", -2000.00),
+            (TU_TELEGRAM_ID_DE_PRUEBA, cuenta_pesos_id, "Compra Supermercado", -1250.50, -125050),
+            (TU_TELEGRAM_ID_DE_PRUEBA, cuenta_pesos_id, "Pago Factura Luz", -850.00, -85000),
+            (TU_TELEGRAM_ID_DE_PRUEBA, cuenta_pesos_id, "Depósito Nómina", 25000.00, 2500000),
+            (TU_TELEGRAM_ID_DE_PRUEBA, cuenta_pesos_id, "Retiro Cajero", -2000.00, -200000),
         ]
-        cursor.executemany("INSERT INTO hmovimientos (telegram_id, account_id, name, dinero) VALUES (?, ?, ?, ?)",
+        cursor.executemany("INSERT INTO hmovimientos (telegram_id, account_id, name, dinero, monto_centavos) VALUES (?, ?, ?, ?, ?)",
                         movimientos_data)
+        # LOS SALDOS DE EJEMPLO NO SALEN DE ESTOS MOVIMIENTOS, LA DIFERENCIA QUEDA COMO SALDO INICIAL (VER db/libroMayor.py)
+        libroMayor.rebase_opening_balances(conn, cuenta_pesos_id)
 
         # 4. Insertar préstamos para el usuario de prueba
         prestamos_data = [
@@ -130,6 +96,8 @@ def setup_database_and_insert_examples():
 
 if __name__ == "__main__":
     logger.info("Iniciando script de configuración de base de datos...")
-    setup_database_and_insert_examples()
+    setup_database()
+    if "--seed" in sys.argv[1:]:
+        insert_examples()
+        logger.info(f"RECUERDA: Si no lo has hecho, cambia 'TU_TELEGRAM_ID_DE_PRUEBA' en el script por tu ID real.")
     logger.info(f"Script finalizado. La base de datos '{DB_NAME}' debería estar configurada.")
-    logger.info(f"RECUERDA: Si no lo has hecho, cambia 'TU_TELEGRAM_ID_DE_PRUEBA' en el script por tu ID real.")
\ No newline at end of file
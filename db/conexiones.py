@@ -0,0 +1,147 @@
+import sqlite3
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import metricas
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = 'datos_del_usuario.db'
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+CHECKOUT_TIMEOUT = float(os.getenv("DB_CHECKOUT_TIMEOUT", "10"))
+STATEMENT_CACHE_SIZE = 128
+
+# ESTADO DEL POOL: UNA COLA CON LAS CONEXIONES LIBRES Y LAS METRICAS DE USO
+_pool = None
+_pool_db_name = None
+_pool_lock = threading.Lock()
+_trace_callback = None
+_stats_lock = threading.Lock()
+_stats = {
+    "checkouts": 0,
+    "timeouts": 0,
+    "wait_total_s": 0.0,
+    "wait_max_s": 0.0,
+    "hold_total_s": 0.0,
+    "hold_max_s": 0.0,
+    "in_use": 0,
+}
+
+# FUNCION PARA CREAR UNA CONEXION YA CONFIGURADA (WAL, SYNCHRONOUS=NORMAL, BUSY TIMEOUT Y CACHE DE SENTENCIAS)
+# SE EJECUTA UNA SOLA VEZ POR CONEXION, LUEGO LA CONEXION SE REUTILIZA DURANTE TODA LA VIDA DEL PROCESO
+def _crear_conexion(db_name: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        db_name,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.set_trace_callback(_trace)
+    return conn
+
+# CADA SENTENCIA EJECUTADA SE CUENTA POR TIPO (SELECT, INSERT, ...) Y SE REENVIA AL CALLBACK REGISTRADO, SI LO HAY
+def _trace(sql: str):
+    metricas.inc("bot_db_queries_total", type=sql.lstrip()[:6].upper())
+    callback = _trace_callback
+    if callback is not None:
+        callback(sql)
+
+# FUNCION PARA INICIALIZAR EL POOL, SI YA EXISTE UNO SE CIERRA Y SE REEMPLAZA
+def init_pool(db_name: str = DB_NAME, size: int = POOL_SIZE):
+    global _pool, _pool_db_name
+    with _pool_lock:
+        if _pool is not None:
+            _cerrar_conexiones(_pool)
+        nuevo_pool = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            nuevo_pool.put(_crear_conexion(db_name))
+        _pool = nuevo_pool
+        _pool_db_name = db_name
+    logger.info(f"Pool de conexiones inicializado para '{db_name}' con {size} conexiones (WAL).")
+
+def _get_pool() -> queue.LifoQueue:
+    if _pool is None:
+        init_pool()
+    return _pool
+
+def _cerrar_conexiones(pool: queue.LifoQueue):
+    while True:
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            break
+        conn.close()
+
+# FUNCION PARA CERRAR TODAS LAS CONEXIONES LIBRES DEL POOL (AL APAGAR EL BOT)
+def close_pool():
+    global _pool, _pool_db_name
+    with _pool_lock:
+        if _pool is not None:
+            _cerrar_conexiones(_pool)
+        _pool = None
+        _pool_db_name = None
+    logger.info("Pool de conexiones cerrado.")
+
+# CONTEXT MANAGER PARA TOMAR PRESTADA UNA CONEXION DEL POOL Y DEVOLVERLA AL TERMINAR
+# SI QUEDO UNA TRANSACCION ABIERTA SIN COMMIT SE HACE ROLLBACK ANTES DE DEVOLVERLA
+@contextmanager
+def get_connection():
+    pool = _get_pool()
+    inicio_espera = time.perf_counter()
+    try:
+        conn = pool.get(timeout=CHECKOUT_TIMEOUT)
+    except queue.Empty:
+        with _stats_lock:
+            _stats["timeouts"] += 1
+        raise sqlite3.OperationalError(f"No hay conexiones libres en el pool tras {CHECKOUT_TIMEOUT}s.")
+    espera = time.perf_counter() - inicio_espera
+    with _stats_lock:
+        _stats["checkouts"] += 1
+        _stats["in_use"] += 1
+        _stats["wait_total_s"] += espera
+        _stats["wait_max_s"] = max(_stats["wait_max_s"], espera)
+    metricas.observe("bot_db_checkout_wait_seconds", espera)
+    inicio_uso = time.perf_counter()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        uso = time.perf_counter() - inicio_uso
+        with _stats_lock:
+            _stats["in_use"] -= 1
+            _stats["hold_total_s"] += uso
+            _stats["hold_max_s"] = max(_stats["hold_max_s"], uso)
+        metricas.observe("bot_db_connection_hold_seconds", uso)
+        pool.put(conn)
+
+# FUNCION PARA REGISTRAR UN CALLBACK QUE RECIBE CADA SENTENCIA SQL EJECUTADA (NONE PARA QUITARLO)
+# SE APLICA A TODAS LAS CONEXIONES DEL POOL, PENSADO PARA BENCHMARKS Y DIAGNOSTICO
+def set_trace_callback(callback):
+    global _trace_callback
+    _trace_callback = callback
+
+# FUNCION PARA CONSULTAR LAS METRICAS DEL POOL (CANTIDAD DE PRESTAMOS, TIEMPOS DE ESPERA Y DE USO)
+def pool_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    checkouts = stats["checkouts"]
+    stats["wait_avg_s"] = stats["wait_total_s"] / checkouts if checkouts else 0.0
+    stats["hold_avg_s"] = stats["hold_total_s"] / checkouts if checkouts else 0.0
+    stats["available"] = _pool.qsize() if _pool is not None else 0
+    stats["db_name"] = _pool_db_name
+    return stats
+
+def reset_pool_stats():
+    with _stats_lock:
+        for key in _stats:
+            if key != "in_use":
+                _stats[key] = 0 if isinstance(_stats[key], int) else 0.0
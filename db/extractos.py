@@ -0,0 +1,137 @@
+import csv
+import io
+import sqlite3
+import tempfile
+from datetime import datetime
+
+# EXTRACTO DE MOVIMIENTOS: PAGINAS CON CURSOR (KEYSET) SOBRE (timestamp, id) Y EXPORTACION COMPLETA A CSV
+# CADA PAGINA ARRANCA JUSTO DESPUES DEL ULTIMO MOVIMIENTO DE LA ANTERIOR, SIN OFFSET, ASI LA PAGINA 1000 CUESTA LO MISMO QUE LA 1
+# EL CURSOR VIAJA EN EL callback_data DEL BOTON "VER MAS" (MAXIMO 64 BYTES), NO SE GUARDA NADA EN MEMORIA ENTRE PAGINAS
+
+PAGE_SIZE = 10
+EXPORT_FETCH_SIZE = 1000
+# EL CSV SE ARMA EN MEMORIA HASTA ESTE TAMAÑO, SI LO SUPERA PASA A UN ARCHIVO TEMPORAL EN DISCO
+EXPORT_SPOOL_BYTES = 1024 * 1024
+# LIMITE DE TELEGRAM PARA DOCUMENTOS ENVIADOS POR UN BOT
+TELEGRAM_MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+
+CALLBACK_PAGE_PREFIX = "mov:"
+CALLBACK_EXPORT = "mov_export"
+CSV_HEADER = ["fecha", "cuenta", "moneda", "descripcion", "monto"]
+
+# LAS CONSULTAS USAN EL INDICE idx_hmovimientos_telegram_ts_id (telegram_id, timestamp DESC, id DESC, ...), EL ORDEN YA VIENE DADO
+_SQL_PAGE_FIRST = '''
+    SELECT h.id, h.timestamp, c.name, c.currency, h.name, h.dinero
+    FROM hmovimientos h
+    JOIN cuentas c ON h.account_id = c.id
+    WHERE h.telegram_id = ?
+    ORDER BY h.timestamp DESC, h.id DESC LIMIT ?
+'''
+_SQL_PAGE_AFTER = '''
+    SELECT h.id, h.timestamp, c.name, c.currency, h.name, h.dinero
+    FROM hmovimientos h
+    JOIN cuentas c ON h.account_id = c.id
+    WHERE h.telegram_id = ? AND (h.timestamp, h.id) < (?, ?)
+    ORDER BY h.timestamp DESC, h.id DESC LIMIT ?
+'''
+# LOS MOVIMIENTOS SIN FECHA QUEDAN AL FINAL DEL ORDEN DESCENDENTE Y LA COMPARACION DE TUPLAS NO LOS INCLUYE, SE SIGUEN POR id
+_SQL_PAGE_NULLS = '''
+    SELECT h.id, h.timestamp, c.name, c.currency, h.name, h.dinero
+    FROM hmovimientos h
+    JOIN cuentas c ON h.account_id = c.id
+    WHERE h.telegram_id = ? AND h.timestamp IS NULL AND h.id < ?
+    ORDER BY h.id DESC LIMIT ?
+'''
+_MAX_ID = 2 ** 63 - 1
+
+# FUNCIONES PARA CODIFICAR EL CURSOR (timestamp, id) DEL ULTIMO MOVIMIENTO MOSTRADO EN EL callback_data DEL BOTON
+# UN MOVIMIENTO SIN FECHA SE CODIFICA CON EL timestamp VACIO ("mov:|42")
+def encode_cursor(timestamp: str, movement_id: int) -> str:
+    return f"{CALLBACK_PAGE_PREFIX}{timestamp or ''}|{movement_id}"
+
+# DEVUELVE NONE PARA LA PRIMERA PAGINA ("mov:") Y LANZA ValueError SI EL callback_data NO ES VALIDO
+def decode_cursor(callback_data: str):
+    valor = callback_data[len(CALLBACK_PAGE_PREFIX):]
+    if not valor:
+        return None
+    timestamp, movement_id = valor.rsplit("|", 1)
+    if not timestamp:
+        return None, int(movement_id)
+    datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+    return timestamp, int(movement_id)
+
+# FUNCION PARA LEER UNA PAGINA DE MOVIMIENTOS, DEVUELVE (FILAS, CURSOR DE LA SIGUIENTE PAGINA O NONE SI NO HAY MAS)
+# SE PIDE UNA FILA DE MAS PARA SABER SI HAY SIGUIENTE PAGINA SIN HACER UN COUNT
+def fetch_page(conn: sqlite3.Connection, telegram_id: int, cursor=None, page_size: int = PAGE_SIZE) -> tuple:
+    limite = page_size + 1
+    if cursor is None:
+        filas = conn.execute(_SQL_PAGE_FIRST, (telegram_id, limite)).fetchall()
+    else:
+        timestamp, movement_id = cursor
+        filas = conn.execute(_SQL_PAGE_AFTER, (telegram_id, timestamp, movement_id, limite)).fetchall() if timestamp is not None else []
+        if len(filas) < limite:
+            desde_id = movement_id if timestamp is None else _MAX_ID
+            filas += conn.execute(_SQL_PAGE_NULLS, (telegram_id, desde_id, limite - len(filas))).fetchall()
+    if len(filas) <= page_size:
+        return filas, None
+    filas = filas[:page_size]
+    return filas, (filas[-1][1], filas[-1][0])
+
+def _formatear_fecha(timestamp: str) -> str:
+    return datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y %H:%M') if timestamp else ""
+
+# FUNCION PARA ARMAR EL TEXTO DE UNA PAGINA DEL EXTRACTO
+def format_page(filas: list, first_page: bool) -> str:
+    if not filas:
+        return "No tienes movimientos registrados." if first_page else "No hay más movimientos."
+    lineas = ["Tus movimientos:" if first_page else "Más movimientos:"]
+    for _, timestamp, cuenta, moneda, descripcion, monto in filas:
+        lineas.append(f"- {_formatear_fecha(timestamp)} [{cuenta}] {descripcion}: ${monto:.2f} {moneda or ''}".rstrip())
+    return "\n".join(lineas)
+
+# GENERADOR QUE RECORRE TODOS LOS MOVIMIENTOS DEL USUARIO DE A EXPORT_FETCH_SIZE FILAS SOBRE UN MISMO CURSOR
+# NUNCA HAY MAS DE UN BLOQUE EN MEMORIA, SIN IMPORTAR CUANTOS MOVIMIENTOS TENGA EL USUARIO
+def iter_movements(conn: sqlite3.Connection, telegram_id: int, fetch_size: int = EXPORT_FETCH_SIZE):
+    cursor = conn.execute(_SQL_PAGE_FIRST, (telegram_id, -1))
+    try:
+        while True:
+            filas = cursor.fetchmany(fetch_size)
+            if not filas:
+                return
+            yield from filas
+    finally:
+        cursor.close()
+
+# GENERADOR DE LINEAS CSV: CADA FILA SE CONVIERTE A TEXTO APENAS SE LEE DE LA DB
+def iter_csv_lines(filas):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for fila in _filas_csv(filas):
+        writer.writerow(fila)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+def _filas_csv(filas):
+    yield CSV_HEADER
+    for _, timestamp, cuenta, moneda, descripcion, monto in filas:
+        yield [timestamp or "", cuenta, moneda or "", descripcion, f"{monto:.2f}"]
+
+# FUNCION PARA ESCRIBIR EL EXTRACTO COMPLETO EN UN ARCHIVO TEMPORAL (EN MEMORIA SI ES CHICO, EN DISCO SI ES GRANDE)
+# DEVUELVE (ARCHIVO POSICIONADO AL INICIO, CANTIDAD DE MOVIMIENTOS, TAMAÑO EN BYTES), EL LLAMADOR DEBE CERRARLO
+def export_csv(conn: sqlite3.Connection, telegram_id: int) -> tuple:
+    archivo = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES, mode="w+b")
+    lineas = 0
+    try:
+        for linea in iter_csv_lines(iter_movements(conn, telegram_id)):
+            archivo.write(linea.encode("utf-8"))
+            lineas += 1
+    except Exception:
+        archivo.close()
+        raise
+    total_bytes = archivo.tell()
+    archivo.seek(0)
+    return archivo, lineas - 1, total_bytes
+
+def export_file_name(telegram_id: int) -> str:
+    return f"extracto_{telegram_id}_{datetime.now().strftime('%Y%m%d')}.csv"
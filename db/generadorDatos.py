@@ -0,0 +1,238 @@
+import argparse
+import itertools
+import logging
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import autenticacion
+from db import conexiones, libroMayor, migraciones
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# GENERADOR DE DATOS SINTETICOS A ESCALA DE PRODUCCION PARA BENCHMARKS (USUARIOS, CUENTAS, MOVIMIENTOS Y PRESTAMOS)
+# LAS FILAS SALEN DE GENERADORES Y SE INSERTAN EN LOTES CON executemany, ASI LA MEMORIA QUEDA CONSTANTE SIN IMPORTAR EL VOLUMEN
+# LA MISMA SEMILLA PRODUCE SIEMPRE EL MISMO DATASET
+# SE EJECUTA CON: python -m db.generadorDatos --db datos_benchmark.db --users 100000 --movements 20000000
+# NUNCA APUNTAR --db A LA BASE REAL DEL BOT: DURANTE LA CARGA SE DESACTIVA EL JOURNAL
+
+DB_POR_DEFECTO = 'datos_benchmark.db'
+PIN_SINTETICO = "1234"
+PRIMER_TELEGRAM_ID = 10_000_000
+BATCH_SIZE = 50_000
+FILAS_POR_TRANSACCION = 1_000_000
+
+TIPOS_DE_CUENTA = [
+    ("Ahorro Pesos IceCash", "UYU", 0, 150_000),
+    ("Corriente Dólares IceCash", "USD", 0, 8_000),
+    ("Caja de Ahorro Euros IceCash", "EUR", 0, 5_000),
+    ("Cuenta Sueldo IceCash", "UYU", 0, 80_000),
+]
+
+# CATALOGO DE MOVIMIENTOS (NOMBRE, PESO, MONTO MINIMO, MONTO MAXIMO), LOS GASTOS CHICOS SON LOS MAS FRECUENTES
+MOVIMIENTOS = [
+    ("Compra Supermercado", 30, -4_500, -150),
+    ("Compra con Débito", 25, -2_500, -50),
+    ("Pago Factura Luz", 4, -3_000, -600),
+    ("Pago Factura Agua", 3, -1_500, -300),
+    ("Pago Internet", 3, -2_000, -900),
+    ("Retiro Cajero", 10, -6_000, -500),
+    ("Transferencia Enviada", 8, -20_000, -200),
+    ("Transferencia Recibida", 8, 200, 20_000),
+    ("Depósito Nómina", 5, 25_000, 120_000),
+    ("Devolución Compra", 2, 100, 3_000),
+    ("Débito Automático Tarjeta", 2, -15_000, -1_000),
+]
+_NOMBRES_MOVIMIENTO = [m[0] for m in MOVIMIENTOS]
+_PESOS_MOVIMIENTO = list(itertools.accumulate(m[1] for m in MOVIMIENTOS))
+_RANGOS_MOVIMIENTO = {m[0]: (m[2], m[3]) for m in MOVIMIENTOS}
+
+# DISTRIBUCION DE LA HORA DEL DIA: CASI NADA DE MADRUGADA, PICOS AL MEDIODIA Y A LA TARDE
+_PESOS_HORA = list(itertools.accumulate([1, 1, 1, 1, 1, 2, 4, 7, 10, 12, 13, 14, 15, 13, 12, 12, 13, 14, 14, 12, 10, 8, 5, 2]))
+
+NOMBRES = ["Agustin", "Lucía", "Martín", "Sofía", "Juan", "Valentina", "Diego", "Camila", "Mateo", "Florencia",
+           "Santiago", "Micaela", "Nicolás", "Carolina", "Federico", "Romina", "Gonzalo", "Paula", "Bruno", "Julieta"]
+
+# PRAGMAS PARA CARGA MASIVA: SIN JOURNAL NI FSYNC, CACHE GRANDE Y BLOQUEO EXCLUSIVO (SOLO PARA UNA DB DESCARTABLE)
+PRAGMAS_CARGA = [
+    "PRAGMA journal_mode=OFF",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA cache_size=-262144",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA locking_mode=EXCLUSIVE",
+]
+# AL TERMINAR SE DEJA LA DB CON LA MISMA CONFIGURACION QUE USA EL POOL DEL BOT
+PRAGMAS_FINALES = [
+    "PRAGMA locking_mode=NORMAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA journal_mode=WAL",
+]
+
+# INDICES QUE SE BORRAN DURANTE LA CARGA Y SE RECREAN AL FINAL (CONSTRUIRLOS UNA VEZ ES MUCHO MAS RAPIDO QUE MANTENERLOS)
+INDICES_DIFERIDOS = {
+    "idx_hmovimientos_telegram_ts_id": "CREATE INDEX IF NOT EXISTS idx_hmovimientos_telegram_ts_id ON hmovimientos (telegram_id, timestamp DESC, id DESC, account_id, name, dinero)",
+    "idx_cuentas_telegram": "CREATE INDEX IF NOT EXISTS idx_cuentas_telegram ON cuentas (telegram_id, name, dinero, currency)",
+    "idx_prestamos_telegram": "CREATE INDEX IF NOT EXISTS idx_prestamos_telegram ON prestamos (telegram_id)",
+    "idx_hmovimientos_cuenta_ts": "CREATE INDEX IF NOT EXISTS idx_hmovimientos_cuenta_ts ON hmovimientos (account_id, timestamp, monto_centavos)",
+}
+
+# FUNCION PARA AGRUPAR CUALQUIER GENERADOR EN LISTAS DE batch_size FILAS
+def en_lotes(filas, batch_size: int = BATCH_SIZE):
+    iterador = iter(filas)
+    while True:
+        lote = list(itertools.islice(iterador, batch_size))
+        if not lote:
+            return
+        yield lote
+
+# FUNCION PARA ELEGIR LA CANTIDAD DE MOVIMIENTOS DE UNA CUENTA: LA MAYORIA TIENE POCOS Y UNAS POCAS TIENEN MUCHOS (PARETO)
+# PARETO CON alpha=2 TIENE MEDIA 2, ASI EL TOTAL GENERADO QUEDA CERCA DE promedio * CANTIDAD DE CUENTAS
+def _cantidad_movimientos(rng: random.Random, promedio: float) -> int:
+    return int(promedio * rng.paretovariate(2.0) / 2.0)
+
+# FUNCION PARA GENERAR UN TIMESTAMP: LA ACTIVIDAD CRECE HACIA EL PRESENTE (EXPONENCIAL) Y SIGUE LA CURVA HORARIA
+def _timestamp(rng: random.Random, fin: datetime, dias: int) -> str:
+    dias_atras = min(int(rng.expovariate(3.0 / dias)), dias - 1)
+    hora = rng.choices(range(24), cum_weights=_PESOS_HORA)[0]
+    momento = fin - timedelta(days=dias_atras)
+    momento = momento.replace(hour=hora, minute=rng.randrange(60), second=rng.randrange(60))
+    return momento.strftime('%Y-%m-%d %H:%M:%S')
+
+def generar_usuarios(telegram_ids, rng: random.Random, pin_hash: str):
+    for telegram_id in telegram_ids:
+        yield telegram_id, f"{rng.choice(NOMBRES)} {telegram_id}", pin_hash
+
+# CADA CUENTA TIENE UN id EXPLICITO PARA QUE LOS MOVIMIENTOS LA REFERENCIEN SIN VOLVER A CONSULTAR LA DB
+def generar_cuentas(telegram_ids, rng: random.Random, primer_id: int, max_cuentas: int):
+    cuenta_id = primer_id
+    for telegram_id in telegram_ids:
+        for nombre, moneda, minimo, maximo in rng.sample(TIPOS_DE_CUENTA, rng.randint(1, max_cuentas)):
+            saldo_centavos = rng.randint(minimo * 100, maximo * 100)
+            yield cuenta_id, telegram_id, nombre, saldo_centavos / 100, moneda, saldo_centavos
+            cuenta_id += 1
+
+# LOS MOVIMIENTOS SE GENERAN CUENTA POR CUENTA A PARTIR DE LAS CUENTAS YA INSERTADAS, SIN GUARDARLAS EN MEMORIA
+def generar_movimientos(cuentas, rng: random.Random, promedio_por_cuenta: float, fin: datetime, dias: int):
+    for cuenta_id, telegram_id in cuentas:
+        for _ in range(_cantidad_movimientos(rng, promedio_por_cuenta)):
+            nombre = rng.choices(_NOMBRES_MOVIMIENTO, cum_weights=_PESOS_MOVIMIENTO)[0]
+            minimo, maximo = _RANGOS_MOVIMIENTO[nombre]
+            monto_centavos = rng.randint(minimo * 100, maximo * 100)
+            yield telegram_id, cuenta_id, nombre, monto_centavos / 100, monto_centavos, _timestamp(rng, fin, dias)
+
+def generar_prestamos(telegram_ids, rng: random.Random, fin: datetime):
+    for telegram_id in telegram_ids:
+        for _ in range(rng.choices((0, 1, 2), weights=(50, 35, 15))[0]):
+            monto = rng.randrange(10_000, 500_000, 5_000)
+            entregado = rng.choice((0, monto // 4, monto // 2, monto))
+            vencimiento = (fin + timedelta(days=rng.randint(30, 1_500))).strftime('%Y-%m-%d')
+            yield telegram_id, rng.choice(("Préstamo Consumo", "Préstamo Automotor", "Adelanto Vacaciones")), monto, entregado, vencimiento
+
+# FUNCION PARA INSERTAR UN GENERADOR EN LOTES, HACIENDO COMMIT CADA filas_por_transaccion FILAS
+def insertar(conn: sqlite3.Connection, sql: str, filas, tabla: str, batch_size: int = BATCH_SIZE,
+             filas_por_transaccion: int = FILAS_POR_TRANSACCION) -> int:
+    total = 0
+    sin_commit = 0
+    inicio = time.perf_counter()
+    for lote in en_lotes(filas, batch_size):
+        conn.executemany(sql, lote)
+        total += len(lote)
+        sin_commit += len(lote)
+        if sin_commit >= filas_por_transaccion:
+            conn.commit()
+            sin_commit = 0
+            transcurrido = time.perf_counter() - inicio
+            logger.info(f"{tabla}: {total:,} filas ({total / transcurrido:,.0f} filas/s).")
+    conn.commit()
+    transcurrido = time.perf_counter() - inicio
+    logger.info(f"{tabla}: {total:,} filas insertadas en {transcurrido:.1f}s ({total / max(transcurrido, 1e-9):,.0f} filas/s).")
+    return total
+
+# LAS CUENTAS RECIEN CREADAS SE LEEN DE A BLOQUES POR id (SIN OFFSET), ASI NO SE CARGAN TODAS EN MEMORIA
+# NI QUEDA UN CURSOR ABIERTO MIENTRAS SE HACEN LOS COMMITS DE LOS MOVIMIENTOS
+def _leer_cuentas(conn: sqlite3.Connection, desde_id: int, bloque: int = 10_000):
+    while True:
+        filas = conn.execute("SELECT id, telegram_id FROM cuentas WHERE id >= ? ORDER BY id LIMIT ?", (desde_id, bloque)).fetchall()
+        if not filas:
+            return
+        yield from filas
+        desde_id = filas[-1][0] + 1
+
+def _siguiente_id(conn: sqlite3.Connection, tabla: str) -> int:
+    return conn.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {tabla}").fetchone()[0]
+
+# FUNCION PRINCIPAL: CREA (O AMPLIA) LA DB DE BENCHMARK Y DEVUELVE LA CANTIDAD DE FILAS INSERTADAS POR TABLA
+def generar(db_name: str = DB_POR_DEFECTO, users: int = 1_000, max_cuentas: int = 2, movements: int = 100_000,
+            seed: int = 42, dias: int = 730, primer_telegram_id: int = PRIMER_TELEGRAM_ID,
+            batch_size: int = BATCH_SIZE, filas_por_transaccion: int = FILAS_POR_TRANSACCION) -> dict:
+    rng = random.Random(seed)
+    fin = datetime(2026, 1, 1)
+    telegram_ids = range(primer_telegram_id, primer_telegram_id + users)
+    # UN SOLO HASH PARA TODOS: PBKDF2 ES LENTO A PROPOSITO Y LOS USUARIOS SINTETICOS COMPARTEN EL PIN
+    pin_hash = autenticacion.hash_pin(PIN_SINTETICO)
+
+    conn = sqlite3.connect(db_name)
+    try:
+        migraciones.migrate(conn)
+        if conn.execute("SELECT 1 FROM users WHERE telegram_id BETWEEN ? AND ? LIMIT 1",
+                        (telegram_ids.start, telegram_ids.stop - 1)).fetchone():
+            raise ValueError(f"Ya hay usuarios en el rango de telegram_id {telegram_ids.start}-{telegram_ids.stop - 1}, usar otro --first-id.")
+        for pragma in PRAGMAS_CARGA:
+            conn.execute(pragma)
+        for nombre in INDICES_DIFERIDOS:
+            conn.execute(f"DROP INDEX IF EXISTS {nombre}")
+        conn.commit()
+
+        resultado = {}
+        inicio = time.perf_counter()
+        resultado["users"] = insertar(conn, "INSERT INTO users (telegram_id, name, pin) VALUES (?, ?, ?)",
+                                      generar_usuarios(telegram_ids, rng, pin_hash), "users", batch_size, filas_por_transaccion)
+        primera_cuenta = _siguiente_id(conn, "cuentas")
+        resultado["cuentas"] = insertar(conn, "INSERT INTO cuentas (id, telegram_id, name, dinero, currency, saldo_centavos) VALUES (?, ?, ?, ?, ?, ?)",
+                                        generar_cuentas(telegram_ids, rng, primera_cuenta, max_cuentas), "cuentas",
+                                        batch_size, filas_por_transaccion)
+        promedio = movements / resultado["cuentas"] if resultado["cuentas"] else 0
+        resultado["hmovimientos"] = insertar(
+            conn, "INSERT INTO hmovimientos (telegram_id, account_id, name, dinero, monto_centavos, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+            generar_movimientos(_leer_cuentas(conn, primera_cuenta), rng, promedio, fin, dias), "hmovimientos",
+            batch_size, filas_por_transaccion)
+        resultado["prestamos"] = insertar(conn, "INSERT INTO prestamos (telegram_id, name, dinero, dineroEntregado, due_date) VALUES (?, ?, ?, ?, ?)",
+                                          generar_prestamos(telegram_ids, rng, fin), "prestamos", batch_size, filas_por_transaccion)
+
+        logger.info("Recreando índices y actualizando estadísticas del planificador...")
+        for sentencia in INDICES_DIFERIDOS.values():
+            conn.execute(sentencia)
+        # LOS SALDOS GENERADOS NO SALEN DE LOS MOVIMIENTOS, LA DIFERENCIA QUEDA COMO SALDO INICIAL (USA idx_hmovimientos_cuenta_ts)
+        libroMayor.rebase_opening_balances(conn, primera_cuenta)
+        conn.execute("ANALYZE")
+        conn.commit()
+        for pragma in PRAGMAS_FINALES:
+            conn.execute(pragma)
+        logger.info(f"Dataset generado en {time.perf_counter() - inicio:.1f}s: {resultado}")
+        return resultado
+    finally:
+        conn.close()
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Genera una base de datos sintética de gran volumen para benchmarks.")
+    parser.add_argument("--db", default=DB_POR_DEFECTO, help="archivo SQLite de destino (nunca la DB real del bot)")
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--max-accounts", type=int, default=2, choices=range(1, len(TIPOS_DE_CUENTA) + 1),
+                        help="máximo de cuentas por usuario (se elige al azar entre 1 y este valor)")
+    parser.add_argument("--movements", type=int, default=100_000, help="total aproximado de filas de hmovimientos")
+    parser.add_argument("--days", type=int, default=730, help="días de historia de los movimientos")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--first-id", type=int, default=PRIMER_TELEGRAM_ID, help="primer telegram_id sintético")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--rows-per-tx", type=int, default=FILAS_POR_TRANSACCION)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = _parse_args()
+    if os.path.basename(args.db) == conexiones.DB_NAME:
+        raise SystemExit("Este generador desactiva el journal durante la carga, no usarlo sobre la DB real del bot.")
+    generar(args.db, args.users, args.max_accounts, args.movements, args.seed, args.days, args.first_id,
+            args.batch_size, args.rows_per_tx)
@@ -0,0 +1,242 @@
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from decimal import ROUND_HALF_UP, Decimal
+
+import cache_usuarios
+from db import conexiones
+
+logger = logging.getLogger(__name__)
+
+# LIBRO MAYOR: LOS MONTOS SE GUARDAN COMO ENTEROS EN UNIDADES MENORES (CENTAVOS) POR MONEDA, NUNCA COMO float
+# cuentas.saldo_centavos Y hmovimientos.monto_centavos SON LA FUENTE DE VERDAD, LAS COLUMNAS dinero QUEDAN COMO COPIA PARA MOSTRAR
+# CADA MOVIMIENTO SE REGISTRA EN LA MISMA TRANSACCION QUE ACTUALIZA EL SALDO DE LA CUENTA (post_movement)
+# EL BOT SOLO CONSULTA SALDOS, TODAVIA NINGUN HANDLER REGISTRA MOVIMIENTOS: post_movement ES LA API PARA QUIEN LOS ESCRIBA
+# INVARIANTE: saldo_centavos = saldo_inicial_centavos + SUMA DE monto_centavos DE LA CUENTA
+# LAS FECHAS SON UTC, COMO EL CURRENT_TIMESTAMP DE SQLITE QUE COMPLETA hmovimientos.timestamp, ASI LOS DIAS DE LOS SNAPSHOTS COINCIDEN
+# SNAPSHOTS: saldos_snapshot GUARDA EL SALDO DE CADA CUENTA AL INICIO DE UN DIA (MOVIMIENTOS CON timestamp < tomado)
+# EL SALDO A CUALQUIER FECHA ES EL SNAPSHOT ANTERIOR MAS LOS MOVIMIENTOS DESDE ESE SNAPSHOT (A LO SUMO UN DIA SI SE TOMAN A DIARIO)
+# SE EJECUTA CON: python -m db.libroMayor --check / --snapshot [--as-of 2026-01-01]
+
+# DECIMALES DE CADA MONEDA, LAS QUE NO ESTAN USAN 2
+DECIMALES_POR_MONEDA = {"UYU": 2, "USD": 2, "EUR": 2}
+LEDGER_SNAPSHOT_INTERVAL_S = float(os.getenv("LEDGER_SNAPSHOT_INTERVAL_S", "0"))
+FORMATO_TIMESTAMP = '%Y-%m-%d %H:%M:%S'
+MAX_EJEMPLOS = 20
+_SALDO_CENTAVOS = "COALESCE(saldo_centavos, CAST(ROUND(COALESCE(dinero, 0) * 100) AS INTEGER))"
+
+class LedgerError(ValueError):
+    pass
+
+class InsufficientFunds(LedgerError):
+    pass
+
+def factor(currency: str) -> int:
+    return 10 ** DECIMALES_POR_MONEDA.get(currency or "", 2)
+
+# FUNCION PARA CONVERTIR UN MONTO ("1250.50", Decimal O int) A UNIDADES MENORES, REDONDEANDO AL CENTAVO MAS CERCANO
+def to_minor_units(amount, currency: str) -> int:
+    return int((Decimal(str(amount)) * factor(currency)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def from_minor_units(amount_minor: int, currency: str) -> Decimal:
+    return Decimal(amount_minor) / factor(currency)
+
+# FUNCION PARA REGISTRAR UN MOVIMIENTO Y ACTUALIZAR EL SALDO EN UNA SOLA TRANSACCION (BEGIN IMMEDIATE: NADIE ESCRIBE EN EL MEDIO)
+# amount_minor ES POSITIVO PARA CREDITOS Y NEGATIVO PARA DEBITOS, DEVUELVE EL id DEL MOVIMIENTO
+# UN MOVIMIENTO CON FECHA ANTERIOR A UN SNAPSHOT INVALIDA LOS SNAPSHOTS POSTERIORES DE ESA CUENTA
+def post_movement(conn: sqlite3.Connection, account_id: int, description: str, amount_minor: int,
+                  timestamp: str = None, allow_overdraft: bool = False) -> int:
+    if not isinstance(amount_minor, int) or amount_minor == 0:
+        raise LedgerError(f"Monto inválido para un movimiento: {amount_minor!r} (debe ser un entero distinto de cero).")
+    timestamp = timestamp or datetime.now(timezone.utc).strftime(FORMATO_TIMESTAMP)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # UNA CUENTA CARGADA SIN CENTAVOS (ANTES DE LA MIGRACION 9) PARTE DE SU COPIA dinero
+        cuenta = conn.execute(f"SELECT telegram_id, currency, {_SALDO_CENTAVOS} FROM cuentas WHERE id = ?", (account_id,)).fetchone()
+        if cuenta is None:
+            raise LedgerError(f"La cuenta {account_id} no existe.")
+        telegram_id, currency, saldo = cuenta
+        nuevo_saldo = saldo + amount_minor
+        if nuevo_saldo < 0 and amount_minor < 0 and not allow_overdraft:
+            raise InsufficientFunds(f"Saldo insuficiente en la cuenta {account_id}.")
+        cursor = conn.execute('''
+            INSERT INTO hmovimientos (telegram_id, account_id, name, dinero, monto_centavos, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (telegram_id, account_id, description, amount_minor / factor(currency), amount_minor, timestamp))
+        conn.execute("UPDATE cuentas SET saldo_centavos = ?, dinero = ? WHERE id = ?",
+                     (nuevo_saldo, nuevo_saldo / factor(currency), account_id))
+        conn.execute("DELETE FROM saldos_snapshot WHERE account_id = ? AND tomado > ?", (account_id, timestamp))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    cache_usuarios.invalidate_user(telegram_id, "cuentas", "hmovimientos")
+    return cursor.lastrowid
+
+def balance(conn: sqlite3.Connection, account_id: int) -> int:
+    fila = conn.execute(f"SELECT {_SALDO_CENTAVOS} FROM cuentas WHERE id = ?", (account_id,)).fetchone()
+    if fila is None:
+        raise LedgerError(f"La cuenta {account_id} no existe.")
+    return fila[0]
+
+# FUNCION PARA CALCULAR EL SALDO DE UNA CUENTA A UNA FECHA (INCLUYE LOS MOVIMIENTOS CON timestamp <= as_of)
+# PARTE DEL ULTIMO SNAPSHOT ANTERIOR (O DEL SALDO INICIAL) Y SUMA SOLO LA COLA, CON EL INDICE idx_hmovimientos_cuenta_ts
+def balance_as_of(conn: sqlite3.Connection, account_id: int, as_of: str) -> int:
+    snapshot = conn.execute('''
+        SELECT tomado, saldo_centavos FROM saldos_snapshot
+        WHERE account_id = ? AND tomado <= ?
+        ORDER BY tomado DESC LIMIT 1
+    ''', (account_id, as_of)).fetchone()
+    if snapshot is None:
+        fila = conn.execute("SELECT saldo_inicial_centavos FROM cuentas WHERE id = ?", (account_id,)).fetchone()
+        if fila is None:
+            raise LedgerError(f"La cuenta {account_id} no existe.")
+        desde, base = "", fila[0]
+    else:
+        desde, base = snapshot
+    cola = conn.execute('''
+        SELECT COALESCE(SUM(monto_centavos), 0) FROM hmovimientos
+        WHERE account_id = ? AND timestamp >= ? AND timestamp <= ?
+    ''', (account_id, desde, as_of)).fetchone()[0]
+    return base + cola
+
+def _inicio_del_dia(dia: datetime = None) -> str:
+    dia = dia or datetime.now(timezone.utc)
+    return dia.replace(hour=0, minute=0, second=0, microsecond=0).strftime(FORMATO_TIMESTAMP)
+
+# FUNCION PARA TOMAR EL SNAPSHOT DE TODAS LAS CUENTAS AL INICIO DEL DIA tomado ("YYYY-MM-DD 00:00:00", POR DEFECTO HOY)
+# CADA SALDO SALE DEL SNAPSHOT ANTERIOR DE LA CUENTA MAS SUS MOVIMIENTOS DESDE ENTONCES, EN UNA SOLA SENTENCIA
+# ES IDEMPOTENTE: VOLVER A TOMAR EL MISMO DIA REEMPLAZA LOS VALORES POR LOS MISMOS
+def take_snapshots(conn: sqlite3.Connection, tomado: str = None) -> int:
+    tomado = tomado or _inicio_del_dia()
+    cursor = conn.execute('''
+        INSERT OR REPLACE INTO saldos_snapshot (account_id, tomado, saldo_centavos)
+        WITH previo AS (
+            SELECT c.id AS account_id, c.saldo_inicial_centavos AS inicial,
+                   (SELECT MAX(s.tomado) FROM saldos_snapshot s WHERE s.account_id = c.id AND s.tomado < :tomado) AS desde
+            FROM cuentas c
+        )
+        SELECT p.account_id, :tomado,
+               COALESCE((SELECT s.saldo_centavos FROM saldos_snapshot s WHERE s.account_id = p.account_id AND s.tomado = p.desde), p.inicial)
+               + COALESCE((SELECT SUM(h.monto_centavos) FROM hmovimientos h
+                           WHERE h.account_id = p.account_id AND h.timestamp >= COALESCE(p.desde, '') AND h.timestamp < :tomado), 0)
+        FROM previo p
+    ''', {"tomado": tomado})
+    conn.commit()
+    logger.info(f"Snapshot de saldos al {tomado}: {cursor.rowcount} cuentas.")
+    return cursor.rowcount
+
+# FUNCION PARA FIJAR EL SALDO INICIAL DE CUENTAS CARGADAS DIRECTAMENTE (DATOS DE EJEMPLO, GENERADOR) PARA QUE CUMPLAN LA INVARIANTE
+# NO HACE COMMIT, LO HACE EL LLAMADOR JUNTO CON LA CARGA
+def rebase_opening_balances(conn: sqlite3.Connection, desde_id: int = 0) -> int:
+    cursor = conn.execute('''
+        UPDATE cuentas SET saldo_inicial_centavos = saldo_centavos - COALESCE(
+            (SELECT SUM(h.monto_centavos) FROM hmovimientos h WHERE h.account_id = cuentas.id), 0)
+        WHERE id >= ?
+    ''', (desde_id,))
+    return cursor.rowcount
+
+# --- VERIFICACION DE CONSISTENCIA ---
+
+# CADA CONTROL ES UNA CONSULTA SOBRE TODA LA TABLA (UNA PASADA AGRUPADA, SIN RECORRER CUENTA POR CUENTA DESDE PYTHON)
+_CONTROLES = {
+    # MONTOS SIN CONVERTIR A CENTAVOS
+    "montos_nulos": '''
+        SELECT 'cuenta', id FROM cuentas WHERE saldo_centavos IS NULL OR saldo_inicial_centavos IS NULL
+        UNION ALL
+        SELECT 'movimiento', id FROM hmovimientos WHERE monto_centavos IS NULL
+    ''',
+    # SALDO DISTINTO DEL SALDO INICIAL MAS LA SUMA DE SUS MOVIMIENTOS
+    "saldo_vs_movimientos": '''
+        SELECT c.id, c.saldo_centavos, c.saldo_inicial_centavos + COALESCE(m.total, 0)
+        FROM cuentas c
+        LEFT JOIN (SELECT account_id, SUM(monto_centavos) AS total FROM hmovimientos GROUP BY account_id) m ON m.account_id = c.id
+        WHERE c.saldo_centavos != c.saldo_inicial_centavos + COALESCE(m.total, 0)
+    ''',
+    # LA COPIA dinero (REAL) SE APARTA MAS DE MEDIO CENTAVO DEL VALOR ENTERO
+    "copia_dinero_cuentas": '''
+        SELECT id, dinero, saldo_centavos FROM cuentas WHERE ABS(dinero * 100 - saldo_centavos) >= 0.5
+    ''',
+    "copia_dinero_movimientos": '''
+        SELECT id, dinero, monto_centavos FROM hmovimientos WHERE ABS(dinero * 100 - monto_centavos) >= 0.5
+    ''',
+    # MOVIMIENTOS QUE APUNTAN A UNA CUENTA INEXISTENTE O DE OTRO USUARIO
+    "movimientos_huerfanos": '''
+        SELECT h.id, h.account_id, h.telegram_id FROM hmovimientos h
+        LEFT JOIN cuentas c ON c.id = h.account_id
+        WHERE c.id IS NULL OR c.telegram_id != h.telegram_id
+    ''',
+    # EL ULTIMO SNAPSHOT DE CADA CUENTA NO COINCIDE CON LO QUE DAN LOS MOVIMIENTOS
+    "snapshots": '''
+        SELECT s.account_id, s.tomado, s.saldo_centavos,
+               c.saldo_inicial_centavos + COALESCE((SELECT SUM(h.monto_centavos) FROM hmovimientos h
+                                                    WHERE h.account_id = s.account_id AND h.timestamp < s.tomado), 0) AS esperado
+        FROM saldos_snapshot s
+        JOIN cuentas c ON c.id = s.account_id
+        WHERE s.tomado = (SELECT MAX(tomado) FROM saldos_snapshot WHERE account_id = s.account_id)
+          AND s.saldo_centavos != esperado
+    ''',
+}
+
+# FUNCION PARA VERIFICAR TODO EL LIBRO, DEVUELVE {CONTROL: {"total": N, "ejemplos": [...]}} SOLO CON LOS CONTROLES QUE FALLARON
+# LA COPIA dinero SE COMPARA CON 2 DECIMALES (TODAS LAS MONEDAS DE DECIMALES_POR_MONEDA)
+def check_consistency(conn: sqlite3.Connection, max_examples: int = MAX_EJEMPLOS) -> dict:
+    problemas = {}
+    for nombre, sql in _CONTROLES.items():
+        cursor = conn.execute(sql)
+        ejemplos = cursor.fetchmany(max_examples)
+        if not ejemplos:
+            continue
+        problemas[nombre] = {"total": len(ejemplos) + sum(1 for _ in cursor), "ejemplos": ejemplos}
+    return problemas
+
+# HILO EN SEGUNDO PLANO QUE TOMA EL SNAPSHOT DEL DIA CADA interval_s SEGUNDOS (DESACTIVADO CON 0)
+def start_snapshotter(interval_s: float = LEDGER_SNAPSHOT_INTERVAL_S):
+    if interval_s <= 0:
+        return None
+    stop_event = threading.Event()
+
+    def _tomar():
+        while True:
+            try:
+                with conexiones.get_connection() as conn:
+                    take_snapshots(conn)
+            except sqlite3.Error as e:
+                logger.error(f"Error al tomar el snapshot de saldos: {e}")
+            if stop_event.wait(interval_s):
+                return
+
+    threading.Thread(target=_tomar, name="libro-mayor-snapshots", daemon=True).start()
+    return stop_event
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Snapshots de saldos y verificación de consistencia del libro mayor.")
+    parser.add_argument("--db", default=conexiones.DB_NAME)
+    parser.add_argument("--check", action="store_true", help="verifica saldos, movimientos y snapshots")
+    parser.add_argument("--snapshot", action="store_true", help="toma el snapshot de saldos de todas las cuentas")
+    parser.add_argument("--as-of", help="día del snapshot (YYYY-MM-DD), por defecto hoy")
+    parser.add_argument("--days", type=int, default=1, help="cantidad de snapshots diarios a tomar hasta --as-of")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = _parse_args()
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.snapshot:
+            ultimo = datetime.strptime(args.as_of, '%Y-%m-%d') if args.as_of else datetime.now(timezone.utc)
+            # DEL MAS VIEJO AL MAS NUEVO, CADA SNAPSHOT PARTE DEL ANTERIOR
+            for dias_atras in range(args.days - 1, -1, -1):
+                take_snapshots(conn, _inicio_del_dia(ultimo - timedelta(days=dias_atras)))
+        if args.check:
+            problemas = check_consistency(conn)
+            for nombre, detalle in problemas.items():
+                logger.error(f"{nombre}: {detalle['total']} problemas, por ejemplo {detalle['ejemplos'][:5]}")
+            if problemas:
+                raise SystemExit(1)
+            logger.info("Libro mayor consistente.")
+    finally:
+        conn.close()
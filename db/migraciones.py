@@ -0,0 +1,204 @@
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+# LISTA ORDENADA DE MIGRACIONES (VERSION, DESCRIPCION, SENTENCIAS)
+# LA VERSION APLICADA SE GUARDA EN PRAGMA user_version, SOLO SE EJECUTAN LAS PENDIENTES
+# NUNCA MODIFICAR UNA MIGRACION YA PUBLICADA, SIEMPRE AGREGAR UNA NUEVA AL FINAL
+MIGRACIONES = [
+    (1, "esquema inicial", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER UNIQUE NOT NULL,
+            name TEXT,
+            pin TEXT DEFAULT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS cuentas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            dinero REAL NOT NULL DEFAULT 0,
+            currency TEXT,
+            FOREIGN KEY (telegram_id) REFERENCES users (telegram_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS hmovimientos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER NOT NULL,
+            account_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            dinero REAL NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (telegram_id) REFERENCES users (telegram_id),
+            FOREIGN KEY (account_id) REFERENCES cuentas (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS prestamos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            dinero REAL NOT NULL,
+            dineroEntregado REAL DEFAULT 0,
+            due_date DATE,
+            FOREIGN KEY (telegram_id) REFERENCES users (telegram_id)
+        )
+        ''',
+    ]),
+    (2, "indices por telegram_id y ultimos movimientos", [
+        # CUBRE "WHERE telegram_id = ? ORDER BY timestamp DESC LIMIT 5" SIN ORDENAR NI RECORRER LA TABLA
+        "CREATE INDEX IF NOT EXISTS idx_hmovimientos_telegram_ts ON hmovimientos (telegram_id, timestamp DESC, account_id, name, dinero)",
+        "CREATE INDEX IF NOT EXISTS idx_cuentas_telegram ON cuentas (telegram_id, name, dinero, currency)",
+        "CREATE INDEX IF NOT EXISTS idx_prestamos_telegram ON prestamos (telegram_id)",
+    ]),
+    (3, "cache persistente de respuestas generales", [
+        '''
+        CREATE TABLE IF NOT EXISTS cache_respuestas (
+            clave TEXT PRIMARY KEY,
+            respuesta TEXT NOT NULL,
+            expira REAL NOT NULL
+        )
+        ''',
+    ]),
+    (4, "sesiones pendientes de PIN compartidas entre procesos", [
+        '''
+        CREATE TABLE IF NOT EXISTS sesiones_pin (
+            telegram_id INTEGER PRIMARY KEY,
+            intent TEXT NOT NULL,
+            expira REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_sesiones_pin_expira ON sesiones_pin (expira)",
+    ]),
+    (5, "indice de movimientos con id para paginar el extracto por cursor", [
+        # CUBRE "ORDER BY timestamp DESC, id DESC" Y EL CURSOR "(timestamp, id) < (?, ?)" DEL EXTRACTO
+        # TAMBIEN CUBRE LOS ULTIMOS 5 MOVIMIENTOS DEL SALDO, POR ESO REEMPLAZA AL INDICE DE LA MIGRACION 2
+        "CREATE INDEX IF NOT EXISTS idx_hmovimientos_telegram_ts_id ON hmovimientos (telegram_id, timestamp DESC, id DESC, account_id, name, dinero)",
+        "DROP INDEX IF EXISTS idx_hmovimientos_telegram_ts",
+    ]),
+    (6, "memoria de conversacion por usuario", [
+        '''
+        CREATE TABLE IF NOT EXISTS conversaciones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER NOT NULL,
+            rol TEXT NOT NULL,
+            texto TEXT NOT NULL,
+            creado REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_conversaciones_telegram ON conversaciones (telegram_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_conversaciones_creado ON conversaciones (creado)",
+    ]),
+    (7, "contadores de interacciones por usuario, dia e intencion", [
+        # UNA FILA POR (USUARIO, DIA, INTENCION), EL VOLCADO SUMA CON UPSERT SOBRE LA CLAVE PRIMARIA
+        '''
+        CREATE TABLE IF NOT EXISTS interacciones (
+            telegram_id INTEGER NOT NULL,
+            dia TEXT NOT NULL,
+            intent TEXT NOT NULL,
+            cantidad INTEGER NOT NULL DEFAULT 0,
+            ultima REAL NOT NULL,
+            PRIMARY KEY (telegram_id, dia, intent)
+        ) WITHOUT ROWID
+        ''',
+        # CUBRE LOS TOTALES DIARIOS Y LOS USUARIOS ACTIVOS POR DIA SIN LEER LA TABLA
+        "CREATE INDEX IF NOT EXISTS idx_interacciones_dia ON interacciones (dia, intent, cantidad, telegram_id)",
+    ]),
+    (8, "libro mayor en centavos con saldo inicial y snapshots de saldos", [
+        # MONTOS ENTEROS EN UNIDADES MENORES (VER db/libroMayor.py), TODAS LAS MONEDAS EXISTENTES (UYU, USD, EUR) TIENEN 2 DECIMALES
+        "ALTER TABLE cuentas ADD COLUMN saldo_centavos INTEGER",
+        "ALTER TABLE cuentas ADD COLUMN saldo_inicial_centavos INTEGER",
+        "ALTER TABLE hmovimientos ADD COLUMN monto_centavos INTEGER",
+        "UPDATE hmovimientos SET monto_centavos = CAST(ROUND(dinero * 100) AS INTEGER)",
+        "UPDATE cuentas SET saldo_centavos = CAST(ROUND(dinero * 100) AS INTEGER)",
+        # EL SALDO INICIAL ABSORBE LA DIFERENCIA HISTORICA ENTRE EL SALDO Y LOS MOVIMIENTOS, DESDE AQUI LA INVARIANTE SE CUMPLE
+        '''
+        UPDATE cuentas SET saldo_inicial_centavos = saldo_centavos - COALESCE(
+            (SELECT SUM(h.monto_centavos) FROM hmovimientos h WHERE h.account_id = cuentas.id), 0)
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS saldos_snapshot (
+            account_id INTEGER NOT NULL,
+            tomado TEXT NOT NULL,
+            saldo_centavos INTEGER NOT NULL,
+            PRIMARY KEY (account_id, tomado),
+            FOREIGN KEY (account_id) REFERENCES cuentas (id)
+        ) WITHOUT ROWID
+        ''',
+        # CUBRE LA SUMA DE LA COLA DE MOVIMIENTOS DE UNA CUENTA ENTRE UN SNAPSHOT Y UNA FECHA
+        "CREATE INDEX IF NOT EXISTS idx_hmovimientos_cuenta_ts ON hmovimientos (account_id, timestamp, monto_centavos)",
+    ]),
+    (9, "centavos completados al insertar filas sin ellos", [
+        # SQLITE NO PERMITE AGREGAR NOT NULL A UNA COLUMNA EXISTENTE: LOS TRIGGERS COMPLETAN LAS FILAS QUE LLEGAN SIN CENTAVOS
+        # (INSERTS QUE SOLO CARGAN dinero, COMO LOS DEL BENCHMARK) A PARTIR DE LA COPIA dinero
+        '''
+        UPDATE cuentas SET saldo_centavos = CAST(ROUND(COALESCE(dinero, 0) * 100) AS INTEGER)
+        WHERE saldo_centavos IS NULL
+        ''',
+        '''
+        UPDATE cuentas SET saldo_inicial_centavos = saldo_centavos - COALESCE(
+            (SELECT SUM(h.monto_centavos) FROM hmovimientos h WHERE h.account_id = cuentas.id), 0)
+        WHERE saldo_inicial_centavos IS NULL
+        ''',
+        "UPDATE hmovimientos SET monto_centavos = CAST(ROUND(dinero * 100) AS INTEGER) WHERE monto_centavos IS NULL",
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_cuentas_centavos AFTER INSERT ON cuentas
+        WHEN NEW.saldo_centavos IS NULL OR NEW.saldo_inicial_centavos IS NULL
+        BEGIN
+            UPDATE cuentas SET
+                saldo_centavos = COALESCE(saldo_centavos, CAST(ROUND(COALESCE(dinero, 0) * 100) AS INTEGER)),
+                saldo_inicial_centavos = COALESCE(saldo_inicial_centavos, saldo_centavos, CAST(ROUND(COALESCE(dinero, 0) * 100) AS INTEGER))
+            WHERE id = NEW.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_hmovimientos_centavos AFTER INSERT ON hmovimientos
+        WHEN NEW.monto_centavos IS NULL
+        BEGIN
+            UPDATE hmovimientos SET monto_centavos = CAST(ROUND(dinero * 100) AS INTEGER) WHERE id = NEW.id;
+        END
+        ''',
+    ]),
+]
+
+# FUNCION PARA LEER LA VERSION DE ESQUEMA YA APLICADA EN LA DB
+def current_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def latest_version() -> int:
+    return MIGRACIONES[-1][0] if MIGRACIONES else 0
+
+# FUNCION PARA APLICAR SOLO LAS MIGRACIONES PENDIENTES, CADA UNA EN SU PROPIA TRANSACCION
+# SI LA DB YA ESTA AL DIA SOLO SE LEE user_version (ARRANQUE EN TIEMPO CONSTANTE)
+def migrate(conn: sqlite3.Connection) -> int:
+    version = current_version(conn)
+    if version >= latest_version():
+        logger.info(f"Esquema de base de datos al día (versión {version}).")
+        return version
+    isolation_level_anterior = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        for numero, descripcion, sentencias in MIGRACIONES:
+            if numero <= version:
+                continue
+            logger.info(f"Aplicando migración {numero}: {descripcion}...")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sentencia in sentencias:
+                    conn.execute(sentencia)
+                conn.execute(f"PRAGMA user_version = {int(numero)}")
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                logger.error(f"Falló la migración {numero}, se revirtieron sus cambios.")
+                raise
+            version = numero
+    finally:
+        conn.isolation_level = isolation_level_anterior
+    logger.info(f"Esquema de base de datos actualizado a la versión {version}.")
+    return version
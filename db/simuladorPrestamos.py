@@ -0,0 +1,134 @@
+import re
+import sqlite3
+import logging
+from functools import lru_cache
+
+from intenciones import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# SIMULADOR DE PRESTAMOS (SISTEMA FRANCES, CUOTA FIJA), CALCULA VARIOS PLAZOS A LA VEZ CON NUMPY Y SIN LLAMAR A GEMINI
+# NUMPY SE IMPORTA EN LA PRIMERA SIMULACION, NO AL CARGAR main.py: EL RUTEO (parse_loan_request) NO LO NECESITA Y /start NO PAGA SU IMPORT
+# RESPONDE MENSAJES COMO "¿Cuánto pagaría si pido 100.000 en 24 cuotas?" O "Necesito un préstamo"
+
+PLAZOS_SUGERIDOS = (12, 24, 36, 48)
+MONTO_POR_DEFECTO = 100000.0
+MONTO_MAXIMO = 5000000.0
+PLAZO_MAXIMO = 120
+
+# TASA EFECTIVA ANUAL (TEA) SEGUN EL PERFIL SIMULADO DEL USUARIO
+PERFILES_TASA = {
+    "preferencial": 0.28,
+    "estandar": 0.35,
+    "inicial": 0.42,
+}
+SALDO_MINIMO_PREFERENCIAL = 50000.0
+
+_RE_PLAZO_MESES = re.compile(r"(\d{1,3})\s*(?:cuotas|meses|mes)\b")
+_RE_PLAZO_ANOS = re.compile(r"(\d{1,2})\s*anos?\b")
+_RE_MONTO = re.compile(r"(\d{1,3}(?:[.,]\d{3})+(?:,\d{1,2})?|\d+(?:[.,]\d{1,2})?)\s*(millones|millon|mil|k)?\b")
+_MULTIPLICADORES = {"mil": 1e3, "k": 1e3, "millon": 1e6, "millones": 1e6}
+# UN NUMERO DE 4 CIFRAS ENTRE 1900 Y 2099 SIN SEPARADORES SE TOMA COMO AÑO ("VENCE EN 2024"), SALVO QUE LLEVE MONEDA AL LADO
+_RE_ANO = re.compile(r"(?:19|20)\d{2}")
+_RE_MONEDA_ANTES = re.compile(r"(?:\$|u\$s|usd|uyu)\s*$")
+_RE_MONEDA_DESPUES = re.compile(r"\s*(?:\$|u\$s|usd|uyu|pesos|dolares)")
+
+# FUNCION PARA LEER MONTO Y PLAZO DEL MENSAJE, DEVUELVE (MONTO O NONE, PLAZO EN MESES O NONE)
+def parse_loan_request(text: str) -> tuple:
+    texto = normalize_text(text)
+    plazo = None
+    match_plazo = _RE_PLAZO_MESES.search(texto)
+    if match_plazo:
+        plazo = int(match_plazo.group(1))
+    else:
+        match_plazo = _RE_PLAZO_ANOS.search(texto)
+        if match_plazo:
+            plazo = int(match_plazo.group(1)) * 12
+    if match_plazo:
+        texto = texto[:match_plazo.start()] + " " + texto[match_plazo.end():]
+    if plazo is not None and not 1 <= plazo <= PLAZO_MAXIMO:
+        plazo = None
+
+    monto = None
+    for match in _RE_MONTO.finditer(texto):
+        numero, multiplicador = match.group(1), match.group(2)
+        if multiplicador is None and _RE_ANO.fullmatch(numero) and not _tiene_moneda(texto, match):
+            continue
+        valor = _a_numero(numero) * _MULTIPLICADORES.get(multiplicador, 1)
+        if valor >= 1000 and (monto is None or valor > monto):
+            monto = valor
+    if monto is not None and monto > MONTO_MAXIMO:
+        monto = None
+    return monto, plazo
+
+# FUNCION PARA DECIDIR SI UN MENSAJE DE "PRESTAMO" PIDE UNA SIMULACION: HACE FALTA MONTO Y PLAZO
+# "¿CUANTO DEBO DE MI PRESTAMO DE 50.000?" TRAE MONTO PERO NO PLAZO, ES UNA CONSULTA DEL PRESTAMO EXISTENTE
+def is_simulation_request(text: str) -> bool:
+    monto, plazo = parse_loan_request(text)
+    return monto is not None and plazo is not None
+
+def _tiene_moneda(texto: str, match) -> bool:
+    return bool(_RE_MONEDA_ANTES.search(texto, 0, match.start(1)) or _RE_MONEDA_DESPUES.match(texto, match.end(1)))
+
+# "100.000" Y "100,000" SON MILES, "1,5" ES DECIMAL (FORMATO URUGUAYO)
+def _a_numero(numero: str) -> float:
+    if re.fullmatch(r"\d{1,3}(?:[.,]\d{3})+", numero):
+        return float(re.sub(r"[.,]", "", numero))
+    if re.fullmatch(r"\d{1,3}(?:\.\d{3})+,\d{1,2}", numero):
+        return float(numero.replace(".", "").replace(",", "."))
+    return float(numero.replace(",", "."))
+
+# TASA MENSUAL EQUIVALENTE A UNA TEA
+def monthly_rate(annual_rate):
+    import numpy as np
+    return np.power(1.0 + np.asarray(annual_rate, dtype=float), 1.0 / 12.0) - 1.0
+
+# CUOTA FIJA DEL SISTEMA FRANCES PARA ARREGLOS DE MONTOS, PLAZOS Y TASAS (SE APLICA BROADCASTING DE NUMPY)
+def french_installments(amounts, terms, annual_rates):
+    import numpy as np
+    amounts = np.asarray(amounts, dtype=float)
+    terms = np.asarray(terms, dtype=float)
+    rates = monthly_rate(annual_rates)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cuotas = amounts * rates / (1.0 - np.power(1.0 + rates, -terms))
+    return np.where(rates > 0, cuotas, amounts / terms)
+
+# SIMULACION MEMOIZADA POR (MONTO, PLAZOS, PERFIL): TUPLA DE (PLAZO, CUOTA, TOTAL, INTERESES)
+@lru_cache(maxsize=4096)
+def simulate_loan(amount: float, terms: tuple, profile: str) -> tuple:
+    import numpy as np
+    annual_rate = PERFILES_TASA[profile]
+    terms_array = np.asarray(terms, dtype=float)
+    cuotas = french_installments(amount, terms_array, annual_rate)
+    totales = cuotas * terms_array
+    return tuple(
+        (int(plazo), float(cuota), float(total), float(total - amount))
+        for plazo, cuota, total in zip(terms, cuotas, totales)
+    )
+
+# FUNCION PARA ELEGIR EL PERFIL DE TASA SEGUN LOS DATOS DEL USUARIO (CUENTAS Y PRESTAMOS PENDIENTES)
+def rate_profile_for_user(conn: sqlite3.Connection, telegram_id: int) -> str:
+    row = conn.execute('''
+        SELECT
+            (SELECT COUNT(*) FROM cuentas WHERE telegram_id = ?),
+            (SELECT COALESCE(SUM(dinero), 0) FROM cuentas WHERE telegram_id = ? AND currency = 'UYU'),
+            (SELECT COALESCE(SUM(dinero - COALESCE(dineroEntregado, 0)), 0) FROM prestamos WHERE telegram_id = ?)
+    ''', (telegram_id, telegram_id, telegram_id)).fetchone()
+    cantidad_cuentas, saldo_pesos, deuda_pendiente = row
+    if cantidad_cuentas == 0:
+        return "inicial"
+    if saldo_pesos >= SALDO_MINIMO_PREFERENCIAL and deuda_pendiente <= saldo_pesos:
+        return "preferencial"
+    return "estandar"
+
+# FUNCION PARA ARMAR EL TEXTO DE RESPUESTA, SI EL USUARIO PIDIO UN PLAZO SE MUESTRA JUNTO A LOS SUGERIDOS
+def format_simulation(amount: float, term, profile: str) -> str:
+    plazos = tuple(sorted(set(PLAZOS_SUGERIDOS) | ({term} if term else set())))
+    filas = simulate_loan(float(amount), plazos, profile)
+    tea = PERFILES_TASA[profile]
+    partes = [f"Simulación de préstamo por ${amount:.2f} (perfil {profile}, TEA {tea * 100:.0f}%):"]
+    for plazo, cuota, total, intereses in filas:
+        marca = " <- tu consulta" if plazo == term else ""
+        partes.append(f"- {plazo} cuotas de ${cuota:.2f}. Total a pagar ${total:.2f} (intereses ${intereses:.2f}){marca}")
+    partes.append("\nValores estimados, sujetos a aprobación crediticia.")
+    return "\n".join(partes)
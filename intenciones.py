@@ -0,0 +1,76 @@
+import unicodedata
+from collections import deque
+
+# MOTOR DE INTENCIONES: TODAS LAS PALABRAS CLAVE SE COMPILAN UNA SOLA VEZ EN UN AUTOMATA AHO-CORASICK
+# UNA SOLA PASADA POR EL MENSAJE DEVUELVE TODAS LAS INTENCIONES ENCONTRADAS CON SU POSICION,
+# SIN IMPORTAR CUANTAS PALABRAS CLAVE HAYA. LA COMPARACION IGNORA MAYUSCULAS Y TILDES ("prestamo" == "préstamo")
+
+# FUNCION PARA NORMALIZAR TEXTO: MINUSCULAS Y SIN TILDES (LAS POSICIONES DEVUELTAS SE REFIEREN A ESTE TEXTO)
+def normalize_text(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(c))
+
+# FUNCION ORIGINAL DEL BOT: MINUSCULAS Y BUSQUEDA LINEAL DE CADA PALABRA CLAVE (SE CONSERVA COMO REFERENCIA)
+def check_keywords(text: str, keywords: list) -> bool:
+    text_lower = text.lower()
+    return any(keyword.lower() in text_lower for keyword in keywords)
+
+class IntentEngine:
+    # RECIBE UN DICCIONARIO {INTENCION: [PALABRAS CLAVE]} Y CONSTRUYE EL AUTOMATA
+    def __init__(self, intents: dict):
+        self.intent_names = list(intents)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for intent, keywords in intents.items():
+            for keyword in keywords:
+                self._add_keyword(intent, keyword)
+        self._build_fail_links()
+
+    def _add_keyword(self, intent: str, keyword: str):
+        normalized = normalize_text(keyword)
+        if not normalized:
+            return
+        state = 0
+        for ch in normalized:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][ch] = next_state
+            state = next_state
+        salida = (intent, keyword, len(normalized))
+        if salida not in self._out[state]:
+            self._out[state].append(salida)
+
+    # ENLACES DE FALLO POR RECORRIDO EN ANCHURA, CADA ESTADO HEREDA LAS SALIDAS DE SU ESTADO DE FALLO
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    # FUNCION PARA ENCONTRAR TODAS LAS COINCIDENCIAS: LISTA DE (INTENCION, PALABRA CLAVE, INICIO, FIN)
+    def find(self, text: str) -> list:
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        matches = []
+        for i, ch in enumerate(normalize_text(text)):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for intent, keyword, length in out[state]:
+                matches.append((intent, keyword, i - length + 1, i + 1))
+        return matches
+
+    # FUNCION PARA OBTENER SOLO EL CONJUNTO DE INTENCIONES PRESENTES EN EL MENSAJE
+    def intents(self, text: str) -> set:
+        return {match[0] for match in self.find(text)}
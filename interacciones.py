@@ -0,0 +1,192 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import metricas
+from db import conexiones
+
+logger = logging.getLogger(__name__)
+
+# CONTADOR DE INTERACCIONES POR USUARIO, DIA E INTENCION ("NUMERO DE INTERACCIONES" DEL README)
+# LOS HANDLERS SOLO SUMAN EN UN DICCIONARIO EN MEMORIA (record), NINGUN MENSAJE ESPERA UNA ESCRITURA EN SQLITE
+# UN HILO EN SEGUNDO PLANO VUELCA LO ACUMULADO A LA TABLA interacciones EN UNA SOLA TRANSACCION (UPSERT POR LOTES):
+# CADA ANALYTICS_FLUSH_INTERVAL_S SEGUNDOS, ANTES SI HAY ANALYTICS_FLUSH_MAX_PENDING CLAVES PENDIENTES, Y AL DETENER EL BOT (stop)
+# SI SQLITE FALLA LOS CONTEOS VUELVEN A LA MEMORIA Y SE REINTENTAN EN EL SIGUIENTE VOLCADO
+
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "1") == "1"
+ANALYTICS_FLUSH_INTERVAL_S = float(os.getenv("ANALYTICS_FLUSH_INTERVAL_S", "10"))
+ANALYTICS_FLUSH_MAX_PENDING = int(os.getenv("ANALYTICS_FLUSH_MAX_PENDING", "500"))
+
+SIN_INTENCION = "ninguna"
+
+_SQL_UPSERT = '''
+    INSERT INTO interacciones (telegram_id, dia, intent, cantidad, ultima)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (telegram_id, dia, intent) DO UPDATE SET
+        cantidad = cantidad + excluded.cantidad,
+        ultima = MAX(ultima, excluded.ultima)
+'''
+
+# (telegram_id, dia, intent) -> [CANTIDAD, ULTIMA INTERACCION (EPOCH)]
+_pendientes = defaultdict(lambda: [0, 0.0])
+_lock = threading.Lock()
+# SOLO UN VOLCADO A LA VEZ, ASI DOS HILOS NO ESCRIBEN EL MISMO LOTE
+_flush_lock = threading.Lock()
+_despertar = threading.Event()
+_detener = threading.Event()
+_hilo = None
+_stats = {"recorded": 0, "flushes": 0, "rows_written": 0, "flush_errors": 0, "last_flush_s": 0.0}
+
+# FUNCION PARA CONVERTIR LAS INTENCIONES DETECTADAS EN LA ETIQUETA QUE SE CUENTA ("saldo", "general+prestamo", "ninguna")
+# UN MENSAJE SUMA UNA SOLA INTERACCION AUNQUE COINCIDA CON VARIAS INTENCIONES
+def intent_label(intents) -> str:
+    return "+".join(sorted(intents)) or SIN_INTENCION
+
+# FUNCION QUE LLAMAN LOS HANDLERS: SOLO TOMA EL LOCK Y SUMA, NUNCA TOCA LA DB
+def record(telegram_id: int, intent: str):
+    if not ANALYTICS_ENABLED:
+        return
+    ahora = time.time()
+    with _lock:
+        pendiente = _pendientes[(telegram_id, date.today().isoformat(), intent)]
+        pendiente[0] += 1
+        pendiente[1] = ahora
+        _stats["recorded"] += 1
+        lleno = len(_pendientes) >= ANALYTICS_FLUSH_MAX_PENDING
+    if lleno:
+        # CON EL HILO EN MARCHA SOLO SE LO DESPIERTA, SIN EL (BENCHMARKS, SCRIPTS) SE VUELCA AQUI PARA NO CRECER SIN LIMITE
+        if _hilo is not None and _hilo.is_alive():
+            _despertar.set()
+        else:
+            flush()
+
+# FUNCION PARA VOLCAR LOS CONTEOS PENDIENTES A SQLITE, DEVUELVE LA CANTIDAD DE FILAS ESCRITAS
+# SE INTERCAMBIA EL DICCIONARIO BAJO EL LOCK Y SE ESCRIBE FUERA DE EL, LOS HANDLERS SIGUEN SUMANDO MIENTRAS TANTO
+def flush() -> int:
+    global _pendientes
+    with _flush_lock:
+        with _lock:
+            if not _pendientes:
+                return 0
+            lote, _pendientes = _pendientes, defaultdict(lambda: [0, 0.0])
+        filas = [(telegram_id, dia, intent, cantidad, ultima) for (telegram_id, dia, intent), (cantidad, ultima) in lote.items()]
+        inicio = time.perf_counter()
+        try:
+            with conexiones.get_connection() as conn:
+                conn.executemany(_SQL_UPSERT, filas)
+                conn.commit()
+        except sqlite3.Error as e:
+            _devolver(lote)
+            with _lock:
+                _stats["flush_errors"] += 1
+            logger.error(f"Error al guardar {len(filas)} contadores de interacciones, se reintentará: {e}")
+            return 0
+        duracion = time.perf_counter() - inicio
+        with _lock:
+            _stats["flushes"] += 1
+            _stats["rows_written"] += len(filas)
+            _stats["last_flush_s"] = duracion
+        metricas.observe("bot_analytics_flush_seconds", duracion)
+        return len(filas)
+
+def _devolver(lote: dict):
+    with _lock:
+        for clave, (cantidad, ultima) in lote.items():
+            pendiente = _pendientes[clave]
+            pendiente[0] += cantidad
+            pendiente[1] = max(pendiente[1], ultima)
+
+def pending_count() -> int:
+    with _lock:
+        return len(_pendientes)
+
+def analytics_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+        stats["pending_keys"] = len(_pendientes)
+    return stats
+
+def register_metrics():
+    metricas.register_gauge("bot_analytics_pending_keys", pending_count)
+
+# HILO EN SEGUNDO PLANO QUE VUELCA CADA interval_s SEGUNDOS O CUANDO record LO DESPIERTA POR TAMAÑO
+def start_flusher(interval_s: float = ANALYTICS_FLUSH_INTERVAL_S) -> threading.Thread:
+    global _hilo
+    if not ANALYTICS_ENABLED or (_hilo is not None and _hilo.is_alive()):
+        return _hilo
+    _detener.clear()
+
+    def _volcar():
+        while not _detener.is_set():
+            _despertar.wait(interval_s)
+            _despertar.clear()
+            flush()
+
+    _hilo = threading.Thread(target=_volcar, name="interacciones-flusher", daemon=True)
+    _hilo.start()
+    return _hilo
+
+# FUNCION PARA DETENER EL HILO Y HACER EL ULTIMO VOLCADO, LLAMAR ANTES DE conexiones.close_pool()
+def stop(timeout_s: float = 5.0) -> int:
+    global _hilo
+    _detener.set()
+    _despertar.set()
+    if _hilo is not None:
+        _hilo.join(timeout_s)
+        _hilo = None
+    escritas = flush()
+    if escritas:
+        logger.info(f"Se guardaron {escritas} contadores de interacciones pendientes al detener el bot.")
+    return escritas
+
+# --- CONSULTAS (USAN LA CLAVE PRIMARIA Y EL INDICE idx_interacciones_dia, SUMAN TAMBIEN LO QUE TODAVIA NO SE VOLCO) ---
+
+def _pendientes_donde(condicion) -> list:
+    with _lock:
+        return [(clave, cantidad) for clave, (cantidad, _) in _pendientes.items() if condicion(clave)]
+
+# TOTAL DE INTERACCIONES DEL USUARIO POR INTENCION, OPCIONALMENTE DESDE UNA FECHA ("YYYY-MM-DD")
+def user_totals(telegram_id: int, since: str = None) -> dict:
+    since = since or "0000-00-00"
+    with conexiones.get_connection() as conn:
+        filas = conn.execute('''
+            SELECT intent, SUM(cantidad) FROM interacciones
+            WHERE telegram_id = ? AND dia >= ?
+            GROUP BY intent
+        ''', (telegram_id, since)).fetchall()
+    totales = defaultdict(int, filas)
+    for (_, _, intent), cantidad in _pendientes_donde(lambda c: c[0] == telegram_id and c[1] >= since):
+        totales[intent] += cantidad
+    return dict(totales)
+
+def user_interaction_count(telegram_id: int, since: str = None) -> int:
+    return sum(user_totals(telegram_id, since).values())
+
+# TOTALES DE LOS ULTIMOS days DIAS: {dia: {"interacciones": N, "por_intencion": {intent: N}}}
+def daily_totals(days: int = 7) -> dict:
+    desde = (date.today() - timedelta(days=days - 1)).isoformat()
+    with conexiones.get_connection() as conn:
+        filas = conn.execute('''
+            SELECT dia, intent, SUM(cantidad) FROM interacciones
+            WHERE dia >= ?
+            GROUP BY dia, intent
+        ''', (desde,)).fetchall()
+    filas += [(dia, intent, cantidad) for (_, dia, intent), cantidad in _pendientes_donde(lambda c: c[1] >= desde)]
+    totales = {}
+    for dia, intent, cantidad in filas:
+        total_dia = totales.setdefault(dia, {"interacciones": 0, "por_intencion": defaultdict(int)})
+        total_dia["interacciones"] += cantidad
+        total_dia["por_intencion"][intent] += cantidad
+    return {dia: {"interacciones": t["interacciones"], "por_intencion": dict(t["por_intencion"])} for dia, t in sorted(totales.items())}
+
+# USUARIOS DISTINTOS QUE INTERACTUARON EN UN DIA ("YYYY-MM-DD", POR DEFECTO HOY)
+def daily_active_users(dia: str = None) -> int:
+    dia = dia or date.today().isoformat()
+    with conexiones.get_connection() as conn:
+        usuarios = {fila[0] for fila in conn.execute("SELECT DISTINCT telegram_id FROM interacciones WHERE dia = ?", (dia,))}
+    usuarios.update(telegram_id for (telegram_id, _, _), _ in _pendientes_donde(lambda c: c[1] == dia))
+    return len(usuarios)
@@ -1,12 +1,25 @@
+import arranque
 import telebot
 from telebot import types
-import google.generativeai as genai
 import os
 from dotenv import load_dotenv
 import logging
-from db import baseDatos
+import sys
+from db import baseDatos, conexiones, extractos, libroMayor, simuladorPrestamos
+import cache_respuestas
+import cache_usuarios
+import interacciones
+import sesiones
+import autenticacion
+import memoria_conversacion
+import metricas
+import planificador_llm
+import proveedor_llm
+import respuestas_stream
+from intenciones import IntentEngine
 import sqlite3
 from datetime import datetime
+arranque.marca("importaciones")
 
 
 load_dotenv()
@@ -16,36 +29,50 @@ API_KEY = os.getenv("GOOGLE_API_KEY")
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-if not TELEGRAM_TOKEN or not API_KEY:
-    print("¡Error! Asegúrate de que TELEGRAM_BOT_TOKEN y GOOGLE_API_KEY están definidos en tu archivo .env")
-    exit()
+# SIN CREDENCIALES EL MODULO SE PUEDE IMPORTAR IGUAL (PRUEBAS, BENCHMARKS), SE EXIGEN RECIEN AL INICIAR EL BOT
+def check_credentials():
+    if not TELEGRAM_TOKEN or not API_KEY:
+        print("¡Error! Asegúrate de que TELEGRAM_BOT_TOKEN y GOOGLE_API_KEY están definidos en tu archivo .env")
+        exit()
 
-bot = telebot.TeleBot(TELEGRAM_TOKEN)
+bot = metricas.instrument_bot(telebot.TeleBot(TELEGRAM_TOKEN or "", validate_token=bool(TELEGRAM_TOKEN)))
 logger.info("Bot de Telegram inicializado.")
 
-try:
-    genai.configure(api_key=API_KEY)
-    generation_config = {"temperature": 0.7, "top_p": 1, "top_k": 1, "max_output_tokens": 2048}
-    safety_settings = [
-        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_ONLY_HIGH"},
-        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_ONLY_HIGH"},
-        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_ONLY_HIGH"},
-        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_ONLY_HIGH"},
-    ]
-    model = genai.GenerativeModel(
-        model_name="gemini-1.5-flash-latest",
-        generation_config=generation_config,
-        safety_settings=safety_settings
-    )
-    logger.info("Modelo Gemini 'gemini-1.5-flash-latest' inicializado.")
-except Exception as e:
-    logger.error(f"Error al configurar o inicializar Gemini: {e}")
-    exit()
+# DATOS FIJOS DE PRODUCTOS: VAN EN LAS INSTRUCCIONES DEL MODELO Y LA RESPUESTA CUANDO GEMINI NO ESTA DISPONIBLE LOS REPITE
+PRODUCT_FACTS = """Tarjetas: "Valo Card" (débito nacional), "Mine Card" (crédito nacional), "Vault Card" (crédito internacional).
+        Tasa préstamo promedio Uruguay: ~35% TEA (varía).
+        Plazos fijos: en Pesos y Dólares, tasas competitivas."""
+
+# INSTRUCCIONES FIJAS DEL ASISTENTE: SE CONFIGURAN UNA SOLA VEZ EN EL MODELO (system_instruction) Y NO VIAJAN EN CADA PROMPT
+SYSTEM_PROMPT = f"""Eres un asistente amigable de IceCash, un banco de Uruguay.
+        Datos de nuestros productos:
+        {PRODUCT_FACTS}
+        Si no entiendes la pregunta o parece no estar relacionada con temas bancarios, puedes decir que no estás seguro de cómo ayudar con eso y recordar los temas principales sobre los que se puede consultar: información sobre nuestros productos (tarjetas, plazos fijos, tasas de interés) o cómo usar los comandos del bot. También se puede pedir ayuda con /help.
+        Si hay conversación anterior, úsala para entender preguntas de seguimiento.
+        Responde directamente al usuario con naturalidad."""
+
+# EL MODELO DE GEMINI SE CREA EN EL PRIMER USO (VER proveedor_llm.py), AQUI SOLO SE GUARDA LA CONFIGURACION
+# TODAS LAS LLAMADAS PASAN POR EL PLANIFICADOR (CUOTA, PRIORIDAD, REINTENTOS Y CIRCUIT BREAKER, VER planificador_llm.py)
+model = planificador_llm.LLMScheduler(proveedor_llm.GeminiProvider(API_KEY, system_instruction=SYSTEM_PROMPT)).register_metrics()
+memoria_conversacion.register_metrics()
+interacciones.register_metrics()
+arranque.marca("configuración (bot, proveedor de Gemini)")
 
+# FUNCION PARA ARRANCAR LOS HILOS EN SEGUNDO PLANO DEL PROCESO (LIMPIEZAS, VOLCADO DE INTERACCIONES, SNAPSHOTS Y METRICAS)
+# LA USAN main.py, bot_async.py Y CADA WORKER DE supervisor.py
+def start_background_services():
+    sesiones.start_cleaner(pending_pin_sessions)
+    memoria_conversacion.start_cleaner()
+    interacciones.start_flusher()
+    libroMayor.start_snapshotter()
+    metricas.start_from_env()
+
+# LAS CONEXIONES SE TOMAN PRESTADAS DEL POOL COMPARTIDO (WAL), USAR SIEMPRE COMO: with db_connect() as conn:
 def db_connect():
-    return sqlite3.connect('datos_del_usuario.db')
+    return conexiones.get_connection()
 
-user_action_pending_pin_verification = {}
+# SESIONES ESPERANDO PIN: telegram_id -> NOMBRE DE LA ACCION ("saldo" / "prestamo"), CON VENCIMIENTO
+pending_pin_sessions = sesiones.create_session_store()
 
 # COMANDO INICIAL DEL BOT GUARDARA AL USUARIO EN LA DB
 @bot.message_handler(commands=['start'])
@@ -53,60 +80,72 @@ def send_welcome(message):
     logger.info(f"Comando /start recibido de {message.from_user.username} (ID: {message.from_user.id})")
     telegram_id = message.from_user.id
     name = message.from_user.first_name
+    interacciones.record(telegram_id, "start")
     insert_user(telegram_id, name)
     bot.reply_to(message, f'¡Hola {message.from_user.first_name}! Bienvenido a IceCash su banco de confianza\nDime en que puedo ayudarte hoy.')
 
-@bot.message_handler(commands=['help'])
-def send_help(message):
-    logger.info(f"Comando /help recibido de {message.from_user.username}")
-    help_text = """
+HELP_TEXT = """
         Aquí tienes los comandos que entiendo:
         /start - Inicia la conversación.
         /setpin - Agrega un pin de 4 digitos a tu cuenta.
         Si me escribes cualquier otra cosa, intentaré ayudarte usando IA.
         """
-    bot.reply_to(message, help_text)
+
+@bot.message_handler(commands=['help'])
+def send_help(message):
+    logger.info(f"Comando /help recibido de {message.from_user.username}")
+    interacciones.record(message.from_user.id, "help")
+    bot.reply_to(message, HELP_TEXT)
 
 # FUNCION PARA INGRESAR AL USUARIO DENTRO DE LA DB
 def insert_user(telegram_id: int, name: str):
-    conn = db_connect()
-    cursor = conn.cursor()
     try:
-        cursor.execute('''
-            INSERT OR IGNORE INTO users (telegram_id, name)
-            VALUES (?, ?)
-        ''', (telegram_id, name))
-        conn.commit()
+        with db_connect() as conn:
+            conn.execute('''
+                INSERT OR IGNORE INTO users (telegram_id, name)
+                VALUES (?, ?)
+            ''', (telegram_id, name))
+            conn.commit()
         logger.info(f"Usuario {name} (ID: {telegram_id}) insertado o ya existente.")
     except sqlite3.Error as e:
         logger.error(f"Error al insertar usuario {telegram_id}: {e}")
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
+
+# MOVIMIENTOS QUE SE MUESTRAN JUNTO AL SALDO, EL RESTO SE PIDE CON "VER MAS" O SE EXPORTA
+ULTIMOS_MOVIMIENTOS = 5
 
 # FUNCION PARA OBTENER DE LA DB LOS DATOS DE LA CUENTA DEL USUARIO
 def get_user_accounts_info(telegram_id: int) -> str:
-    conn = db_connect()
-    cursor = conn.cursor()
+    return get_user_accounts_summary(telegram_id)[0]
+
+# DEVUELVE (RESUMEN, callback_data DE "VER MAS" DESDE EL ULTIMO MOVIMIENTO MOSTRADO O NONE SI NO HAY MAS)
+# LOS DOS SE GUARDAN JUNTOS EN LA CACHE, UNA CONSULTA REPETIDA DE SALDO NO TOCA LA DB NI PARA ARMAR EL BOTON
+def get_user_accounts_summary(telegram_id: int) -> tuple:
+    cached_summary = cache_usuarios.get_summary(cache_usuarios.RESUMEN_CUENTAS, telegram_id)
+    if cached_summary is not None:
+        return cached_summary
     info_parts = []
+    page_callback = None
     try:
-        cursor.execute('''
-            SELECT name, dinero, currency FROM cuentas WHERE telegram_id = ? 
-        ''', (telegram_id,))
-        cuentas = cursor.fetchall()
+        with db_connect() as conn:
+            cuentas = conn.execute('''
+                SELECT name, dinero, currency FROM cuentas WHERE telegram_id = ?
+            ''', (telegram_id,)).fetchall()
+            movimientos = conn.execute('''
+                SELECT c.name as account_name, h.name as mov_description, h.dinero as mov_amount, h.timestamp, h.id
+                FROM hmovimientos h
+                JOIN cuentas c ON h.account_id = c.id
+                WHERE h.telegram_id = ? ORDER BY h.timestamp DESC, h.id DESC LIMIT ?
+            ''', (telegram_id, ULTIMOS_MOVIMIENTOS + 1)).fetchall()
+        # LA FILA DE MAS SOLO INDICA QUE HAY SIGUIENTE PAGINA, EL CURSOR ES EL DEL ULTIMO MOVIMIENTO MOSTRADO
+        if len(movimientos) > ULTIMOS_MOVIMIENTOS:
+            movimientos = movimientos[:ULTIMOS_MOVIMIENTOS]
+            page_callback = extractos.encode_cursor(movimientos[-1][3], movimientos[-1][4])
         if cuentas:
             info_parts.append("Estado de tus cuentas:")
             for cuenta_data in cuentas: 
                 info_parts.append(f"- {cuenta_data[0]}: ${cuenta_data[1]:.2f} {cuenta_data[2] or ''}")
         else:
             info_parts.append("No tienes cuentas registradas actualmente.")
-        cursor.execute('''
-            SELECT c.name as account_name, h.name as mov_description, h.dinero as mov_amount, h.timestamp 
-            FROM hmovimientos h
-            JOIN cuentas c ON h.account_id = c.id
-            WHERE h.telegram_id = ? ORDER BY h.timestamp DESC LIMIT 5 
-        ''', (telegram_id,))
-        movimientos = cursor.fetchall()
         if movimientos:
             info_parts.append("\nTus últimos movimientos:")
             for mov in movimientos:
@@ -116,22 +155,49 @@ def get_user_accounts_info(telegram_id: int) -> str:
             info_parts.append("\nNo tienes movimientos recientes.")
     except sqlite3.Error as e:
         logger.error(f"Error al obtener datos de cuentas/movimientos para {telegram_id}: {e}")
-        return "Hubo un error al consultar tu información de cuentas."
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    return "\n".join(info_parts) if info_parts else "No se encontró información de cuentas o movimientos."
+        return "Hubo un error al consultar tu información de cuentas.", None
+    summary = "\n".join(info_parts) if info_parts else "No se encontró información de cuentas o movimientos."
+    cache_usuarios.store_summary(cache_usuarios.RESUMEN_CUENTAS, telegram_id, (summary, page_callback))
+    return summary, page_callback
+
+# FUNCION PARA ARMAR LOS BOTONES DEL EXTRACTO: "VER MAS" (CON EL CURSOR DE LA SIGUIENTE PAGINA) Y "EXPORTAR"
+def statement_keyboard(page_callback: str = None) -> types.InlineKeyboardMarkup:
+    markup = types.InlineKeyboardMarkup()
+    buttons = []
+    if page_callback:
+        buttons.append(types.InlineKeyboardButton("Ver más movimientos", callback_data=page_callback))
+    buttons.append(types.InlineKeyboardButton("Exportar extracto (CSV)", callback_data=extractos.CALLBACK_EXPORT))
+    markup.row(*buttons)
+    return markup
+
+# FUNCION PARA OBTENER UNA PAGINA DEL EXTRACTO, DEVUELVE (TEXTO, BOTONES), cursor ES NONE PARA LA PRIMERA PAGINA
+def get_statement_page(telegram_id: int, cursor=None) -> tuple:
+    try:
+        with db_connect() as conn:
+            filas, next_cursor = extractos.fetch_page(conn, telegram_id, cursor)
+    except sqlite3.Error as e:
+        logger.error(f"Error al obtener una página del extracto para {telegram_id}: {e}")
+        return "Hubo un error al consultar tus movimientos.", None
+    page_callback = extractos.encode_cursor(*next_cursor) if next_cursor else None
+    return extractos.format_page(filas, cursor is None), statement_keyboard(page_callback)
+
+# FUNCION PARA GENERAR EL EXTRACTO COMPLETO EN CSV, DEVUELVE (ARCHIVO, CANTIDAD DE MOVIMIENTOS, BYTES), EL LLAMADOR CIERRA EL ARCHIVO
+# LA CONEXION SE DEVUELVE AL POOL APENAS SE TERMINA DE ESCRIBIR EL ARCHIVO, ANTES DE SUBIRLO A TELEGRAM
+def export_statement(telegram_id: int) -> tuple:
+    with db_connect() as conn:
+        return extractos.export_csv(conn, telegram_id)
 
 # FUNCION PARA OBTENER DE LA DB LOS DATOS DE LOS PRESTAMOS DEL USUARIO
 def get_user_loans_info(telegram_id: int) -> str:
-    conn = db_connect()
-    cursor = conn.cursor()
+    cached_summary = cache_usuarios.get_summary(cache_usuarios.RESUMEN_PRESTAMOS, telegram_id)
+    if cached_summary is not None:
+        return cached_summary
     info_parts = []
     try:
-        cursor.execute('''
-            SELECT name, dinero, dineroEntregado, due_date FROM prestamos WHERE telegram_id = ?
-        ''', (telegram_id,)) 
-        prestamos = cursor.fetchall()
+        with db_connect() as conn:
+            prestamos = conn.execute('''
+                SELECT name, dinero, dineroEntregado, due_date FROM prestamos WHERE telegram_id = ?
+            ''', (telegram_id,)).fetchall()
         if prestamos:
             info_parts.append("Tus préstamos activos:")
             for p in prestamos:
@@ -146,41 +212,62 @@ def get_user_loans_info(telegram_id: int) -> str:
     except sqlite3.Error as e:
         logger.error(f"Error al obtener datos de préstamos para {telegram_id}: {e}")
         return "Hubo un error al consultar tu información de préstamos."
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    
-    return "\n".join(info_parts) if info_parts else "No se encontró información de préstamos."
+
+    summary = "\n".join(info_parts) if info_parts else "No se encontró información de préstamos."
+    cache_usuarios.store_summary(cache_usuarios.RESUMEN_PRESTAMOS, telegram_id, summary)
+    return summary
+
+# FUNCION PARA OBTENER EL PIN (HASH) GUARDADO DEL USUARIO (NONE SI NO EXISTE O NO TIENE PIN)
+# SE GUARDA UNOS MINUTOS EN MEMORIA PARA QUE PEDIR EL PIN Y VERIFICARLO CUESTE UNA SOLA CONSULTA
+def get_user_pin(telegram_id: int):
+    stored_pin = autenticacion.get_cached_pin(telegram_id)
+    if stored_pin is not None:
+        return stored_pin
+    with db_connect() as conn:
+        result = conn.execute("SELECT pin FROM users WHERE telegram_id = ?", (telegram_id,)).fetchone()
+    stored_pin = result[0] if result else None
+    if stored_pin:
+        autenticacion.cache_pin(telegram_id, stored_pin)
+    return stored_pin
 
 # FUNCION PARA COMPROBAR QUE EL PIN QUE ENVIO EL USUARIO ES EL PIN DE SU CUENTA EN LA DB
-def check_pin(telegram_id: int, entered_pin: str) -> bool:
-    conn = db_connect()
-    cursor = conn.cursor()
+# SI ES CORRECTO SE LE ABRE UNA SESION VERIFICADA, SI NO SE SUMA UN INTENTO FALLIDO
+# LOS PINES VIEJOS EN TEXTO PLANO SE GUARDAN HASHEADOS LA PRIMERA VEZ QUE SE VERIFICAN
+def check_pin(telegram_id: int, entered_pin: str, stored_pin: str = None) -> bool:
     try:
-        cursor.execute("SELECT pin FROM users WHERE telegram_id = ?", (telegram_id,))
-        result = cursor.fetchone()
-        if result and result[0] is not None: 
-            stored_pin = result[0]
-            return stored_pin == entered_pin
-        elif result and result[0] is None: 
+        if stored_pin is None:
+            stored_pin = get_user_pin(telegram_id)
+        if not stored_pin:
             logger.warning(f"Usuario {telegram_id} intentó verificar PIN pero no tiene uno configurado.")
-            return False 
-        else: 
-            logger.error(f"Usuario {telegram_id} no encontrado al verificar PIN.")
             return False
+        if not autenticacion.verify_pin(stored_pin, entered_pin):
+            failures = autenticacion.register_failure(telegram_id)
+            metricas.inc("bot_pin_outcomes_total", outcome="incorrecto")
+            logger.warning(f"PIN incorrecto para {telegram_id} (intento fallido {failures}).")
+            return False
+        if not autenticacion.is_hashed(stored_pin):
+            update_user_pin(telegram_id, entered_pin)
+        autenticacion.reset_failures(telegram_id)
+        autenticacion.grant_session(telegram_id)
+        metricas.inc("bot_pin_outcomes_total", outcome="correcto")
+        return True
     except sqlite3.Error as e:
         logger.error(f"Error de BD al verificar PIN para {telegram_id}: {e}")
         return False
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
+
+# FUNCION PARA GUARDAR EL NUEVO PIN (HASHEADO) EN LA DB, DEVUELVE FALSE SI EL USUARIO NO EXISTE
+def update_user_pin(telegram_id: int, new_pin: str) -> bool:
+    with db_connect() as conn:
+        cursor = conn.execute("UPDATE users SET pin = ? WHERE telegram_id = ?", (autenticacion.hash_pin(new_pin), telegram_id))
+        conn.commit()
+    autenticacion.forget_pin(telegram_id)
+    return cursor.rowcount > 0
 
 # FUNCION PARA ASIGNAR UN NUEVO PIN O MODIFICAR EL PIN DEL USUARIO
 @bot.message_handler(commands=['setpin'])
 def set_pin_command(message):
     telegram_id = message.from_user.id
-    conn = None 
-    cursor = None
+    interacciones.record(telegram_id, "setpin")
     try:
         new_pin_parts = message.text.split(maxsplit=1)
         if len(new_pin_parts) < 2:
@@ -190,11 +277,7 @@ def set_pin_command(message):
         if not new_pin.isdigit() or len(new_pin) != 4:
             bot.reply_to(message, "El PIN debe ser numérico y de 4 dígitos. Ejemplo: `/setpin 1234`")
             return
-        conn = db_connect()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE users SET pin = ? WHERE telegram_id = ?", (new_pin, telegram_id))
-        conn.commit()
-        if cursor.rowcount > 0:
+        if update_user_pin(telegram_id, new_pin):
             bot.reply_to(message, f"¡Tu PIN ha sido configurado/actualizado a {new_pin}!")
             logger.info(f"PIN actualizado para usuario {telegram_id}")
         else:
@@ -205,21 +288,119 @@ def set_pin_command(message):
     except Exception as e: 
         logger.error(f"Error inesperado al configurar PIN: {e}")
         bot.reply_to(message, "Ocurrió un error inesperado.")
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
 
 # PALABRAS CLAVE QUE SE BUSCARAN EN EL MENSAJE DEL USUARIO PARA DETERMINAR SI QUIERE ACCEDER A SUS DATOS O QUIERE CONSULTAR COSAS EN GENERAL
 keywords_saldo = ["saldo", "cuánto tengo", "en mi cuenta", "últimos movimientos", "movimientos", "estado de cuenta", "balance",  "ver mi saldo", "consultar saldo", "mostrar saldo", "qué saldo tengo",
-    "ver movimientos", "consultar movimientos", "mostrar movimientos", "historial de cuenta","detalle de mi cuenta", "actividad de cuenta", "transacciones recientes","dinero en cuenta", "plata en cuenta", ]
+    "ver movimientos", "consultar movimientos", "mostrar movimientos", "historial de cuenta","detalle de mi cuenta", "extracto", "actividad de cuenta", "transacciones recientes","dinero en cuenta", "plata en cuenta", ]
 keywords_prestamo = ["préstamo", "prestamos", "mis prestamos", "ver prestamos", "estado de mi préstamo", "cuánto debo", "deuda préstamo", "préstamos activos"]
 keywords_generales = ["tarjetas ofrecen", "conviene un plazo fijo", "cuál es la tasa para préstamos personales", "información general", "productos bancarios", "general", "tipos de tarjeta", "tarjeta de débito", "tarjeta de crédito", "beneficios tarjeta",
     "costo tarjeta", "comisiones tarjeta", "tarjeta internacional", "tarjeta nacional", "tasas de interés", "tasas plazo fijo", ]
+keywords_simulacion = ["cuánto pagaría", "cuánto pagaria", "si pido", "simular préstamo", "simulación de préstamo", "simular un préstamo", "necesito un préstamo", "quiero un préstamo",
+    "pedir un préstamo", "sacar un préstamo", "cuota estimada", ]
+
+# FUNCION PARA SIMULAR UN PRESTAMO CON EL MONTO Y PLAZO DEL MENSAJE, LA TASA DEPENDE DEL PERFIL DEL USUARIO (NO USA GEMINI NI PIN)
+def get_loan_simulation(telegram_id: int, user_input: str) -> str:
+    amount, term = simuladorPrestamos.parse_loan_request(user_input)
+    try:
+        with db_connect() as conn:
+            profile = simuladorPrestamos.rate_profile_for_user(conn, telegram_id)
+    except sqlite3.Error as e:
+        logger.error(f"Error al obtener el perfil de tasa para {telegram_id}: {e}")
+        profile = "estandar"
+    simulation = simuladorPrestamos.format_simulation(amount or simuladorPrestamos.MONTO_POR_DEFECTO, term, profile)
+    if amount is None:
+        simulation += "\nPara simular otro monto escribe, por ejemplo: ¿Cuánto pagaría si pido 100.000 en 24 cuotas?"
+    return simulation
 
-# FUNCION PARA HACER QUE EL MENSAJE DEL USUARIO SEA MINUSCULA, LUEGO COMPRUEBA SI LAS PALABRAS CLAVE ESTAN EN EL MENSAJE O NO 
-def check_keywords(text: str, keywords: list) -> bool:
-    text_lower = text.lower()
-    return any(keyword.lower() in text_lower for keyword in keywords)
+# ACCIONES QUE REQUIEREN PIN, LA SESION PENDIENTE GUARDA SOLO EL NOMBRE Y AQUI SE RESUELVE LA FUNCION
+PIN_PROTECTED_ACTIONS = {
+    "saldo": get_user_accounts_info,
+    "prestamo": get_user_loans_info,
+}
+
+# FUNCION PARA EJECUTAR UNA ACCION CON PIN, DEVUELVE (TEXTO, BOTONES)
+# EL SALDO MUESTRA SOLO ULTIMOS_MOVIMIENTOS Y LLEVA LOS BOTONES DEL EXTRACTO ("VER MAS" CONTINUA DESDE EL ULTIMO MOSTRADO)
+def run_protected_action(action: str, telegram_id: int) -> tuple:
+    if action == "saldo":
+        summary, page_callback = get_user_accounts_summary(telegram_id)
+        return summary, statement_keyboard(page_callback)
+    return PIN_PROTECTED_ACTIONS[action](telegram_id), None
+
+# MOTOR DE INTENCIONES COMPILADO UNA SOLA VEZ AL INICIAR, UNA PASADA POR MENSAJE DEVUELVE TODAS LAS INTENCIONES (SIN IMPORTAR TILDES)
+intent_engine = IntentEngine({
+    "saldo": keywords_saldo,
+    "prestamo": keywords_prestamo,
+    "general": keywords_generales,
+    "simulacion": keywords_simulacion,
+})
+
+# FUNCION PARA DETECTAR LAS INTENCIONES DEL MENSAJE Y CONTARLAS EN LAS METRICAS
+def detect_intents(user_input: str) -> set:
+    intents = intent_engine.intents(user_input)
+    for intent in intents or ("ninguna",):
+        metricas.inc("bot_intent_matches_total", intent=intent)
+    return intents
+
+# RESPUESTA FIJA CUANDO GEMINI NO ESTA DISPONIBLE (CIRCUIT BREAKER ABIERTO O COLA LLENA)
+LLM_UNAVAILABLE_MESSAGE = """En este momento nuestro asistente está con mucha demanda, pero te dejo la información principal de IceCash:
+- Valo Card: tarjeta de débito nacional.
+- Mine Card: tarjeta de crédito nacional.
+- Vault Card: tarjeta de crédito internacional.
+- Préstamos: tasa promedio de ~35% TEA (varía según tu perfil). Puedes simular uno escribiendo, por ejemplo: ¿Cuánto pagaría si pido 100.000 en 24 cuotas?
+- Plazos fijos en Pesos y Dólares con tasas competitivas.
+Para otras consultas intenta de nuevo en unos minutos."""
+
+# FUNCION PARA ARMAR EL PROMPT DE GEMINI SEGUN EL TIPO DE CONSULTA (GENERAL SOBRE PRODUCTOS O FALLBACK)
+# history ES LA CONVERSACION RECIENTE DEL USUARIO YA ACOTADA POR memoria_conversacion.build_history
+def build_prompt(user_input: str, user_info: str, is_general_question: bool, history: str = "") -> str:
+    conversacion = f"""
+        Conversación anterior con este usuario:
+        {history}
+        """ if history else ""
+    # CONSULTA SOBRE COSAS FINANCIERAS EN GENERAL O INTERACION CON EL BOT
+    if is_general_question:
+        logger.info(f"Palabra clave GENERAL detectada para '{user_input}' de {user_info}.")
+        return f"""{conversacion}
+        Un usuario ({user_info}) te ha enviado el siguiente mensaje: "{user_input}"
+        Tu tarea es responder a su consulta general sobre productos o servicios bancarios.
+        """
+    logger.info(f"Input '{user_input}' de {user_info} no coincide con categorías específicas. Usando prompt de FALLBACK.")
+    return f"""{conversacion}
+        Un usuario ({user_info}) te ha enviado el siguiente mensaje: "{user_input}"
+        Tu tarea es responder a la consulta del usuario de forma útil y CONCISA.
+        Si la pregunta es muy general o no encaja en categorías específicas, intenta ser útil o pide que reformule.
+        Anímale a preguntar.
+        """
+
+GEMINI_ERROR_MESSAGE = "Lo siento, ocurrió un error inesperado grave al procesar tu mensaje con la IA.\nIntenta de nuevo más tarde."
+
+# FUNCION PARA CONVERTIR LA RESPUESTA DE GEMINI EN EL TEXTO QUE SE LE ENVIA AL USUARIO
+# DEVUELVE (TEXTO, ES_VALIDA), SI LA RESPUESTA FUE BLOQUEADA O VINO VACIA EL TEXTO ES EL AVISO CORRESPONDIENTE
+def gemini_reply_text(response, user_info: str, prompt_content: str) -> tuple:
+    ai_full_response = ""
+    if response.candidates and response.candidates[0].finish_reason.name == "STOP":
+        if response.candidates[0].content and response.candidates[0].content.parts:
+            for part in response.candidates[0].content.parts:
+                if hasattr(part, 'text'):
+                    ai_full_response += part.text
+    else:
+        reason = "UNKNOWN"
+        safety_details_str = "No safety details available."
+        if response.candidates and response.candidates[0].finish_reason:
+            reason = response.candidates[0].finish_reason.name
+            if reason == "SAFETY" and response.candidates[0].safety_ratings:
+                blocked_ratings = [
+                    f"{sr.category.name.replace('HARM_CATEGORY_', '')}: {sr.probability.name}"
+                    for sr in response.candidates[0].safety_ratings if sr.blocked
+                ]
+                safety_details_str = "Bloqueado por: " + ", ".join(blocked_ratings) if blocked_ratings else "Bloqueado por seguridad."
+        logger.warning(f"Gemini no generó contenido válido para {user_info}. Razón: {reason}. Detalles: {safety_details_str}")
+        return f"Mi intento de respuesta fue bloqueado ({safety_details_str}). Por favor, intenta reformular tu pregunta.", False
+    if ai_full_response:
+        logger.info(f"Respuesta de Gemini (consulta general) generada para {user_info}.")
+        return ai_full_response, True
+    logger.warning(f"Gemini generó una respuesta vacía para {user_info}. Prompt: {prompt_content[:200]}")
+    return "No pude generar una respuesta para eso en este momento, ¿podrías intentarlo de nuevo o reformular tu pregunta?", False
 
 # NUCLEO CENTRAL DEL BOT, GENERA LAS RESPUESTAS EN FUNCION DE LOS FILTROS (SI QUIERE SUS DATOS DE LA DB SALDO/PRESTAMO, SI QUIERE INFO GENERAL U OTROS)
 @bot.message_handler(func=lambda message: not message.text.startswith('/'))
@@ -239,42 +420,42 @@ def handle_non_command_message(message):
     ###################
 
     # VERIFICAMOS SI EL MENSAJE DEL USUARIO ES NUMERO, DE SER NUMERO Y TENER 4 DIGITOS ASUMIMOS QUE ES UN PIN
-    # COMPROBAMOS SI EL USUARIO TIENE ALGUNA FUNCION ESPERANDO UN PIN PARA EJECUTARSE
-    if user_input.isdigit() and len(user_input) == 4 and telegram_id in user_action_pending_pin_verification:
+    # COMPROBAMOS SI EL USUARIO TIENE ALGUNA ACCION (NO VENCIDA) ESPERANDO UN PIN PARA EJECUTARSE
+    pending_action = pending_pin_sessions.pop(telegram_id) if user_input.isdigit() and len(user_input) == 4 else None
+    if pending_action in PIN_PROTECTED_ACTIONS:
         logger.info(f"Usuario {user_info} envió un posible PIN: '{user_input}'")
+        interacciones.record(telegram_id, "pin")
         entered_pin = user_input
-        function_to_call = user_action_pending_pin_verification.pop(telegram_id) 
-        conn_pin_check = None
-        cursor_pin_check = None
         logger.info("--- DENTRO DE handle_non_command_message ---")
 
-        # INTENTAMOS EXTRAER EL PIN DEL USUARIO DE LA DB
+        # SI EL USUARIO FALLO DEMASIADAS VECES NO SE VERIFICA NADA HASTA QUE TERMINE EL BLOQUEO
+        lockout_s = autenticacion.lockout_remaining(telegram_id)
+        if lockout_s:
+            metricas.inc("bot_pin_outcomes_total", outcome="bloqueado")
+            bot.reply_to(message, f"Demasiados intentos fallidos. Por seguridad, intenta de nuevo en {int(lockout_s // 60) + 1} minuto(s).")
+            return
+
+        # INTENTAMOS EXTRAER EL PIN DEL USUARIO (UNA SOLA CONSULTA, O NINGUNA SI YA SE LEYO AL PEDIRLO)
         try:
-            conn_pin_check = db_connect()
-            cursor_pin_check = conn_pin_check.cursor()
-            cursor_pin_check.execute("SELECT pin FROM users WHERE telegram_id = ?", (telegram_id,))
-            user_db_data = cursor_pin_check.fetchone() 
-            logger.info(f"DEBUG PIN BLOCK: user_db_data para {telegram_id} es: {user_db_data}") 
+            stored_pin = get_user_pin(telegram_id)
             # SI EL USUARIO NO EXISTE O NO TIENE PIN, CORTAMOS EL FLUJO AQUI Y PEDIMOS QUE CONFIGURE UNO
-            if not user_db_data or not user_db_data[0]:
+            if not stored_pin:
+                metricas.inc("bot_pin_outcomes_total", outcome="sin_pin")
                 bot.reply_to(message, "Parece que no uso el comando /start para iniciar o no tienes un PIN configurado. Por favor, usa el comando `/setpin TU_PIN_DE_4_DIGITOS` para crear uno.")
                 return
-            # SI EL USUARIO TIENE PIN LLAMAREMOS LA FUNCION CHECK_PIN PARA VERIFICARLO
-            elif check_pin(telegram_id, entered_pin): 
+            # SI EL USUARIO TIENE PIN LLAMAREMOS LA FUNCION CHECK_PIN PARA VERIFICARLO CON EL PIN YA LEIDO
+            elif check_pin(telegram_id, entered_pin, stored_pin): 
                 bot.send_message(message.chat.id, "PIN correcto. Accediendo a tu información...")
-                db_data_message = function_to_call(telegram_id)
+                db_data_message, reply_markup = run_protected_action(pending_action, telegram_id)
                 if db_data_message:
-                    bot.send_message(message.chat.id, db_data_message)
+                    bot.send_message(message.chat.id, db_data_message, reply_markup=reply_markup)
                 else:
                     bot.send_message(message.chat.id, "No pude recuperar la información solicitada en este momento.")
             else:
                 bot.send_message(message.chat.id, "PIN incorrecto. Por seguridad, no se mostrará la información.")
-        except Exception as e_handler_init:
+        except Exception as e_pin_processing:
             logger.error(f"Error procesando el PIN ingresado para {user_info}: {e_pin_processing}", exc_info=True)
             bot.reply_to(message, "Ocurrió un error al verificar tu PIN. Intenta de nuevo.")
-        finally:
-            if cursor_pin_block: cursor_pin_block.close() 
-            if conn_pin_block: conn_pin_block.close()
         logger.info(f"--- FIN (procesado como PIN) handle_non_command_message para input: '{user_input}' de {user_info} ---")
         return 
     logger.info(f"Mensaje no-comando (consulta regular) recibido de {user_info}: '{user_input}'")
@@ -286,19 +467,28 @@ def handle_non_command_message(message):
     # SI EL FLUJO LLEGO AQUI ES PORQUE EL MENSAJE NO ES UN PIN, ES UN MENSAJE DE TEXTO INTERPRETABLE
     # SETEAMOS LA VARIABLE DE FUNCION A EJECUTAR LUEGO DEL PIN COMO NONE YA QUE EL MENSAJE ES NORMAL, Y PIN REQUERIDO EN FALSO
     logger.info(f"Input NO es un PIN directo. Procesando como consulta regular: '{user_input}'") 
+    action_after_pin = None
     function_to_execute_after_pin = None
     is_pin_required_action = False
+    intents = detect_intents(user_input)
+    interacciones.record(telegram_id, interacciones.intent_label(intents))
+
+    # SIMULACION DE PRESTAMO ("¿CUANTO PAGARIA SI PIDO 100.000 EN 24 CUOTAS?"), SE CALCULA AQUI MISMO SIN PIN NI GEMINI
+    if "simulacion" in intents or ("prestamo" in intents and simuladorPrestamos.is_simulation_request(user_input)):
+        logger.info(f"Simulación de préstamo solicitada por {user_info}: '{user_input}'")
+        bot.reply_to(message, get_loan_simulation(telegram_id, user_input))
+        return
 
     # YA QUE EL MENSAJE NO ES UN PIN COMPROBAREMOS SI EL MENSAJE ESTA EN EL CONTEXTO DE SALDOS/MOVIMIENTOS O PRESTAMOS
     # SI EL MENSAJE DEL USUARIO HACE REFERENCIA A ALGUNO DE LOS CONTEXTOS ANTERIORMENTE NOMB, 
     # ACTIVAREMOS LA FUNCION A EJ LUEGO Y EL PIN REQUERIDO EN TRUE EN SU CORRESPONDIENTE (SALDO/MOV O PRESTAMO)
-    if check_keywords(user_input, keywords_saldo):
+    if "saldo" in intents:
         logger.info(f"Palabra clave de SALDO detectada para '{user_input}' de {user_info}.")
-        function_to_execute_after_pin = get_user_accounts_info
+        action_after_pin = "saldo"
         is_pin_required_action = True
-    elif check_keywords(user_input, keywords_prestamo):
+    elif "prestamo" in intents:
         logger.info(f"Palabra clave de PRÉSTAMO detectada para '{user_input}' de {user_info}.")
-        function_to_execute_after_pin = get_user_loans_info
+        action_after_pin = "prestamo"
         is_pin_required_action = True
 
     ###################
@@ -308,20 +498,24 @@ def handle_non_command_message(message):
     # AHORA VERIFICAREMOS SI EN EL IF ANTERIOR SE ACTIVO EL PIN REQUERIDO O NO
     # SI NO SE ACTIVO SALTAREMOS ESTE IF ENTERO
     if is_pin_required_action:
+        function_to_execute_after_pin = PIN_PROTECTED_ACTIONS[action_after_pin]
         logger.info(f"Acción '{function_to_execute_after_pin.__name__ if function_to_execute_after_pin else 'N/A'}' requiere PIN para {user_info}.")
-        conn_check_has_pin = None
-        cursor_check_has_pin = None
+        # SI EL USUARIO YA INGRESO SU PIN HACE POCO TIENE UNA SESION VERIFICADA Y NO SE LE VUELVE A PEDIR
+        if autenticacion.is_verified(telegram_id):
+            logger.info(f"Usuario {user_info} con sesión verificada, se omite el PIN.")
+            metricas.inc("bot_pin_outcomes_total", outcome="sesion_verificada")
+            db_data_message, reply_markup = run_protected_action(action_after_pin, telegram_id)
+            bot.send_message(message.chat.id, db_data_message or "No pude recuperar la información solicitada en este momento.",
+                             reply_markup=reply_markup)
+            return
         try:
-            # CONECTAMOS CON LA DB, EXTRAEMOS EL PIN DE LA DB, LO GUARDAMOS PARA VERIFICAR LUEGO
-            conn_check = db_connect()
-            cursor_check = conn_check.cursor()
-            cursor_check.execute("SELECT pin FROM users WHERE telegram_id = ?", (telegram_id,))
-            user_has_pin_data = cursor_check.fetchone()
+            # TOMAMOS UNA CONEXION DEL POOL, EXTRAEMOS EL PIN DE LA DB, LO GUARDAMOS PARA VERIFICAR LUEGO
+            user_has_pin = get_user_pin(telegram_id)
             # VERIFICAMOS SI EL USUARIO EXISTE Y SI TIENE UN PIN
             # EL BOT SOLICITARA EL PIN Y LO LOGEARA SI EXISTE UNA FUNCION A EJECUTARSE LUEGO DEL PIN
-            if user_has_pin_data and user_has_pin_data[0]: 
+            if user_has_pin: 
                 bot.send_message(message.chat.id, "Por seguridad, por favor, envía tu PIN de 4 dígitos para continuar.")
-                user_action_pending_pin_verification[telegram_id] = function_to_execute_after_pin
+                pending_pin_sessions.set(telegram_id, action_after_pin)
                 if function_to_execute_after_pin: 
                     logger.info(f"Usuario {user_info} puesto en espera de PIN para {function_to_execute_after_pin.__name__}.")
             else: 
@@ -330,8 +524,6 @@ def handle_non_command_message(message):
                 logger.error(f"Error preparando para pedir PIN para {user_info}: {e_prepare_pin}", exc_info=True)
                 bot.reply_to(message, "Hubo un problema al preparar la consulta. Intenta de nuevo.")
         finally:
-            if cursor_check_has_pin: cursor_check_has_pin.close()
-            if conn_check_has_pin: conn_check_has_pin.close()
             logger.info(f"--- FIN (acción requiere PIN, se solicitó o se indicó configurar) handle_non_command_message para input: '{user_input}' de {user_info} ---")
             return
 
@@ -341,78 +533,123 @@ def handle_non_command_message(message):
 
     # SI NO FUE REQUERIDO EL PIN EL FLUJO NOS TRAERA AQUI, SE CREAN LOS PROMPT PARA CONSULTAS GENERALES O INTERACCION CON EL BOT
     logger.info(f"Acción para '{user_input}' de {user_info} NO requiere PIN. Procediendo con Gemini.")
-    prompt_content = "" 
-    
-    # CONSULTA SOBRE COSAS FINANCIERAS EN GENERAL O INTERACION CON EL BOT
-    if check_keywords(user_input, keywords_generales):
-        logger.info(f"Palabra clave GENERAL detectada para '{user_input}' de {user_info}.")
-        prompt_content = f"""
-        Eres un asistente amigable de IceCash.
-        Un usuario ({user_info}) te ha enviado el siguiente mensaje: "{user_input}"
-        Tu tarea es responder a su consulta general sobre productos o servicios bancarios.
-        Tarjetas: "Valo Card" (débito nacional), "Mine Card" (crédito nacional), "Vault Card" (crédito internacional).
-        Tasa préstamo promedio Uruguay: ~35% TEA (varía).
-        Plazos fijos: en Pesos y Dólares, tasas competitivas.
-        Responde directamente al usuario con naturalidad.
-        """
-    else:
-        logger.info(f"Input '{user_input}' de {user_info} no coincide con categorías específicas. Usando prompt de FALLBACK.")
-        prompt_content = f"""
-        Eres un asistente amigable de IceCash.
-        Un usuario ({user_info}) te ha enviado el siguiente mensaje: "{user_input}"
-        Tu tarea es responder a la consulta del usuario de forma útil y CONCISA.
-        Si no entiendes la pregunta o parece no estar relacionada con temas bancarios, puedes decirle que no estás seguro de cómo ayudar con eso y recordarle los temas principales sobre los que puede consultar: información sobre nuestros productos (tarjetas, plazos fijos, tasas de interés) o cómo usar los comandos del bot. También puede pedir ayuda con /help.
-        Si la pregunta es muy general o no encaja en categorías específicas, intenta ser útil o pide que reformule.
-        Anímale a preguntar. Responde directamente al usuario con naturalidad.
-        """
+
+    # LAS CONSULTAS GENERALES SE RESPONDEN DESDE LA CACHE SI ALGUIEN YA HIZO LA MISMA PREGUNTA
+    is_general_question = "general" in intents
+    if is_general_question:
+        cached_answer = cache_respuestas.get_cached_answer(user_input, user_info)
+        if cached_answer:
+            logger.info(f"Respuesta general servida desde la cache para {user_info}.")
+            bot.reply_to(message, cached_answer)
+            memoria_conversacion.add_exchange(telegram_id, user_input, cached_answer)
+            return
+    # LA CONVERSACION RECIENTE DEL USUARIO VA EN EL PROMPT, ACOTADA A CONVERSATION_TOKEN_BUDGET TOKENS
+    history, history_tokens = memoria_conversacion.build_history(telegram_id)
+    prompt_content = build_prompt(user_input, user_info, is_general_question, history)
+    prompt_tokens = memoria_conversacion.record_prompt(prompt_content, history_tokens)
+    logger.info(f"Prompt para {user_info}: ~{prompt_tokens} tokens ({history_tokens} de historial).")
+
     # ENVIAMOS EL PROMPT A LA INTELIGENCIA ARTIFICIAL PARA QUE GENERE SU RESPUESTA EN CONSECUENCIA
     if prompt_content:
         logger.info(f"Enviando a Gemini para {user_info} con prompt (primeros 200 chars): {prompt_content[:200]}...")
         try:
-            response = model.generate_content(prompt_content)
-            ai_full_response = ""
-            if response.candidates and response.candidates[0].finish_reason.name == "STOP":
-                if response.candidates[0].content and response.candidates[0].content.parts:
-                    for part in response.candidates[0].content.parts:
-                        if hasattr(part, 'text'):
-                            ai_full_response += part.text
+            # EN MODO STREAMING EL USUARIO VE EL TEXTO A MEDIDA QUE GEMINI LO GENERA
+            if respuestas_stream.STREAMING_REPLIES:
+                reply_text, is_valid_answer = respuestas_stream.stream_reply(bot, message, model, prompt_content, user_info, gemini_reply_text)
             else:
-                reason = "UNKNOWN"
-                safety_details_str = "No safety details available."
-                if response.candidates and response.candidates[0].finish_reason:
-                    reason = response.candidates[0].finish_reason.name
-                    if reason == "SAFETY" and response.candidates[0].safety_ratings:
-                        blocked_ratings = [
-                            f"{sr.category.name.replace('HARM_CATEGORY_', '')}: {sr.probability.name}"
-                            for sr in response.candidates[0].safety_ratings if sr.blocked
-                        ]
-                        safety_details_str = "Bloqueado por: " + ", ".join(blocked_ratings) if blocked_ratings else "Bloqueado por seguridad."
-                logger.warning(f"Gemini no generó contenido válido para {user_info}. Razón: {reason}. Detalles: {safety_details_str}")
-                bot.reply_to(message, f"Mi intento de respuesta fue bloqueado ({safety_details_str}). Por favor, intenta reformular tu pregunta.")
-            if ai_full_response:
-                logger.info(f"Respuesta de Gemini (consulta general) generada para {user_info}.")
-                bot.reply_to(message, ai_full_response)
-            elif not (response.candidates and response.candidates[0].finish_reason.name != "STOP"):
-                logger.warning(f"Gemini generó una respuesta vacía para {user_info}. Prompt: {prompt_content[:200]}")
-                bot.reply_to(message, "No pude generar una respuesta para eso en este momento, ¿podrías intentarlo de nuevo o reformular tu pregunta?")
+                with metricas.timer("bot_llm_request_seconds", mode="sync"):
+                    response = model.generate_content(prompt_content)
+                reply_text, is_valid_answer = gemini_reply_text(response, user_info, prompt_content)
+                bot.reply_to(message, reply_text)
+            # UNA RESPUESTA ARMADA CON EL HISTORIAL DEL USUARIO NO SE COMPARTE: LA CACHE SE CONSULTA SOLO POR LA PREGUNTA
+            if is_general_question and is_valid_answer and not history:
+                cache_respuestas.store_answer(user_input, user_info, reply_text)
+            if is_valid_answer:
+                memoria_conversacion.add_exchange(telegram_id, user_input, reply_text)
+        except planificador_llm.LLMUnavailable as e_unavailable:
+            # GEMINI DEGRADADO O SATURADO: SE RESPONDE CON LOS DATOS FIJOS DE PRODUCTOS (NO SE GUARDA EN LA CACHE)
+            logger.warning(f"Gemini no disponible para {user_info}, se responde sin IA: {e_unavailable}")
+            bot.reply_to(message, LLM_UNAVAILABLE_MESSAGE)
         except Exception as e_gemini:
+            metricas.inc("bot_llm_errors_total")
             logger.error(f"Error CRÍTICO al interactuar con Gemini API para {user_info}: {e_gemini}", exc_info=True)
-            bot.reply_to(message, "Lo siento, ocurrió un error inesperado grave al procesar tu mensaje con la IA.\nIntenta de nuevo más tarde.")
+            bot.reply_to(message, GEMINI_ERROR_MESSAGE)
     else:
         logger.warning(f"CRÍTICO: prompt_content está vacío. No se llamó a Gemini. Input: {user_input}") 
         logger.warning(f"No se identificó acción de PIN ni se generó prompt para Gemini. Input: {user_input}")
         bot.reply_to(message, "No estoy seguro de cómo ayudarte con eso. Puedes intentar preguntarme sobre productos generales o usar /help.")
     logger.info(f"--- FIN handle_non_command_message para input: '{user_input}' ---") 
 
+STATEMENT_SESSION_EXPIRED = "Tu sesión expiró. Escribe 'movimientos' y envía tu PIN para ver tu extracto."
+
+# BOTON "VER MAS MOVIMIENTOS": EL CURSOR VIENE EN EL callback_data, SOLO SE RESPONDE CON UNA SESION VERIFICADA POR PIN
+@bot.callback_query_handler(func=lambda call: call.data and call.data.startswith(extractos.CALLBACK_PAGE_PREFIX))
+def statement_page_callback(call):
+    telegram_id = call.from_user.id
+    interacciones.record(telegram_id, "extracto_pagina")
+    if not autenticacion.is_verified(telegram_id):
+        bot.answer_callback_query(call.id, STATEMENT_SESSION_EXPIRED, show_alert=True)
+        return
+    try:
+        cursor = extractos.decode_cursor(call.data)
+    except ValueError:
+        logger.warning(f"callback_data de extracto inválido de {telegram_id}: {call.data!r}")
+        bot.answer_callback_query(call.id, "No pude leer la página pedida.")
+        return
+    text, markup = get_statement_page(telegram_id, cursor)
+    bot.answer_callback_query(call.id)
+    bot.send_message(call.message.chat.id, text, reply_markup=markup)
+
+# BOTON "EXPORTAR EXTRACTO": SE ENVIA EL HISTORIAL COMPLETO COMO DOCUMENTO CSV
+@bot.callback_query_handler(func=lambda call: call.data == extractos.CALLBACK_EXPORT)
+def statement_export_callback(call):
+    telegram_id = call.from_user.id
+    interacciones.record(telegram_id, "extracto_csv")
+    if not autenticacion.is_verified(telegram_id):
+        bot.answer_callback_query(call.id, STATEMENT_SESSION_EXPIRED, show_alert=True)
+        return
+    bot.answer_callback_query(call.id, "Preparando tu extracto...")
+    try:
+        archivo, cantidad, total_bytes = export_statement(telegram_id)
+    except sqlite3.Error as e:
+        logger.error(f"Error al exportar el extracto de {telegram_id}: {e}")
+        bot.send_message(call.message.chat.id, "Hubo un error al generar tu extracto.")
+        return
+    with archivo:
+        if total_bytes > extractos.TELEGRAM_MAX_DOCUMENT_BYTES:
+            logger.warning(f"Extracto de {telegram_id} demasiado grande para Telegram ({total_bytes} bytes).")
+            bot.send_message(call.message.chat.id, "Tu extracto es demasiado grande para enviarlo por Telegram. Contacta a soporte para recibirlo.")
+            return
+        bot.send_document(call.message.chat.id, archivo, caption=f"Extracto completo: {cantidad} movimientos.",
+                          visible_file_name=extractos.export_file_name(telegram_id))
+    logger.info(f"Extracto de {telegram_id} exportado ({cantidad} movimientos, {total_bytes} bytes).")
+
 # COMANDO PARA INICIAR EL BOT AL EJECUTAR EL CODIGO
 if __name__ == "__main__":
     main_logger = logging.getLogger(__name__)
     main_logger.info("Iniciando script principal del bot...")
 
-    main_logger.info("Ejecutando configuración de base de datos...")
-    baseDatos.setup_database_and_insert_examples() 
+    check_credentials()
+
+    main_logger.info("Aplicando migraciones pendientes de la base de datos...")
+    baseDatos.setup_database()
     main_logger.info("Configuración de base de datos completada.")
+    arranque.marca("migraciones de la base de datos")
+    start_background_services()
+    arranque.marca("servicios en segundo plano")
+    if proveedor_llm.GEMINI_WARMUP:
+        model.warm_up_in_background()
+    arranque.log_report()
 
-    main_logger.info("Iniciando el bot de Telegram...")
-    bot.infinity_polling(logger_level=logging.INFO) 
+    # CON --webhook LOS UPDATES LLEGAN POR HTTP A UN SERVIDOR LOCAL EN LUGAR DE LONG-POLLING
+    if "--webhook" in sys.argv[1:]:
+        import webhook
+        main_logger.info("Iniciando el bot de Telegram en modo webhook...")
+        webhook.run_webhook(bot)
+    else:
+        main_logger.info("Iniciando el bot de Telegram...")
+        bot.infinity_polling(logger_level=logging.INFO) 
+    # LOS CONTADORES QUE QUEDAN EN MEMORIA SE GUARDAN ANTES DE CERRAR LAS CONEXIONES
+    interacciones.stop()
+    conexiones.close_pool()
     main_logger.info("El bot de Telegram se ha detenido.")
\ No newline at end of file
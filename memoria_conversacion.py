@@ -0,0 +1,208 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import metricas
+from cache_respuestas import LRUTTLCache
+from db import conexiones
+
+logger = logging.getLogger(__name__)
+
+# MEMORIA DE CONVERSACION POR USUARIO PARA QUE GEMINI ENTIENDA LAS PREGUNTAS DE SEGUIMIENTO ("¿Y LA DE CREDITO?")
+# CADA USUARIO TIENE UN BUFFER CIRCULAR DE CONVERSATION_MAX_TURNS MENSAJES (LOS MAS VIEJOS SE DESCARTAN SOLOS)
+# AL ARMAR EL PROMPT SE TOMAN LOS MENSAJES MAS RECIENTES QUE ENTRAN EN CONVERSATION_TOKEN_BUDGET, LOS ANTERIORES SE RESUMEN EN UNA LINEA
+# LOS USUARIOS INACTIVOS CONVERSATION_IDLE_TTL_S SEGUNDOS SE OLVIDAN (EN MEMORIA Y, SI ESTA ACTIVADA, EN SQLITE)
+# CON CONVERSATION_PERSIST=1 LA MEMORIA SE GUARDA EN LA TABLA conversaciones Y SOBREVIVE A REINICIOS (Y SE COMPARTE ENTRE PROCESOS)
+
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "12"))
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "600"))
+CONVERSATION_IDLE_TTL_S = float(os.getenv("CONVERSATION_IDLE_TTL_S", "1800"))
+CONVERSATION_MAX_USERS = int(os.getenv("CONVERSATION_MAX_USERS", "10000"))
+CONVERSATION_PERSIST = os.getenv("CONVERSATION_PERSIST", "0") == "1"
+CONVERSATION_CLEANUP_INTERVAL_S = float(os.getenv("CONVERSATION_CLEANUP_INTERVAL_S", "300"))
+# CADA MENSAJE SE GUARDA RECORTADO, ASI UNA RESPUESTA LARGA DE GEMINI NO SE COME TODO EL PRESUPUESTO
+MAX_TURN_CHARS = 600
+SUMMARY_MAX_TOKENS = 60
+# ESTIMACION SIMPLE DE TOKENS (SIN TOKENIZADOR): ~4 CARACTERES POR TOKEN EN ESPAÑOL
+CHARS_PER_TOKEN = 4
+
+ROL_USUARIO = "usuario"
+ROL_ASISTENTE = "asistente"
+
+_memoria = LRUTTLCache(CONVERSATION_MAX_USERS, CONVERSATION_IDLE_TTL_S)
+_lock = threading.Lock()
+_stats = {"prompts": 0, "prompt_tokens_total": 0, "prompt_tokens_max": 0, "history_tokens_total": 0,
+          "turns_summarized": 0, "db_loads": 0}
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _recortar(text: str, max_chars: int = MAX_TURN_CHARS) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars - 3].rstrip() + "..."
+
+# FUNCION PARA OBTENER EL BUFFER DEL USUARIO: DE MEMORIA, O DE SQLITE SI SE OLVIDO EN MEMORIA Y HAY PERSISTENCIA
+# LA LECTURA DE SQLITE SE HACE SIN TOMAR EL LOCK, ASI UN USUARIO QUE SE CARGA NO DEMORA A LOS DEMAS
+def _buffer(telegram_id: int) -> deque:
+    turnos = _memoria.get(telegram_id)
+    if turnos is not None:
+        return turnos
+    cargados = _leer_persistente(telegram_id) if CONVERSATION_PERSIST else ()
+    with _lock:
+        turnos = _memoria.get(telegram_id)
+        if turnos is None:
+            turnos = deque(cargados, maxlen=CONVERSATION_MAX_TURNS)
+            _memoria.put(telegram_id, turnos)
+    return turnos
+
+# FUNCION PARA GUARDAR UN INTERCAMBIO (PREGUNTA DEL USUARIO Y RESPUESTA DEL BOT) EN LA MEMORIA DEL USUARIO
+def add_exchange(telegram_id: int, user_text: str, assistant_text: str):
+    nuevos = [(ROL_USUARIO, _recortar(user_text)), (ROL_ASISTENTE, _recortar(assistant_text))]
+    turnos = _buffer(telegram_id)
+    with _lock:
+        turnos.extend(nuevos)
+        # put RENUEVA EL TTL: LA INACTIVIDAD SE CUENTA DESDE EL ULTIMO MENSAJE
+        _memoria.put(telegram_id, turnos)
+    if CONVERSATION_PERSIST:
+        _guardar_persistente(telegram_id, nuevos)
+
+def forget(telegram_id: int):
+    _memoria.invalidate(telegram_id)
+    if CONVERSATION_PERSIST:
+        try:
+            with conexiones.get_connection() as conn:
+                conn.execute("DELETE FROM conversaciones WHERE telegram_id = ?", (telegram_id,))
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error al borrar la conversación de {telegram_id}: {e}")
+
+# RESUMEN SIN IA DE LOS MENSAJES QUE NO ENTRARON EN EL PRESUPUESTO: LOS TEMAS QUE PREGUNTO EL USUARIO, RECORTADOS
+def _resumir(turnos: list) -> str:
+    temas = [_recortar(texto, 80) for rol, texto in turnos if rol == ROL_USUARIO]
+    if not temas:
+        return ""
+    return _recortar("Antes el usuario preguntó sobre: " + "; ".join(temas), SUMMARY_MAX_TOKENS * CHARS_PER_TOKEN)
+
+# FUNCION PARA ARMAR EL HISTORIAL QUE VA EN EL PROMPT, DEVUELVE (TEXTO, TOKENS ESTIMADOS), NUNCA SUPERA token_budget
+# SE RECORRE DEL MENSAJE MAS NUEVO AL MAS VIEJO, SI ALGUNO NO ENTRA SE RESERVA LUGAR PARA EL RESUMEN DE LOS ANTERIORES
+def build_history(telegram_id: int, token_budget: int = CONVERSATION_TOKEN_BUDGET) -> tuple:
+    buffer = _buffer(telegram_id)
+    with _lock:
+        turnos = list(buffer)
+    if not turnos:
+        return "", 0
+    costos = [estimate_tokens(texto) + 2 for _, texto in turnos]
+    presupuesto = token_budget if sum(costos) <= token_budget else token_budget - SUMMARY_MAX_TOKENS
+    elegidos = 0
+    usados = 0
+    for costo in reversed(costos):
+        if usados + costo > presupuesto:
+            break
+        usados += costo
+        elegidos += 1
+    anteriores = turnos[:len(turnos) - elegidos]
+    lineas = []
+    if anteriores:
+        resumen = _resumir(anteriores)
+        if resumen:
+            lineas.append(resumen)
+            usados += estimate_tokens(resumen)
+        with _lock:
+            _stats["turns_summarized"] += len(anteriores)
+    lineas += [f"{'Usuario' if rol == ROL_USUARIO else 'Asistente'}: {texto}" for rol, texto in turnos[len(turnos) - elegidos:]]
+    return "\n".join(lineas), usados
+
+# FUNCION PARA REGISTRAR EL TAMAÑO DE CADA PROMPT ENVIADO (TOTAL E HISTORIAL), PARA VER QUE QUEDA ACOTADO
+def record_prompt(prompt_content: str, history_tokens: int) -> int:
+    tokens = estimate_tokens(prompt_content)
+    with _lock:
+        _stats["prompts"] += 1
+        _stats["prompt_tokens_total"] += tokens
+        _stats["prompt_tokens_max"] = max(_stats["prompt_tokens_max"], tokens)
+        _stats["history_tokens_total"] += history_tokens
+    metricas.observe("bot_prompt_tokens", tokens)
+    metricas.observe("bot_prompt_history_tokens", history_tokens)
+    return tokens
+
+def memory_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    prompts = stats["prompts"]
+    stats["prompt_tokens_avg"] = stats["prompt_tokens_total"] / prompts if prompts else 0.0
+    stats["history_tokens_avg"] = stats["history_tokens_total"] / prompts if prompts else 0.0
+    stats["users"] = len(_memoria)
+    stats["memory_bytes"] = _memory_bytes()
+    stats["persist"] = CONVERSATION_PERSIST
+    return stats
+
+# SE MIDE CON EL LOCK TOMADO PARA QUE NINGUN BUFFER CAMBIE MIENTRAS SE RECORRE
+def _memory_bytes() -> int:
+    with _lock:
+        return _memoria.memory_bytes()
+
+def register_metrics():
+    metricas.register_gauge("bot_conversation_users", lambda: len(_memoria))
+    metricas.register_gauge("bot_conversation_memory_bytes", _memory_bytes)
+
+# --- PERSISTENCIA EN SQLITE (TABLA conversaciones) ---
+
+def _leer_persistente(telegram_id: int) -> list:
+    try:
+        with conexiones.get_connection() as conn:
+            filas = conn.execute('''
+                SELECT rol, texto FROM conversaciones
+                WHERE telegram_id = ? AND creado > ?
+                ORDER BY id DESC LIMIT ?
+            ''', (telegram_id, time.time() - CONVERSATION_IDLE_TTL_S, CONVERSATION_MAX_TURNS)).fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"Error al leer la conversación de {telegram_id}: {e}")
+        return []
+    with _lock:
+        _stats["db_loads"] += 1
+    return list(reversed(filas))
+
+# SE INSERTAN LOS MENSAJES NUEVOS Y SE BORRAN LOS QUE QUEDARON FUERA DEL BUFFER, LA TABLA NUNCA TIENE MAS DE MAX_TURNS POR USUARIO
+def _guardar_persistente(telegram_id: int, turnos: list):
+    ahora = time.time()
+    try:
+        with conexiones.get_connection() as conn:
+            conn.executemany("INSERT INTO conversaciones (telegram_id, rol, texto, creado) VALUES (?, ?, ?, ?)",
+                             [(telegram_id, rol, texto, ahora) for rol, texto in turnos])
+            conn.execute('''
+                DELETE FROM conversaciones WHERE telegram_id = ? AND id < (
+                    SELECT MIN(id) FROM (
+                        SELECT id FROM conversaciones WHERE telegram_id = ? ORDER BY id DESC LIMIT ?
+                    )
+                )
+            ''', (telegram_id, telegram_id, CONVERSATION_MAX_TURNS))
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Error al guardar la conversación de {telegram_id}: {e}")
+
+# FUNCION PARA BORRAR DE SQLITE LOS MENSAJES DE USUARIOS INACTIVOS (EN MEMORIA LOS EXPULSA EL TTL DE LA CACHE)
+def purge_idle() -> int:
+    if not CONVERSATION_PERSIST:
+        return 0
+    with conexiones.get_connection() as conn:
+        cursor = conn.execute("DELETE FROM conversaciones WHERE creado <= ?", (time.time() - CONVERSATION_IDLE_TTL_S,))
+        conn.commit()
+    return cursor.rowcount
+
+# HILO EN SEGUNDO PLANO QUE BORRA LAS CONVERSACIONES INACTIVAS CADA interval_s SEGUNDOS
+def start_cleaner(interval_s: float = CONVERSATION_CLEANUP_INTERVAL_S) -> threading.Event:
+    stop_event = threading.Event()
+
+    def _limpiar():
+        while not stop_event.wait(interval_s):
+            try:
+                removed = purge_idle()
+                if removed:
+                    logger.info(f"Se eliminaron {removed} mensajes de conversaciones inactivas.")
+            except sqlite3.Error as e:
+                logger.error(f"Error al limpiar conversaciones inactivas: {e}")
+
+    threading.Thread(target=_limpiar, name="conversaciones-cleaner", daemon=True).start()
+    return stop_event
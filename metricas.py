@@ -0,0 +1,235 @@
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# INSTRUMENTACION LIVIANA: CONTADORES E HISTOGRAMAS EN MEMORIA, EXPUESTOS EN FORMATO PROMETHEUS
+# MIDE CUANTO TARDA CADA ETAPA (SQLITE, GEMINI, API DE TELEGRAM) Y CUENTA INTENCIONES Y RESULTADOS DEL PIN
+# ENDPOINT: METRICS_PORT=9100 -> http://127.0.0.1:9100/metrics, RESUMEN EN EL LOG CADA METRICS_LOG_INTERVAL_S SEGUNDOS
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_LOG_INTERVAL_S = float(os.getenv("METRICS_LOG_INTERVAL_S", "0"))
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# HISTOGRAMAS QUE NO MIDEN SEGUNDOS USAN SUS PROPIOS LIMITES
+TOKEN_BUCKETS = (50, 100, 200, 400, 600, 800, 1000, 1500, 2000, 4000)
+_buckets = {
+    "bot_prompt_tokens": TOKEN_BUCKETS,
+    "bot_prompt_history_tokens": TOKEN_BUCKETS,
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_gauges = {}
+_help = {
+    "bot_db_queries_total": "Sentencias SQL ejecutadas por tipo.",
+    "bot_db_checkout_wait_seconds": "Espera para obtener una conexión del pool.",
+    "bot_db_connection_hold_seconds": "Tiempo que una conexión queda prestada (consultas incluidas).",
+    "bot_llm_request_seconds": "Duración de las llamadas a Gemini.",
+    "bot_llm_errors_total": "Llamadas a Gemini que lanzaron una excepción.",
+    "bot_telegram_send_seconds": "Duración de las llamadas a la API de envío de Telegram.",
+    "bot_telegram_send_errors_total": "Envíos a Telegram que lanzaron una excepción.",
+    "bot_intent_matches_total": "Mensajes por intención detectada.",
+    "bot_pin_outcomes_total": "Resultados de la verificación de PIN.",
+    "bot_llm_queue_depth": "Pedidos a Gemini esperando turno en el planificador.",
+    "bot_llm_in_flight": "Pedidos a Gemini en curso.",
+    "bot_llm_circuit_open": "1 si el circuit breaker de Gemini está abierto.",
+    "bot_llm_shed_total": "Pedidos a Gemini descartados por el planificador, por motivo.",
+    "bot_llm_retries_total": "Reintentos de llamadas a Gemini tras un error reintentable.",
+    "bot_prompt_tokens": "Tokens estimados de cada prompt enviado a Gemini.",
+    "bot_prompt_history_tokens": "Tokens estimados del historial de conversación incluido en cada prompt.",
+    "bot_conversation_users": "Usuarios con memoria de conversación cargada.",
+    "bot_conversation_memory_bytes": "Memoria aproximada de las conversaciones cargadas.",
+    "bot_analytics_pending_keys": "Contadores de interacciones en memoria esperando ser guardados.",
+    "bot_analytics_flush_seconds": "Duración de cada volcado de contadores de interacciones a SQLite.",
+    "bot_workers_alive": "Procesos worker vivos en el modo supervisor.",
+    "bot_worker_queue_depth": "Updates esperando en las colas de los workers.",
+    "bot_worker_restarts_total": "Reinicios de workers por caída o falta de heartbeat.",
+}
+
+def _clave(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+# FUNCION PARA SUMAR A UN CONTADOR, LAS ETIQUETAS VAN COMO ARGUMENTOS: inc("bot_pin_outcomes_total", outcome="ok")
+def inc(name: str, amount: float = 1, **labels):
+    clave = _clave(name, labels)
+    with _lock:
+        _counters[clave] = _counters.get(clave, 0) + amount
+
+# FUNCION PARA REGISTRAR UNA DURACION EN SEGUNDOS (O UN VALOR CON LIMITES PROPIOS EN _buckets) EN UN HISTOGRAMA
+def observe(name: str, seconds: float, **labels):
+    clave = _clave(name, labels)
+    limites = _buckets.get(name, BUCKETS)
+    with _lock:
+        hist = _histograms.get(clave)
+        if hist is None:
+            hist = _histograms[clave] = {"buckets": [0] * len(limites), "count": 0, "sum": 0.0}
+        hist["count"] += 1
+        hist["sum"] += seconds
+        for i, limite in enumerate(limites):
+            if seconds <= limite:
+                hist["buckets"][i] += 1
+                break
+
+# CONTEXT MANAGER PARA MEDIR UN BLOQUE: with metricas.timer("bot_llm_request_seconds", mode="sync"):
+@contextmanager
+def timer(name: str, **labels):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - inicio, **labels)
+
+# FUNCION PARA REGISTRAR UN GAUGE, callback SE EVALUA CADA VEZ QUE SE GENERAN LAS METRICAS (POR EJ. EL LARGO DE UNA COLA)
+def register_gauge(name: str, callback):
+    with _lock:
+        _gauges[name] = callback
+
+def _leer_gauges() -> list:
+    with _lock:
+        gauges = sorted(_gauges.items())
+    valores = []
+    for name, callback in gauges:
+        try:
+            valores.append((name, float(callback())))
+        except Exception as e:
+            logger.warning(f"No se pudo leer el gauge {name}: {e}")
+    return valores
+
+def _formatear_etiquetas(labels: tuple, extra: tuple = ()) -> str:
+    todas = labels + extra
+    if not todas:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in todas) + "}"
+
+# FUNCION PARA GENERAR EL TEXTO EN FORMATO DE EXPOSICION DE PROMETHEUS
+def render_prometheus() -> str:
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: {"buckets": list(v["buckets"]), "count": v["count"], "sum": v["sum"]} for k, v in _histograms.items()}
+    lineas = []
+    vistos = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in vistos:
+            vistos.add(name)
+            lineas.append(f"# HELP {name} {_help.get(name, name)}")
+            lineas.append(f"# TYPE {name} counter")
+        lineas.append(f"{name}{_formatear_etiquetas(labels)} {value}")
+    for (name, labels), hist in sorted(histograms.items()):
+        if name not in vistos:
+            vistos.add(name)
+            lineas.append(f"# HELP {name} {_help.get(name, name)}")
+            lineas.append(f"# TYPE {name} histogram")
+        acumulado = 0
+        for limite, cantidad in zip(_buckets.get(name, BUCKETS), hist["buckets"]):
+            acumulado += cantidad
+            lineas.append(f"{name}_bucket{_formatear_etiquetas(labels, (('le', limite),))} {acumulado}")
+        lineas.append(f"{name}_bucket{_formatear_etiquetas(labels, (('le', '+Inf'),))} {hist['count']}")
+        lineas.append(f"{name}_sum{_formatear_etiquetas(labels)} {hist['sum']}")
+        lineas.append(f"{name}_count{_formatear_etiquetas(labels)} {hist['count']}")
+    for name, value in _leer_gauges():
+        lineas.append(f"# HELP {name} {_help.get(name, name)}")
+        lineas.append(f"# TYPE {name} gauge")
+        lineas.append(f"{name} {value}")
+    return "\n".join(lineas) + "\n"
+
+# FUNCION PARA ARMAR UN RESUMEN CORTO (CANTIDAD Y PROMEDIO POR ETAPA) PARA EL LOG
+def summary() -> str:
+    with _lock:
+        partes = [
+            f"{name}{_formatear_etiquetas(labels)} n={h['count']} avg={h['sum'] / h['count']:.0f}" if name in _buckets else
+            f"{name}{_formatear_etiquetas(labels)} n={h['count']} avg={h['sum'] / h['count'] * 1000:.1f}ms"
+            for (name, labels), h in sorted(_histograms.items()) if h["count"]
+        ]
+        partes += [f"{name}{_formatear_etiquetas(labels)}={value}" for (name, labels), value in sorted(_counters.items())]
+    partes += [f"{name}={value}" for name, value in _leer_gauges()]
+    return " | ".join(partes) if partes else "sin datos"
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+# FUNCION PARA MEDIR LOS ENVIOS DEL BOT SIN TOCAR CADA LLAMADA, FUNCIONA CON TeleBot Y AsyncTeleBot
+# SOLO LOS METODOS DE BAJO NIVEL: reply_to LLAMA A self.send_message, SI TAMBIEN SE ENVOLVIERA CADA RESPUESTA SE CONTARIA DOS VECES
+def instrument_bot(bot, methods=("send_message", "edit_message_text", "send_document")):
+    for method_name in methods:
+        original = getattr(bot, method_name, None)
+        if original is None:
+            continue
+        setattr(bot, method_name, _envolver_envio(original, method_name))
+    return bot
+
+def _envolver_envio(original, method_name: str):
+    if inspect.iscoroutinefunction(original):
+        @functools.wraps(original)
+        async def _async_wrapper(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return await original(*args, **kwargs)
+            except Exception:
+                inc("bot_telegram_send_errors_total", method=method_name)
+                raise
+            finally:
+                observe("bot_telegram_send_seconds", time.perf_counter() - inicio, method=method_name)
+        return _async_wrapper
+
+    @functools.wraps(original)
+    def _wrapper(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        except Exception:
+            inc("bot_telegram_send_errors_total", method=method_name)
+            raise
+        finally:
+            observe("bot_telegram_send_seconds", time.perf_counter() - inicio, method=method_name)
+    return _wrapper
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+# FUNCION PARA LEVANTAR EL ENDPOINT /metrics EN UN HILO APARTE
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Métricas disponibles en http://{host}:{server.server_port}/metrics")
+    return server
+
+# FUNCION PARA ESCRIBIR UN RESUMEN DE LAS METRICAS EN EL LOG CADA interval_s SEGUNDOS
+def start_summary_logger(interval_s: float = METRICS_LOG_INTERVAL_S) -> threading.Event:
+    stop_event = threading.Event()
+
+    def _loguear():
+        while not stop_event.wait(interval_s):
+            logger.info(f"Resumen de métricas: {summary()}")
+
+    threading.Thread(target=_loguear, name="metrics-summary", daemon=True).start()
+    return stop_event
+
+# FUNCION PARA ACTIVAR LO CONFIGURADO POR VARIABLES DE ENTORNO (ENDPOINT Y/O RESUMEN PERIODICO)
+def start_from_env():
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    if METRICS_LOG_INTERVAL_S > 0:
+        start_summary_logger(METRICS_LOG_INTERVAL_S)
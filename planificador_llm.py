@@ -0,0 +1,373 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+
+import metricas
+from proveedor_llm import LLMProvider
+
+logger = logging.getLogger(__name__)
+
+# PLANIFICADOR ENTRE LOS HANDLERS Y GEMINI, CON LA MISMA INTERFAZ QUE EL PROVEEDOR (main.model SIGUE SIENDO "EL MODELO")
+# - TOKEN BUCKET: COMO MAXIMO GEMINI_RPM PEDIDOS POR MINUTO (CON RAFAGAS DE GEMINI_BURST) Y GEMINI_MAX_CONCURRENCY EN VUELO
+# - PRIORIDAD: LOS PROMPTS CORTOS PASAN ANTES, CADA CARACTER SUMA UN RETRASO VIRTUAL, ASI LOS LARGOS NUNCA QUEDAN ESPERANDO PARA SIEMPRE
+# - REINTENTOS: LOS ERRORES DE CUOTA (429), TIMEOUTS Y 5XX SE REINTENTAN CON BACKOFF EXPONENCIAL Y JITTER
+# - CIRCUIT BREAKER: TRAS VARIAS FALLAS SEGUIDAS NO SE LLAMA A GEMINI POR UN RATO Y SE LANZA LLMUnavailable
+#   (EL HANDLER RESPONDE CON LA INFORMACION FIJA DE PRODUCTOS), PASADO EL ENFRIAMIENTO SE DEJA PASAR UN PEDIDO DE PRUEBA
+# - SI LA COLA ESTA LLENA O UN PEDIDO ESPERA DEMASIADO SE DESCARTA (LLMOverloaded), TAMBIEN SE RESPONDE CON LA INFORMACION FIJA
+
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "60"))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "10"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_MAX_QUEUE = int(os.getenv("GEMINI_MAX_QUEUE", "100"))
+GEMINI_QUEUE_TIMEOUT_S = float(os.getenv("GEMINI_QUEUE_TIMEOUT_S", "30"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_BACKOFF_BASE_S = float(os.getenv("GEMINI_BACKOFF_BASE_S", "0.5"))
+GEMINI_BACKOFF_MAX_S = float(os.getenv("GEMINI_BACKOFF_MAX_S", "8"))
+GEMINI_BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+GEMINI_BREAKER_COOLDOWN_S = float(os.getenv("GEMINI_BREAKER_COOLDOWN_S", "30"))
+# CADA CARACTER DEL PROMPT RETRASA SU TURNO 1/PRIORITY_CHARS_PER_S SEGUNDOS FRENTE A UNO VACIO QUE LLEGO AL MISMO TIEMPO
+PRIORITY_CHARS_PER_S = float(os.getenv("GEMINI_PRIORITY_CHARS_PER_S", "1000"))
+
+# ERRORES DE google.api_core QUE VALE LA PENA REINTENTAR (SE COMPARAN POR NOMBRE PARA NO IMPORTAR EL CLIENTE AQUI)
+_RETRYABLE_ERROR_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+                          "InternalServerError", "GatewayTimeout", "RetryError"}
+_RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+# GEMINI NO ESTA DISPONIBLE (CIRCUIT BREAKER ABIERTO), EL HANDLER RESPONDE SIN IA
+class LLMUnavailable(Exception):
+    pass
+
+# EL PEDIDO SE DESCARTO SIN LLAMAR A GEMINI: COLA LLENA O DEMASIADO TIEMPO ESPERANDO TURNO
+class LLMOverloaded(LLMUnavailable):
+    pass
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if any(cls.__name__ in _RETRYABLE_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    return getattr(error, "code", None) in _RETRYABLE_CODES
+
+# BACKOFF EXPONENCIAL CON "FULL JITTER": UN TIEMPO AL AZAR ENTRE 0 Y base * 2^intento (CON TOPE)
+def backoff_delay(attempt: int, base_s: float = GEMINI_BACKOFF_BASE_S, max_s: float = GEMINI_BACKOFF_MAX_S) -> float:
+    return random.uniform(0, min(max_s, base_s * (2 ** attempt)))
+
+class TokenBucket:
+    def __init__(self, rate_per_s: float, capacity: int):
+        self.rate_per_s = rate_per_s
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+
+    def _recargar(self, ahora: float):
+        self._tokens = min(self.capacity, self._tokens + (ahora - self._last) * self.rate_per_s)
+        self._last = ahora
+
+    # DEVUELVE 0 SI SE CONSUMIO UN TOKEN, SI NO LOS SEGUNDOS QUE FALTAN PARA EL PROXIMO (NO ES THREAD-SAFE, LO PROTEGE EL LLAMADOR)
+    def try_take(self, ahora: float) -> float:
+        self._recargar(ahora)
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate_per_s
+
+    def available(self) -> float:
+        self._recargar(time.monotonic())
+        return self._tokens
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "cerrado", "abierto", "semiabierto"
+
+    def __init__(self, failure_threshold: int = GEMINI_BREAKER_FAILURES, cooldown_s: float = GEMINI_BREAKER_COOLDOWN_S):
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    # DEVUELVE TRUE SI EL PEDIDO PUEDE IR A GEMINI, EN SEMIABIERTO SOLO PASA UN PEDIDO DE PRUEBA A LA VEZ
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown_s:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+                logger.info("Circuit breaker de Gemini semiabierto, se prueba con un pedido.")
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Gemini respondió de nuevo, circuit breaker cerrado.")
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit breaker de Gemini abierto por {self.cooldown_s:.0f}s tras {self._failures} fallas seguidas.")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    # EL PEDIDO DE PRUEBA NO LLEGO A GEMINI (POR EJ. SE DESCARTO EN LA COLA), SE LIBERA EL LUGAR PARA OTRO
+    def release_trial(self):
+        with self._lock:
+            self._trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+class LLMScheduler(LLMProvider):
+    name = "planificador"
+
+    def __init__(self, provider: LLMProvider, rpm: float = GEMINI_RPM, burst: int = GEMINI_BURST,
+                 max_concurrency: int = GEMINI_MAX_CONCURRENCY, max_queue: int = GEMINI_MAX_QUEUE,
+                 queue_timeout_s: float = GEMINI_QUEUE_TIMEOUT_S, max_retries: int = GEMINI_MAX_RETRIES,
+                 breaker: CircuitBreaker = None):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self._bucket = TokenBucket(rpm / 60.0, burst)
+        self._cond = threading.Condition()
+        self._heap = []
+        self._cancelled = set()
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._stats = {"requests": 0, "completed": 0, "retries": 0, "failures": 0,
+                       "shed_queue_full": 0, "shed_timeout": 0, "short_circuited": 0}
+
+    def _sumar(self, clave: str):
+        with self._cond:
+            self._stats[clave] += 1
+
+    # FUNCION PARA CONSULTAR EL ESTADO DEL PLANIFICADOR (PROFUNDIDAD DE COLA, EN VUELO, DESCARTES, ESTADO DEL BREAKER)
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._heap) - len(self._cancelled)
+            stats["in_flight"] = self._in_flight
+            stats["tokens_available"] = round(self._bucket.available(), 2)
+        stats["circuit"] = self.breaker.state
+        return stats
+
+    def register_metrics(self):
+        metricas.register_gauge("bot_llm_queue_depth", lambda: self.stats()["queue_depth"])
+        metricas.register_gauge("bot_llm_in_flight", lambda: self._in_flight)
+        metricas.register_gauge("bot_llm_circuit_open", lambda: 1 if self.breaker.is_open else 0)
+        return self
+
+    # --- TURNOS: UN TICKET POR PEDIDO EN UN HEAP ORDENADO POR (LLEGADA + RETRASO POR LARGO DEL PROMPT) ---
+
+    def _encolar(self, prompt_content: str) -> tuple:
+        with self._cond:
+            if len(self._heap) - len(self._cancelled) >= self.max_queue:
+                self._stats["shed_queue_full"] += 1
+                metricas.inc("bot_llm_shed_total", reason="cola_llena")
+                raise LLMOverloaded("Cola de pedidos a Gemini llena.")
+            ticket = (time.monotonic() + len(prompt_content) / PRIORITY_CHARS_PER_S, next(self._seq))
+            heapq.heappush(self._heap, ticket)
+            return ticket
+
+    def _limpiar_cancelados(self):
+        while self._heap and self._heap[0] in self._cancelled:
+            self._cancelled.discard(heapq.heappop(self._heap))
+
+    # INTENTA DARLE EL TURNO AL TICKET (DEBE SER EL PRIMERO DEL HEAP, HABER UN TOKEN Y LUGAR EN VUELO)
+    # DEVUELVE 0 SI LO CONSIGUIO, SI NO CUANTO CONVIENE ESPERAR ANTES DE VOLVER A INTENTAR (SE LLAMA CON self._cond TOMADO)
+    def _intentar_turno(self, ticket: tuple) -> float:
+        self._limpiar_cancelados()
+        if self._heap[0] != ticket or self._in_flight >= self.max_concurrency:
+            return 0.05
+        espera = self._bucket.try_take(time.monotonic())
+        if espera:
+            return espera
+        heapq.heappop(self._heap)
+        self._in_flight += 1
+        return 0.0
+
+    def _cancelar(self, ticket: tuple):
+        self._cancelled.add(ticket)
+        self._limpiar_cancelados()
+        self._stats["shed_timeout"] += 1
+        self._cond.notify_all()
+        metricas.inc("bot_llm_shed_total", reason="espera_excedida")
+
+    def _liberar(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _esperar_turno(self, ticket: tuple, limite: float):
+        with self._cond:
+            while True:
+                espera = self._intentar_turno(ticket)
+                if not espera:
+                    self._cond.notify_all()
+                    return
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._cancelar(ticket)
+                    raise LLMOverloaded(f"Sin turno para Gemini tras {self.queue_timeout_s:.0f}s en la cola.")
+                self._cond.wait(min(espera, restante))
+
+    async def _esperar_turno_async(self, ticket: tuple, limite: float):
+        while True:
+            with self._cond:
+                espera = self._intentar_turno(ticket)
+                if not espera:
+                    self._cond.notify_all()
+                    return
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._cancelar(ticket)
+                    raise LLMOverloaded(f"Sin turno para Gemini tras {self.queue_timeout_s:.0f}s en la cola.")
+            await asyncio.sleep(min(espera, restante, 0.05))
+
+    # --- LLAMADAS ---
+
+    def _antes_de_llamar(self):
+        self._sumar("requests")
+        if not self.breaker.allow():
+            self._sumar("short_circuited")
+            metricas.inc("bot_llm_shed_total", reason="circuito_abierto")
+            raise LLMUnavailable("Circuit breaker de Gemini abierto.")
+
+    # DECIDE QUE HACER CON UN ERROR: DEVUELVE LOS SEGUNDOS A ESPERAR ANTES DE REINTENTAR O RELANZA EL ERROR
+    def _tras_error(self, error: Exception, attempt: int) -> float:
+        if is_retryable(error) and attempt < self.max_retries:
+            delay = backoff_delay(attempt)
+            self._sumar("retries")
+            metricas.inc("bot_llm_retries_total")
+            logger.warning(f"Error reintentable de Gemini ({type(error).__name__}), reintento {attempt + 1} en {delay:.2f}s.")
+            return delay
+        self._fallar(error, attempt)
+
+    # FALLA DEFINITIVA: SOLO LOS ERRORES DE DISPONIBILIDAD (CUOTA, TIMEOUT, 5XX) CUENTAN PARA EL CIRCUIT BREAKER
+    # UN PROMPT INVALIDO O RECHAZADO NO DICE NADA DE LA SALUD DE GEMINI, SOLO SE LIBERA EL PEDIDO DE PRUEBA SI LO ERA
+    def _fallar(self, error: Exception, attempt: int):
+        self._sumar("failures")
+        if not is_retryable(error):
+            self.breaker.release_trial()
+            raise error
+        self.breaker.record_failure()
+        # CUOTA O TIMEOUT SIN REINTENTOS DISPONIBLES: PARA EL HANDLER ES LO MISMO QUE UN GEMINI DEGRADADO
+        raise LLMUnavailable(f"Gemini sigue fallando tras {attempt} reintentos ({type(error).__name__}).") from error
+
+    def _tras_exito(self):
+        self._sumar("completed")
+        self.breaker.record_success()
+
+    def generate_content(self, prompt_content: str, stream: bool = False):
+        self._antes_de_llamar()
+        limite = time.monotonic() + self.queue_timeout_s
+        for attempt in itertools.count():
+            try:
+                self._esperar_turno(self._encolar(prompt_content), limite)
+            except LLMOverloaded:
+                self.breaker.release_trial()
+                raise
+            try:
+                response = self.provider.generate_content(prompt_content, stream=stream)
+            except Exception as e:
+                self._liberar()
+                delay = self._tras_error(e, attempt)
+            else:
+                # EN STREAMING EL PEDIDO SIGUE EN VUELO MIENTRAS SE LEEN LOS CHUNKS, EL LUGAR LO LIBERA EL ITERADOR
+                if stream:
+                    return _StreamConTurno(self, response)
+                self._liberar()
+                self._tras_exito()
+                return response
+            time.sleep(delay)
+
+    async def generate_content_async(self, prompt_content: str):
+        self._antes_de_llamar()
+        limite = time.monotonic() + self.queue_timeout_s
+        for attempt in itertools.count():
+            try:
+                await self._esperar_turno_async(self._encolar(prompt_content), limite)
+            except LLMOverloaded:
+                self.breaker.release_trial()
+                raise
+            try:
+                response = await self.provider.generate_content_async(prompt_content)
+            except Exception as e:
+                delay = self._tras_error(e, attempt)
+            else:
+                self._tras_exito()
+                return response
+            finally:
+                self._liberar()
+            await asyncio.sleep(delay)
+
+    def warm_up(self):
+        self.provider.warm_up()
+
+# RESPUESTA EN STREAMING QUE OCUPA SU LUGAR EN VUELO HASTA QUE SE TERMINA DE LEER, FALLA O SE CIERRA (close)
+# RECIEN AHI SE REGISTRA EL EXITO O LA FALLA, LOS DEMAS ATRIBUTOS (candidates, prompt_feedback...) SON LOS DE LA RESPUESTA DE GEMINI
+# UN ERROR A MITAD DEL STREAM NO SE REINTENTA (EL USUARIO YA VIO PARTE DEL TEXTO), SE TRATA COMO FALLA DEFINITIVA
+class _StreamConTurno:
+    def __init__(self, scheduler: LLMScheduler, response):
+        self._scheduler = scheduler
+        self._response = response
+        self._chunks = None
+        self._terminado = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._terminado:
+            raise StopIteration
+        try:
+            if self._chunks is None:
+                self._chunks = iter(self._response)
+            return next(self._chunks)
+        except StopIteration:
+            self.close()
+            raise
+        except Exception as e:
+            self._terminado = True
+            try:
+                self._scheduler._fallar(e, 0)
+            finally:
+                self._scheduler._liberar()
+
+    def close(self):
+        if self._terminado:
+            return
+        self._terminado = True
+        self._scheduler._liberar()
+        self._scheduler._tras_exito()
+
+    # SI NADIE LEE NI CIERRA EL STREAM, EL LUGAR SE DEVUELVE AL DESCARTAR LA RESPUESTA (SIN CONTAR EXITO NI FALLA)
+    def __del__(self):
+        if self.__dict__.get("_terminado", True):
+            return
+        self._terminado = True
+        self._scheduler._liberar()
+        self._scheduler.breaker.release_trial()
+
+    def __getattr__(self, nombre: str):
+        if "_response" not in self.__dict__:
+            raise AttributeError(nombre)
+        return getattr(self._response, nombre)
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import arranque
+
+logger = logging.getLogger(__name__)
+
+# PROVEEDOR DEL MODELO DE LENGUAJE: main.py SOLO CONOCE generate_content / generate_content_async
+# EL CLIENTE DE GEMINI SE IMPORTA Y CONFIGURA EN EL PRIMER USO (google.generativeai TARDA MAS DE UN SEGUNDO EN IMPORTARSE)
+# ASI EL BOT EMPIEZA A ATENDER /start SIN ESPERAR A GEMINI, Y main.py SE PUEDE IMPORTAR SIN CREDENCIALES
+# CON GEMINI_WARMUP=1 EL MODELO SE INICIALIZA EN SEGUNDO PLANO APENAS ARRANCA EL BOT, SIN DEMORAR EL ARRANQUE
+
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash-latest")
+GEMINI_WARMUP = os.getenv("GEMINI_WARMUP", "0") == "1"
+# SIN TIMEOUT UNA LLAMADA COLGADA OCUPA SU LUGAR EN EL PLANIFICADOR INDEFINIDAMENTE
+GEMINI_TIMEOUT_S = float(os.getenv("GEMINI_TIMEOUT_S", "30"))
+
+GENERATION_CONFIG = {"temperature": 0.7, "top_p": 1, "top_k": 1, "max_output_tokens": 2048}
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_ONLY_HIGH"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_ONLY_HIGH"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_ONLY_HIGH"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_ONLY_HIGH"},
+]
+
+# INTERFAZ COMUN DE LOS PROVEEDORES, LAS RESPUESTAS TIENEN LA FORMA DE LAS DE GEMINI (candidates, finish_reason, parts)
+class LLMProvider:
+    name = "base"
+
+    def generate_content(self, prompt_content: str, stream: bool = False):
+        raise NotImplementedError
+
+    async def generate_content_async(self, prompt_content: str):
+        raise NotImplementedError
+
+    # INICIALIZA LO QUE HAGA FALTA SIN GENERAR NADA, PARA NO PAGAR ESE COSTO EN EL PRIMER MENSAJE
+    def warm_up(self):
+        pass
+
+    # LANZA warm_up EN UN HILO APARTE, LOS ERRORES SE LOGUEAN Y SE REINTENTAN EN EL PRIMER USO REAL
+    def warm_up_in_background(self) -> threading.Thread:
+        def _calentar():
+            try:
+                self.warm_up()
+            except Exception as e:
+                logger.error(f"No se pudo precalentar el proveedor '{self.name}': {e}")
+
+        thread = threading.Thread(target=_calentar, name=f"warmup-{self.name}", daemon=True)
+        thread.start()
+        return thread
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    # system_instruction ES EL TEXTO FIJO (PERSONA Y DATOS DE PRODUCTOS) QUE SE CONFIGURA UNA SOLA VEZ EN EL MODELO
+    # Y NO SE REPITE EN CADA PROMPT
+    def __init__(self, api_key: str, model_name: str = GEMINI_MODEL_NAME,
+                 generation_config: dict = None, safety_settings: list = None, system_instruction: str = None):
+        self._api_key = api_key
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self._generation_config = generation_config or GENERATION_CONFIG
+        self._safety_settings = safety_settings or SAFETY_SETTINGS
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self) -> bool:
+        return self._model is not None
+
+    # EL PRIMER LLAMADOR IMPORTA Y CONFIGURA EL CLIENTE, LOS DEMAS ESPERAN EN EL LOCK Y REUSAN EL MISMO MODELO
+    def _get_model(self):
+        if self._model is not None:
+            return self._model
+        with self._lock:
+            if self._model is None:
+                if not self._api_key:
+                    raise RuntimeError("GOOGLE_API_KEY no está definida, no se puede usar Gemini.")
+                inicio = time.perf_counter()
+                import google.generativeai as genai
+                genai.configure(api_key=self._api_key)
+                self._model = genai.GenerativeModel(
+                    model_name=self.model_name,
+                    generation_config=self._generation_config,
+                    safety_settings=self._safety_settings,
+                    system_instruction=self.system_instruction,
+                )
+                arranque.registrar(f"Gemini '{self.model_name}' (import + configuración)", time.perf_counter() - inicio)
+        return self._model
+
+    def generate_content(self, prompt_content: str, stream: bool = False):
+        return self._get_model().generate_content(prompt_content, stream=stream, request_options={"timeout": GEMINI_TIMEOUT_S})
+
+    # SI EL MODELO TODAVIA NO EXISTE SE INICIALIZA EN UN HILO, ASI EL IMPORT NO TRABA EL EVENT LOOP
+    async def generate_content_async(self, prompt_content: str):
+        model = self._model if self._model is not None else await asyncio.to_thread(self._get_model)
+        return await model.generate_content_async(prompt_content, request_options={"timeout": GEMINI_TIMEOUT_S})
+
+    def warm_up(self):
+        self._get_model()
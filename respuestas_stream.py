@@ -0,0 +1,127 @@
+import logging
+import os
+import threading
+import time
+
+import metricas
+
+logger = logging.getLogger(__name__)
+
+# RESPUESTAS DE GEMINI EN STREAMING: SE ENVIA UN MENSAJE PROVISORIO AL INSTANTE Y SE VA EDITANDO CON EL TEXTO QUE LLEGA
+# LAS EDICIONES SE AGRUPAN Y SE LIMITAN (EDIT_INTERVAL_S) PARA NO SUPERAR LOS LIMITES DE TELEGRAM
+# LA METRICA PRINCIPAL ES EL TIEMPO HASTA EL PRIMER TEXTO VISIBLE (ttfv)
+
+STREAMING_REPLIES = os.getenv("GEMINI_STREAMING", "0") == "1"
+EDIT_INTERVAL_S = float(os.getenv("STREAM_EDIT_INTERVAL_S", "1.0"))
+MIN_CHARS_PER_EDIT = int(os.getenv("STREAM_MIN_CHARS_PER_EDIT", "40"))
+PLACEHOLDER_TEXT = "Escribiendo respuesta..."
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+
+_stats_lock = threading.Lock()
+_stats = {
+    "streams": 0,
+    "edits": 0,
+    "edit_errors": 0,
+    "chunks": 0,
+    "chunks_coalesced": 0,
+    "ttfv_total_s": 0.0,
+    "ttfv_max_s": 0.0,
+    "ttfv_count": 0,
+}
+
+def stream_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["ttfv_avg_s"] = stats["ttfv_total_s"] / stats["ttfv_count"] if stats["ttfv_count"] else 0.0
+    return stats
+
+def _registrar_ttfv(segundos: float):
+    with _stats_lock:
+        _stats["ttfv_count"] += 1
+        _stats["ttfv_total_s"] += segundos
+        _stats["ttfv_max_s"] = max(_stats["ttfv_max_s"], segundos)
+
+def _sumar(clave: str, cantidad: int = 1):
+    with _stats_lock:
+        _stats[clave] += cantidad
+
+# FUNCION PARA EXTRAER EL TEXTO DE UN CHUNK SIN LANZAR EXCEPCION SI VINO BLOQUEADO O SIN PARTES
+def _texto_del_chunk(chunk) -> str:
+    if not chunk.candidates or not chunk.candidates[0].content:
+        return ""
+    return "".join(part.text for part in chunk.candidates[0].content.parts if hasattr(part, 'text'))
+
+# FUNCION PARA EDITAR EL MENSAJE PROVISORIO, UN ERROR (POR EJ. 429) NO CORTA EL STREAMING, SE REINTENTA EN LA PROXIMA EDICION
+def _editar(bot, chat_id: int, message_id: int, text: str) -> bool:
+    try:
+        bot.edit_message_text(text, chat_id, message_id)
+        _sumar("edits")
+        return True
+    except Exception as e:
+        _sumar("edit_errors")
+        logger.warning(f"No se pudo editar el mensaje en streaming ({chat_id}/{message_id}): {e}")
+        return False
+
+def _borrar(bot, chat_id: int, message_id: int):
+    try:
+        bot.delete_message(chat_id, message_id)
+    except Exception as e:
+        logger.warning(f"No se pudo borrar el mensaje provisorio ({chat_id}/{message_id}): {e}")
+
+def _cerrar(response):
+    close = getattr(response, "close", None)
+    if close is not None:
+        close()
+
+# FUNCION PRINCIPAL: GENERA LA RESPUESTA EN STREAMING Y DEVUELVE (TEXTO FINAL, ES_VALIDA) IGUAL QUE gemini_reply_text
+# reply_text_func ES main.gemini_reply_text, ASI LOS BLOQUEOS POR SEGURIDAD Y LAS RESPUESTAS VACIAS SE TRATAN IGUAL QUE SIN STREAMING
+def stream_reply(bot, message, model, prompt_content: str, user_info: str, reply_text_func) -> tuple:
+    inicio = time.perf_counter()
+    _sumar("streams")
+    placeholder = bot.reply_to(message, PLACEHOLDER_TEXT)
+    chat_id, message_id = placeholder.chat.id, placeholder.message_id
+
+    try:
+        response = model.generate_content(prompt_content, stream=True)
+    except Exception:
+        # SI GEMINI NO RESPONDE SE BORRA EL MENSAJE PROVISORIO, EL HANDLER ENVIA SU PROPIA RESPUESTA
+        _borrar(bot, chat_id, message_id)
+        raise
+    texto = ""
+    texto_mostrado = ""
+    ultima_edicion = 0.0
+    try:
+        for chunk in response:
+            _sumar("chunks")
+            texto += _texto_del_chunk(chunk)
+            visible = texto[:TELEGRAM_MAX_MESSAGE_LENGTH]
+            ahora = time.perf_counter()
+            # SOLO SE EDITA SI PASO EL INTERVALO MINIMO Y HAY SUFICIENTE TEXTO NUEVO, SI NO EL CHUNK QUEDA AGRUPADO PARA LA PROXIMA
+            primera_vez = not texto_mostrado and visible.strip()
+            hay_suficiente = len(visible) - len(texto_mostrado) >= MIN_CHARS_PER_EDIT
+            if visible != texto_mostrado and (primera_vez or (hay_suficiente and ahora - ultima_edicion >= EDIT_INTERVAL_S)):
+                if _editar(bot, chat_id, message_id, visible):
+                    if not texto_mostrado:
+                        _registrar_ttfv(ahora - inicio)
+                        logger.info(f"Primer texto visible para {user_info} en {ahora - inicio:.3f}s.")
+                    texto_mostrado = visible
+                    ultima_edicion = ahora
+            else:
+                _sumar("chunks_coalesced")
+    except Exception:
+        # EL STREAM SE CORTO A MITAD: EL MENSAJE PROVISORIO NO QUEDA COLGADO, EL HANDLER ENVIA SU PROPIA RESPUESTA
+        _cerrar(response)
+        _borrar(bot, chat_id, message_id)
+        raise
+
+    # AL TERMINAR EL STREAM LA RESPUESTA TIENE EL finish_reason Y LAS safety_ratings FINALES
+    metricas.observe("bot_llm_request_seconds", time.perf_counter() - inicio, mode="stream")
+    reply_text, is_valid_answer = reply_text_func(response, user_info, prompt_content)
+    primera_parte = reply_text[:TELEGRAM_MAX_MESSAGE_LENGTH]
+    if primera_parte != texto_mostrado:
+        if _editar(bot, chat_id, message_id, primera_parte) and not texto_mostrado:
+            _registrar_ttfv(time.perf_counter() - inicio)
+    for desde in range(TELEGRAM_MAX_MESSAGE_LENGTH, len(reply_text), TELEGRAM_MAX_MESSAGE_LENGTH):
+        bot.send_message(chat_id, reply_text[desde:desde + TELEGRAM_MAX_MESSAGE_LENGTH])
+    logger.info(f"Respuesta en streaming completada para {user_info} en {time.perf_counter() - inicio:.3f}s.")
+    return reply_text, is_valid_answer
@@ -0,0 +1,129 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from db import conexiones
+
+logger = logging.getLogger(__name__)
+
+# ALMACEN DE SESIONES PENDIENTES DE PIN: telegram_id -> NOMBRE DE LA INTENCION QUE ESPERA EL PIN ("saldo", "prestamo")
+# SE GUARDAN NOMBRES (SERIALIZABLES) Y NO FUNCIONES, ASI EL BACKEND SQLITE PUEDE COMPARTIRSE ENTRE VARIOS PROCESOS
+# LAS SESIONES VENCEN A LOS SESSION_TTL_S SEGUNDOS, UN HILO EN SEGUNDO PLANO LIMPIA LAS VENCIDAS
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", "300"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_CLEANUP_INTERVAL_S = float(os.getenv("SESSION_CLEANUP_INTERVAL_S", "60"))
+
+# BACKEND EN MEMORIA: DICCIONARIO ORDENADO POR ANTIGÜEDAD CON TTL Y TAMAÑO MAXIMO (SE DESCARTA LA MAS VIEJA)
+class MemorySessionStore:
+    def __init__(self, ttl_s: float = SESSION_TTL_S, max_entries: int = SESSION_MAX_ENTRIES):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    def set(self, telegram_id: int, intent: str):
+        with self._lock:
+            self._data.pop(telegram_id, None)
+            self._data[telegram_id] = (time.monotonic() + self.ttl_s, intent)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evicted += 1
+
+    # DEVUELVE LA INTENCION PENDIENTE Y LA QUITA DEL ALMACEN (NONE SI NO HAY O YA VENCIO)
+    def pop(self, telegram_id: int):
+        with self._lock:
+            item = self._data.pop(telegram_id, None)
+        if item is None:
+            return None
+        expires_at, intent = item
+        if expires_at <= time.monotonic():
+            self.expired += 1
+            return None
+        return intent
+
+    # LAS ENTRADAS ESTAN ORDENADAS POR VENCIMIENTO, SE CORTA EN LA PRIMERA QUE SIGUE VIGENTE
+    def purge_expired(self) -> int:
+        now = time.monotonic()
+        removed = 0
+        with self._lock:
+            while self._data:
+                telegram_id, (expires_at, _) = next(iter(self._data.items()))
+                if expires_at > now:
+                    break
+                del self._data[telegram_id]
+                removed += 1
+        self.expired += removed
+        return removed
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "entries": len(self._data), "expired": self.expired, "evicted": self.evicted}
+
+# BACKEND SQLITE: TABLA sesiones_pin EN LA MISMA DB (WAL), VARIOS PROCESOS WORKER PUEDEN COMPARTIRLA
+class SQLiteSessionStore:
+    def __init__(self, ttl_s: float = SESSION_TTL_S):
+        self.ttl_s = ttl_s
+        self.expired = 0
+
+    def set(self, telegram_id: int, intent: str):
+        with conexiones.get_connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO sesiones_pin (telegram_id, intent, expira) VALUES (?, ?, ?)",
+                         (telegram_id, intent, time.time() + self.ttl_s))
+            conn.commit()
+
+    # LEER Y BORRAR EN LA MISMA TRANSACCION PARA QUE DOS PROCESOS NO CONSUMAN LA MISMA SESION
+    def pop(self, telegram_id: int):
+        with conexiones.get_connection() as conn:
+            row = conn.execute("SELECT intent, expira FROM sesiones_pin WHERE telegram_id = ?", (telegram_id,)).fetchone()
+            if row is None:
+                return None
+            cursor = conn.execute("DELETE FROM sesiones_pin WHERE telegram_id = ? AND expira = ?", (telegram_id, row[1]))
+            conn.commit()
+        if cursor.rowcount == 0:
+            return None
+        if row[1] <= time.time():
+            self.expired += 1
+            return None
+        return row[0]
+
+    def purge_expired(self) -> int:
+        with conexiones.get_connection() as conn:
+            cursor = conn.execute("DELETE FROM sesiones_pin WHERE expira <= ?", (time.time(),))
+            conn.commit()
+        self.expired += cursor.rowcount
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        with conexiones.get_connection() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM sesiones_pin").fetchone()[0]
+        return {"backend": "sqlite", "entries": entries, "expired": self.expired}
+
+# HILO EN SEGUNDO PLANO QUE BORRA LAS SESIONES VENCIDAS CADA interval_s SEGUNDOS
+def start_cleaner(store, interval_s: float = SESSION_CLEANUP_INTERVAL_S) -> threading.Event:
+    stop_event = threading.Event()
+
+    def _limpiar():
+        while not stop_event.wait(interval_s):
+            try:
+                removed = store.purge_expired()
+                if removed:
+                    logger.info(f"Se eliminaron {removed} sesiones de PIN vencidas.")
+            except sqlite3.Error as e:
+                logger.error(f"Error al limpiar sesiones de PIN vencidas: {e}")
+
+    threading.Thread(target=_limpiar, name="sesiones-cleaner", daemon=True).start()
+    return stop_event
+
+# FUNCION PARA CREAR EL ALMACEN SEGUN SESSION_BACKEND ("memory" O "sqlite")
+def create_session_store(backend: str = SESSION_BACKEND):
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    if backend != "memory":
+        logger.warning(f"SESSION_BACKEND '{backend}' desconocido, se usa 'memory'.")
+    return MemorySessionStore()
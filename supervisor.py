@@ -0,0 +1,348 @@
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+
+import metricas
+
+logger = logging.getLogger(__name__)
+
+# MODO MULTIPROCESO: UN SUPERVISOR RECIBE LOS UPDATES (LONG-POLLING) Y LOS REPARTE ENTRE BOT_WORKERS PROCESOS
+# CADA UPDATE VA AL WORKER telegram_id % BOT_WORKERS, ASI TODO EL FLUJO DE UN USUARIO (PIN PENDIENTE, SESION VERIFICADA,
+# MEMORIA DE CONVERSACION) QUEDA SIEMPRE EN EL MISMO PROCESO Y LOS ALMACENES EN MEMORIA SIGUEN SIENDO VALIDOS
+# LOS WORKERS SE CREAN CON "spawn": CADA UNO IMPORTA main.py DESDE CERO Y ABRE SU PROPIO POOL DE CONEXIONES (NADA SE HEREDA)
+# EL SUPERVISOR REVISA CADA WORKER: SI SE CAE O DEJA DE LATIR (HEARTBEAT) LO REINICIA CON BACKOFF
+# CON SIGTERM / CTRL+C DEJA DE RECIBIR, CADA WORKER TERMINA LO QUE TIENE EN SU COLA, GUARDA SUS CONTADORES Y SALE
+# SE INICIA CON: python supervisor.py
+
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", str(os.cpu_count() or 2)))
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "4"))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+WORKER_DB_POOL_SIZE = int(os.getenv("WORKER_DB_POOL_SIZE", os.getenv("DB_POOL_SIZE", "5")))
+# SI UN WORKER NO LATE EN ESTE TIEMPO (TODOS SUS HILOS TRABADOS) SE LO CONSIDERA COLGADO Y SE REINICIA
+WORKER_HEARTBEAT_TIMEOUT_S = float(os.getenv("WORKER_HEARTBEAT_TIMEOUT_S", "120"))
+WORKER_HEALTH_INTERVAL_S = float(os.getenv("WORKER_HEALTH_INTERVAL_S", "2"))
+WORKER_DRAIN_TIMEOUT_S = float(os.getenv("WORKER_DRAIN_TIMEOUT_S", "30"))
+WORKER_RESTART_BACKOFF_MAX_S = float(os.getenv("WORKER_RESTART_BACKOFF_MAX_S", "30"))
+# UN WORKER QUE VIVIO MAS QUE ESTO ANTES DE CAERSE NO SE CUENTA COMO CAIDA CONSECUTIVA (EL BACKOFF VUELVE A EMPEZAR)
+WORKER_STABLE_AFTER_S = 60.0
+POLL_TIMEOUT_S = int(os.getenv("POLL_TIMEOUT_S", "20"))
+HEARTBEAT_EVERY_S = 1.0
+
+_STOP = None
+# TIPOS DE UPDATE DE LOS QUE SE PUEDE SACAR EL USUARIO, EN ORDEN
+_UPDATE_TYPES = ("message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+                 "pre_checkout_query", "shipping_query", "my_chat_member", "chat_member", "chat_join_request")
+
+# FUNCION PARA OBTENER EL telegram_id DEL USUARIO QUE ORIGINO UN UPDATE CRUDO (NONE SI NO TIENE USUARIO)
+def update_user_id(raw_update: dict):
+    for tipo in _UPDATE_TYPES:
+        contenido = raw_update.get(tipo)
+        if contenido:
+            usuario = contenido.get("from") or contenido.get("chat") or {}
+            return usuario.get("id")
+    return None
+
+# FUNCION PARA ELEGIR EL WORKER DE UN UPDATE, LOS UPDATES SIN USUARIO SE REPARTEN POR update_id
+def shard_for(raw_update: dict, workers: int) -> int:
+    return _clave(raw_update) % workers
+
+def _clave(raw_update: dict) -> int:
+    telegram_id = update_user_id(raw_update)
+    return telegram_id if telegram_id is not None else raw_update.get("update_id", 0)
+
+# --- PROCESO WORKER ---
+
+# CADA WORKER REPARTE SU CUOTA DE GEMINI CON LOS DEMAS Y EXPONE SUS METRICAS EN SU PROPIO PUERTO
+# SE HACE ANTES DE IMPORTAR main.py PORQUE LOS MODULOS LEEN ESTAS VARIABLES AL IMPORTARSE
+def _configurar_entorno_worker(index: int, workers: int):
+    rpm = float(os.getenv("GEMINI_RPM", "60"))
+    burst = int(os.getenv("GEMINI_BURST", "10"))
+    os.environ["GEMINI_RPM"] = str(max(rpm / workers, 1.0))
+    os.environ["GEMINI_BURST"] = str(max(burst // workers, 1))
+    os.environ["DB_POOL_SIZE"] = str(WORKER_DB_POOL_SIZE)
+    metrics_port = int(os.getenv("METRICS_PORT", "0"))
+    if metrics_port:
+        os.environ["METRICS_PORT"] = str(metrics_port + index + 1)
+
+# EL WORKER LEE SU COLA CON UN SOLO HILO Y PASA CADA UPDATE AL CARRIL telegram_id % WORKER_THREADS
+# CADA CARRIL LO ATIENDE UN UNICO HILO, ASI LOS UPDATES DE UN MISMO USUARIO SE PROCESAN DE A UNO Y EN ORDEN DE LLEGADA
+# TODAS LAS CLAVES DE UN WORKER DAN EL MISMO RESTO MODULO workers, POR ESO EL CARRIL SE ELIGE CON clave // workers
+def _repartir(updates, carriles: list, workers: int):
+    while True:
+        raw_update = updates.get()
+        if raw_update is _STOP:
+            for carril in carriles:
+                carril.put(_STOP)
+            return
+        carriles[(_clave(raw_update) // workers) % len(carriles)].put(raw_update)
+
+def _consumir(bot, carril, heartbeat, nombre: str):
+    import telebot
+    while True:
+        try:
+            raw_update = carril.get(timeout=HEARTBEAT_EVERY_S)
+        except queue.Empty:
+            heartbeat.value = time.time()
+            continue
+        if raw_update is _STOP:
+            return
+        try:
+            bot.process_new_updates([telebot.types.Update.de_json(raw_update)])
+        except Exception as e:
+            logger.error(f"Error procesando update en {nombre}: {e}", exc_info=True)
+        heartbeat.value = time.time()
+
+# PUNTO DE ENTRADA DE CADA PROCESO WORKER: CONFIGURA SU DB Y SUS SERVICIOS Y ATIENDE SU COLA CON WORKER_THREADS CARRILES
+def worker_main(index: int, workers: int, updates, heartbeat):
+    nombre = f"worker-{index}"
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s - {nombre} - %(levelname)s - %(message)s")
+    # EL SUPERVISOR COORDINA EL APAGADO, EL WORKER IGNORA CTRL+C Y ESPERA SU MARCA DE FIN EN LA COLA
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _configurar_entorno_worker(index, workers)
+
+    import interacciones
+    import main
+    from db import conexiones
+
+    conexiones.init_pool(size=WORKER_DB_POOL_SIZE)
+    main.start_background_services()
+    # LOS HANDLERS SE EJECUTAN EN LOS HILOS DEL WORKER, NO EN EL POOL INTERNO DE TELEBOT
+    main.bot.threaded = False
+    heartbeat.value = time.time()
+    logger.info(f"{nombre} listo (pid {os.getpid()}, {WORKER_THREADS} hilos, pool de {WORKER_DB_POOL_SIZE} conexiones).")
+
+    carriles = [queue.Queue(maxsize=WORKER_QUEUE_SIZE) for _ in range(WORKER_THREADS)]
+    hilos = [threading.Thread(target=_consumir, args=(main.bot, carril, heartbeat, nombre), name=f"{nombre}-{i}")
+             for i, carril in enumerate(carriles)]
+    hilos.append(threading.Thread(target=_repartir, args=(updates, carriles, workers), name=f"{nombre}-reparto"))
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    interacciones.stop()
+    conexiones.close_pool()
+    logger.info(f"{nombre} drenado y detenido.")
+
+# --- SUPERVISOR ---
+
+class WorkerHandle:
+    def __init__(self, index: int, ctx):
+        self.index = index
+        self._ctx = ctx
+        self.updates = ctx.Queue(maxsize=WORKER_QUEUE_SIZE)
+        self.heartbeat = ctx.Value("d", 0.0)
+        self.process = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.consecutive_crashes = 0
+        self.restart_at = 0.0
+
+    def start(self, workers: int):
+        self.heartbeat.value = time.time()
+        self.process = self._ctx.Process(target=worker_main, args=(self.index, workers, self.updates, self.heartbeat),
+                                         name=f"worker-{self.index}", daemon=False)
+        self.process.start()
+        self.started_at = time.time()
+        self.restart_at = 0.0
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def heartbeat_age(self) -> float:
+        return time.time() - self.heartbeat.value
+
+    # UN PROCESO QUE MUERE MIENTRAS LEE DE LA COLA LA DEJA BLOQUEADA PARA SIEMPRE, POR ESO CADA WORKER NUEVO RECIBE UNA COLA NUEVA
+    # LO QUE SE PUEDE LEER DE LA VIEJA SE PASA A LA NUEVA, DEVUELVE CUANTOS UPDATES SE PERDIERON
+    def replace_queue(self) -> int:
+        vieja = self.updates
+        self.updates = self._ctx.Queue(maxsize=WORKER_QUEUE_SIZE)
+        while True:
+            try:
+                raw_update = vieja.get_nowait()
+            except (queue.Empty, OSError, EOFError):
+                break
+            if raw_update is not _STOP:
+                self.updates.put(raw_update)
+        try:
+            perdidos = vieja.qsize()
+        except NotImplementedError:
+            perdidos = 0
+        vieja.close()
+        return perdidos
+
+    def status(self) -> dict:
+        return {
+            "index": self.index,
+            "pid": self.process.pid if self.process is not None else None,
+            "alive": self.alive(),
+            "heartbeat_age_s": round(self.heartbeat_age(), 1),
+            "restarts": self.restarts,
+            "queue_depth": self._profundidad(),
+        }
+
+    def _profundidad(self) -> int:
+        try:
+            return self.updates.qsize()
+        except NotImplementedError:
+            return -1
+
+class Supervisor:
+    def __init__(self, workers: int = BOT_WORKERS):
+        self.workers = max(workers, 1)
+        ctx = multiprocessing.get_context("spawn")
+        self.handles = [WorkerHandle(i, ctx) for i in range(self.workers)]
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {"routed": 0, "restarts": 0, "dropped_on_restart": 0}
+
+    def start(self):
+        for handle in self.handles:
+            handle.start(self.workers)
+        threading.Thread(target=self._vigilar, name="supervisor-health", daemon=True).start()
+        logger.info(f"Supervisor iniciado con {self.workers} workers.")
+
+    # FUNCION PARA ENVIAR UN UPDATE CRUDO A SU WORKER, SI LA COLA ESTA LLENA ESPERA (EL POLLING SE FRENA, BACKPRESSURE)
+    def route(self, raw_update: dict):
+        handle = self.handles[shard_for(raw_update, self.workers)]
+        while not self._stopping.is_set():
+            try:
+                handle.updates.put(raw_update, timeout=1.0)
+                break
+            except queue.Full:
+                logger.warning(f"Cola del worker-{handle.index} llena, esperando...")
+        with self._lock:
+            self._stats["routed"] += 1
+
+    # CHEQUEO PERIODICO: WORKER CAIDO -> SE REINICIA CON BACKOFF, WORKER SIN HEARTBEAT -> SE MATA Y SE REINICIA
+    def _vigilar(self):
+        while not self._stopping.wait(WORKER_HEALTH_INTERVAL_S):
+            for handle in self.handles:
+                self.check_worker(handle)
+
+    def check_worker(self, handle: WorkerHandle):
+        if self._stopping.is_set():
+            return
+        ahora = time.time()
+        if handle.alive():
+            if handle.heartbeat_age() <= WORKER_HEARTBEAT_TIMEOUT_S:
+                return
+            logger.error(f"worker-{handle.index} sin heartbeat hace {handle.heartbeat_age():.0f}s, se reinicia.")
+            handle.process.kill()
+            handle.process.join(5)
+        if handle.restart_at == 0.0:
+            # PRIMERA VEZ QUE SE LO VE CAIDO: SE PROGRAMA EL REINICIO SEGUN CUANTAS VECES SEGUIDAS SE CAYO
+            vivio = ahora - handle.started_at
+            handle.consecutive_crashes = 1 if vivio >= WORKER_STABLE_AFTER_S else handle.consecutive_crashes + 1
+            espera = min(WORKER_RESTART_BACKOFF_MAX_S, 0.5 * 2 ** (handle.consecutive_crashes - 1))
+            handle.restart_at = ahora + espera
+            logger.error(f"worker-{handle.index} terminó (código {handle.process.exitcode}) tras {vivio:.0f}s, "
+                         f"se reinicia en {espera:.1f}s.")
+            perdidos = handle.replace_queue()
+            if perdidos:
+                with self._lock:
+                    self._stats["dropped_on_restart"] += perdidos
+                logger.warning(f"Se perdieron {perdidos} updates encolados del worker-{handle.index}.")
+            return
+        if ahora >= handle.restart_at:
+            handle.restarts += 1
+            with self._lock:
+                self._stats["restarts"] += 1
+            metricas.inc("bot_worker_restarts_total", worker=str(handle.index))
+            handle.start(self.workers)
+
+    # APAGADO ORDENADO: CADA WORKER RECIBE UNA MARCA DE FIN DETRAS DE LO QUE YA TENIA EN COLA, SU REPARTIDOR LA PASA A CADA CARRIL
+    # LOS QUE NO TERMINAN EN WORKER_DRAIN_TIMEOUT_S SE FUERZAN A SALIR
+    def stop(self, timeout_s: float = WORKER_DRAIN_TIMEOUT_S):
+        self._stopping.set()
+        logger.info("Drenando workers...")
+        for handle in self.handles:
+            if handle.alive():
+                try:
+                    handle.updates.put(_STOP, timeout=timeout_s)
+                except queue.Full:
+                    pass
+        limite = time.time() + timeout_s
+        for handle in self.handles:
+            if handle.process is None:
+                continue
+            handle.process.join(max(limite - time.time(), 0))
+            if handle.process.is_alive():
+                logger.error(f"worker-{handle.index} no terminó de drenar en {timeout_s:.0f}s, se fuerza la salida.")
+                handle.process.terminate()
+                handle.process.join(5)
+        logger.info(f"Supervisor detenido. {self.stats()}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["workers"] = [handle.status() for handle in self.handles]
+        return stats
+
+    def alive_count(self) -> int:
+        return sum(1 for handle in self.handles if handle.alive())
+
+    def register_metrics(self):
+        metricas.register_gauge("bot_workers_alive", self.alive_count)
+        metricas.register_gauge("bot_worker_queue_depth", lambda: sum(max(h._profundidad(), 0) for h in self.handles))
+        return self
+
+# LONG-POLLING EN EL SUPERVISOR: PIDE LOS UPDATES CRUDOS A TELEGRAM Y LOS REPARTE, EL OFFSET AVANZA SOLO TRAS ENCOLARLOS
+def poll_updates(supervisor: Supervisor, token: str, stop_event: threading.Event):
+    from telebot import apihelper
+    offset = None
+    while not stop_event.is_set():
+        try:
+            raw_updates = apihelper.get_updates(token, offset=offset, timeout=POLL_TIMEOUT_S,
+                                                long_polling_timeout=POLL_TIMEOUT_S)
+        except Exception as e:
+            logger.error(f"Error al pedir updates a Telegram: {e}")
+            stop_event.wait(3)
+            continue
+        for raw_update in raw_updates:
+            supervisor.route(raw_update)
+            offset = raw_update["update_id"] + 1
+    # TELEGRAM CONFIRMA LOS UPDATES RECIEN EN EL SIGUIENTE getUpdates, SIN ESTO EL ULTIMO LOTE SE REPETIRIA AL REINICIAR
+    if offset is not None:
+        try:
+            apihelper.get_updates(token, offset=offset, limit=1, timeout=0)
+        except Exception as e:
+            logger.warning(f"No se pudo confirmar el último lote de updates: {e}")
+
+def run():
+    from dotenv import load_dotenv
+    load_dotenv()
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    # MISMA VALIDACION QUE main.check_credentials, SIN IMPORTAR main EN EL SUPERVISOR (NO ATIENDE MENSAJES)
+    if not token or not os.getenv("GOOGLE_API_KEY"):
+        print("¡Error! Asegúrate de que TELEGRAM_BOT_TOKEN y GOOGLE_API_KEY están definidos en tu archivo .env")
+        sys.exit(1)
+
+    # LAS MIGRACIONES SE APLICAN UNA SOLA VEZ AQUI, ANTES DE QUE LOS WORKERS ABRAN SUS CONEXIONES
+    from db import baseDatos
+    baseDatos.setup_database()
+
+    supervisor = Supervisor().register_metrics()
+    supervisor.start()
+    metricas.start_from_env()
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    poller = threading.Thread(target=poll_updates, args=(supervisor, token, stop_event), name="supervisor-poller", daemon=True)
+    poller.start()
+    try:
+        while not stop_event.wait(1):
+            pass
+    except KeyboardInterrupt:
+        stop_event.set()
+    logger.info("Deteniendo el supervisor...")
+    # SE ESPERA A QUE TERMINE EL LONG-POLL EN CURSO PARA NO PERDER LOS UPDATES QUE YA SE CONFIRMARON A TELEGRAM
+    poller.join(POLL_TIMEOUT_S + 5)
+    supervisor.stop()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - supervisor - %(levelname)s - %(message)s")
+    run()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# LOS TESTS IMPORTAN LOS MODULOS DEL BOT DESDE LA RAIZ DEL REPOSITORIO
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,40 @@
+import pytest
+
+import autenticacion
+
+
+@pytest.fixture(autouse=True)
+def registro_vacio(monkeypatch):
+    autenticacion._failed_attempts.clear()
+    reloj = [1000.0]
+    monkeypatch.setattr(autenticacion.time, "monotonic", lambda: reloj[0])
+    yield reloj
+    autenticacion._failed_attempts.clear()
+
+
+def test_bloqueo_tras_fallos_seguidos(registro_vacio):
+    for _ in range(autenticacion.MAX_FAILED_ATTEMPTS):
+        autenticacion.register_failure(1)
+    assert autenticacion.lockout_remaining(1) == autenticacion.LOCKOUT_S
+    registro_vacio[0] += autenticacion.LOCKOUT_S
+    assert autenticacion.lockout_remaining(1) == 0.0
+    assert 1 not in autenticacion._failed_attempts
+
+
+def test_fallos_viejos_no_cuentan(registro_vacio):
+    for _ in range(autenticacion.MAX_FAILED_ATTEMPTS - 1):
+        autenticacion.register_failure(1)
+    registro_vacio[0] += autenticacion.FAILED_PIN_WINDOW_S
+    assert autenticacion.register_failure(1) == 1
+    assert autenticacion.lockout_remaining(1) == 0.0
+
+
+def test_registro_acotado(registro_vacio, monkeypatch):
+    monkeypatch.setattr(autenticacion, "MAX_CACHED_USERS", 3)
+    autenticacion.register_failure(1)
+    registro_vacio[0] += autenticacion.FAILED_PIN_WINDOW_S
+    for telegram_id in (2, 3, 4, 5):
+        autenticacion.register_failure(telegram_id)
+    assert len(autenticacion._failed_attempts) <= 3
+    assert 1 not in autenticacion._failed_attempts
+    assert 5 in autenticacion._failed_attempts
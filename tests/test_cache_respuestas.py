@@ -0,0 +1,32 @@
+import pytest
+
+import cache_respuestas
+
+
+@pytest.fixture(autouse=True)
+def cache_vacia():
+    cache_respuestas._cache.clear()
+    yield
+    cache_respuestas._cache.clear()
+
+
+def test_nombre_se_reemplaza_solo_como_palabra():
+    respuesta = "Hola Ana, la tarjeta Anabel Gold se pide hoy y llega mañana."
+    cache_respuestas.store_answer("¿Qué tarjetas ofrecen?", "Ana", respuesta)
+    assert cache_respuestas.get_cached_answer("¿Qué tarjetas ofrecen?", "Luis") == \
+        "Hola Luis, la tarjeta Anabel Gold se pide hoy y llega mañana."
+
+
+def test_nombre_en_la_pregunta_comparte_la_clave():
+    cache_respuestas.store_answer("Ana, ¿qué tarjetas ofrecen?", "Ana", "Hola Ana, tenemos Visa y Master.")
+    assert cache_respuestas.get_cached_answer("Luis ¿que tarjetas ofrecen", "Luis") == "Hola Luis, tenemos Visa y Master."
+
+
+def test_nombre_corto_no_se_guarda():
+    cache_respuestas.store_answer("¿Qué tarjetas ofrecen?", "Al", "Hola Al, tenemos tarjetas al instante.")
+    assert cache_respuestas.get_cached_answer("¿Qué tarjetas ofrecen?", "Luis") is None
+
+
+def test_sin_nombre_se_guarda_tal_cual():
+    cache_respuestas.store_answer("¿Qué tarjetas ofrecen?", "", "Tenemos Visa y Master.")
+    assert cache_respuestas.get_cached_answer("¿Qué tarjetas ofrecen?", "") == "Tenemos Visa y Master."
@@ -0,0 +1,54 @@
+import sqlite3
+
+import pytest
+
+from db import extractos, migraciones
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / "extractos.db")
+    migraciones.migrate(conn)
+    conn.execute("INSERT INTO users (telegram_id, name, pin) VALUES (1, 'Ana', 'x')")
+    conn.execute("INSERT INTO cuentas (id, telegram_id, name, dinero, currency) VALUES (1, 1, 'Caja', 0, 'UYU')")
+    for dia in range(1, 8):
+        conn.execute("INSERT INTO hmovimientos (telegram_id, account_id, name, dinero, timestamp) VALUES (1, 1, ?, 1, ?)",
+                     (f"mov {dia}", f"2026-01-0{dia} 10:00:00"))
+    for i in range(3):
+        conn.execute("INSERT INTO hmovimientos (telegram_id, account_id, name, dinero, timestamp) VALUES (1, 1, ?, 1, NULL)", (f"sin fecha {i}",))
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _recorrer(conn, cursor, page_size):
+    vistos = []
+    while True:
+        filas, cursor = extractos.fetch_page(conn, 1, cursor, page_size)
+        vistos += [fila[0] for fila in filas]
+        if cursor is None:
+            return vistos
+        cursor = extractos.decode_cursor(extractos.encode_cursor(*cursor))
+
+
+def test_paginas_sin_repetir_ni_saltear(conn):
+    todos = [fila[0] for fila in extractos.iter_movements(conn, 1)]
+    assert len(todos) == 10
+    for page_size in (1, 2, 3, 5, 10):
+        assert _recorrer(conn, None, page_size) == todos
+
+
+def test_ver_mas_sigue_despues_del_resumen(conn):
+    primeros, cursor = extractos.fetch_page(conn, 1, page_size=5)
+    callback = extractos.encode_cursor(*cursor)
+    siguiente, _ = extractos.fetch_page(conn, 1, extractos.decode_cursor(callback))
+    assert not {fila[0] for fila in primeros} & {fila[0] for fila in siguiente}
+    assert len(siguiente) == 5
+
+
+def test_cursor_sin_fecha(conn):
+    assert extractos.encode_cursor(None, 42) == "mov:|42"
+    assert extractos.decode_cursor("mov:|42") == (None, 42)
+    assert extractos.decode_cursor("mov:") is None
+    with pytest.raises(ValueError):
+        extractos.decode_cursor("mov:ayer|42")
@@ -0,0 +1,79 @@
+import sqlite3
+
+import pytest
+
+from db import libroMayor, migraciones
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / "libro.db")
+    migraciones.migrate(conn)
+    conn.execute("INSERT INTO users (telegram_id, name, pin) VALUES (1, 'Ana', 'x')")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _cuenta_sin_centavos(conn, dinero=150.25):
+    # COMO EL BENCHMARK: SOLO CARGA dinero
+    cursor = conn.execute("INSERT INTO cuentas (telegram_id, name, dinero, currency) VALUES (1, 'Caja', ?, 'UYU')", (dinero,))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def test_cuenta_sin_centavos_se_completa_al_insertar(conn):
+    account_id = _cuenta_sin_centavos(conn)
+    assert conn.execute("SELECT saldo_centavos, saldo_inicial_centavos FROM cuentas WHERE id = ?", (account_id,)).fetchone() == (15025, 15025)
+    assert libroMayor.check_consistency(conn) == {}
+
+
+def test_movimiento_sobre_cuenta_sin_centavos(conn):
+    account_id = _cuenta_sin_centavos(conn)
+    libroMayor.post_movement(conn, account_id, "Depósito", 1000)
+    libroMayor.post_movement(conn, account_id, "Compra", -2025)
+    assert libroMayor.balance(conn, account_id) == 14000
+    assert conn.execute("SELECT dinero FROM cuentas WHERE id = ?", (account_id,)).fetchone()[0] == 140.0
+    assert libroMayor.check_consistency(conn) == {}
+
+
+def test_saldo_nulo_parte_de_dinero(conn):
+    account_id = _cuenta_sin_centavos(conn, 10)
+    conn.execute("UPDATE cuentas SET saldo_centavos = NULL WHERE id = ?", (account_id,))
+    conn.commit()
+    libroMayor.post_movement(conn, account_id, "Depósito", 500)
+    assert libroMayor.balance(conn, account_id) == 1500
+
+
+def test_movimiento_sin_centavos_se_completa(conn):
+    account_id = _cuenta_sin_centavos(conn)
+    conn.execute("INSERT INTO hmovimientos (telegram_id, account_id, name, dinero) VALUES (1, ?, 'Legado', -0.25)", (account_id,))
+    assert conn.execute("SELECT monto_centavos FROM hmovimientos").fetchone()[0] == -25
+
+
+def test_saldo_insuficiente(conn):
+    account_id = _cuenta_sin_centavos(conn, 1)
+    with pytest.raises(libroMayor.InsufficientFunds):
+        libroMayor.post_movement(conn, account_id, "Retiro", -101)
+    assert libroMayor.balance(conn, account_id) == 100
+    assert conn.execute("SELECT COUNT(*) FROM hmovimientos").fetchone()[0] == 0
+
+
+def test_saldo_a_una_fecha_con_snapshots(conn):
+    account_id = _cuenta_sin_centavos(conn, 0)
+    libroMayor.post_movement(conn, account_id, "Sueldo", 100000, timestamp="2026-01-01 10:00:00")
+    libroMayor.post_movement(conn, account_id, "Alquiler", -40000, timestamp="2026-01-02 09:00:00")
+    libroMayor.take_snapshots(conn, "2026-01-02 00:00:00")
+    libroMayor.post_movement(conn, account_id, "Compra", -500, timestamp="2026-01-03 12:00:00")
+    assert libroMayor.balance_as_of(conn, account_id, "2026-01-01 23:59:59") == 100000
+    assert libroMayor.balance_as_of(conn, account_id, "2026-01-02 23:59:59") == 60000
+    assert libroMayor.balance_as_of(conn, account_id, "2026-01-03 23:59:59") == 59500
+    assert libroMayor.check_consistency(conn) == {}
+
+
+def test_fecha_por_defecto_en_utc(conn):
+    account_id = _cuenta_sin_centavos(conn)
+    libroMayor.post_movement(conn, account_id, "Depósito", 100)
+    conn.execute("INSERT INTO hmovimientos (telegram_id, account_id, name, dinero) VALUES (1, ?, 'Legado', 1)", (account_id,))
+    propio, legado = [fila[0] for fila in conn.execute("SELECT timestamp FROM hmovimientos ORDER BY id")]
+    assert propio[:13] == legado[:13]
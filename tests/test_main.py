@@ -0,0 +1,117 @@
+import sqlite3
+from types import SimpleNamespace as NS
+
+import pytest
+
+import autenticacion
+import cache_respuestas
+import cache_usuarios
+import main
+import memoria_conversacion
+from db import conexiones, migraciones
+
+PREGUNTA = "¿Qué tarjetas ofrecen?"
+
+
+class ModeloFalso:
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, prompt_content, stream=False):
+        self.prompts.append(prompt_content)
+        texto = "Te recomiendo la tarjeta Oro." if "viaje a Madrid" in prompt_content else "Ofrecemos Visa y Master."
+        candidate = NS(finish_reason=NS(name="STOP"), content=NS(parts=[NS(text=texto)]), safety_ratings=[])
+        return NS(candidates=[candidate])
+
+
+class BotFalso:
+    def __init__(self):
+        self.respuestas = {}
+        self.botones = []
+
+    def reply_to(self, message, text, **kwargs):
+        self.respuestas.setdefault(message.chat.id, []).append(text)
+        return NS(chat=message.chat, message_id=1)
+
+    def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        self.respuestas.setdefault(chat_id, []).append(text)
+        self.botones.append(reply_markup)
+        return NS(chat=NS(id=chat_id), message_id=1)
+
+
+def _mensaje(texto, telegram_id):
+    return NS(text=texto, content_type="text", chat=NS(id=telegram_id),
+              from_user=NS(id=telegram_id, first_name=f"Usuario{telegram_id}", username=f"user{telegram_id}"))
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "bot.db")
+    conn = sqlite3.connect(db_path)
+    migraciones.migrate(conn)
+    conn.close()
+    conexiones.close_pool()
+    conexiones.init_pool(db_path, 2)
+    bot = BotFalso()
+    monkeypatch.setattr(main, "bot", bot)
+    monkeypatch.setattr(main, "model", ModeloFalso())
+    monkeypatch.setattr(main.respuestas_stream, "STREAMING_REPLIES", False)
+    cache_respuestas._cache.clear()
+    yield bot
+    cache_respuestas._cache.clear()
+    cache_usuarios._cache.clear()
+    for telegram_id in (1, 2):
+        memoria_conversacion.forget(telegram_id)
+    conexiones.close_pool()
+
+
+def test_respuesta_con_historial_no_se_comparte(bot):
+    memoria_conversacion.add_exchange(1, "Me voy de viaje a Madrid", "¡Buen viaje!")
+    main.handle_non_command_message(_mensaje(PREGUNTA, 1))
+    main.handle_non_command_message(_mensaje(PREGUNTA, 2))
+    assert bot.respuestas[1] == ["Te recomiendo la tarjeta Oro."]
+    assert bot.respuestas[2] == ["Ofrecemos Visa y Master."]
+    assert len(main.model.prompts) == 2
+
+
+def test_respuesta_sin_historial_se_comparte(bot):
+    main.handle_non_command_message(_mensaje(PREGUNTA, 1))
+    main.handle_non_command_message(_mensaje(PREGUNTA, 2))
+    assert bot.respuestas[2] == ["Ofrecemos Visa y Master."]
+    assert len(main.model.prompts) == 1
+
+
+def _cargar_movimientos(cantidad):
+    with conexiones.get_connection() as conn:
+        conn.execute("INSERT INTO users (telegram_id, name, pin) VALUES (1, 'Ana', 'x')")
+        conn.execute("INSERT INTO cuentas (id, telegram_id, name, dinero, currency) VALUES (1, 1, 'Caja', 100, 'UYU')")
+        for dia in range(1, cantidad + 1):
+            conn.execute("INSERT INTO hmovimientos (telegram_id, account_id, name, dinero, timestamp) VALUES (1, 1, ?, 1, ?)",
+                         (f"mov {dia}", f"2026-01-{dia:02d} 10:00:00"))
+        conn.commit()
+
+
+def _ver_mas(markup):
+    return [boton.callback_data for fila in markup.keyboard for boton in fila if boton.callback_data.startswith("mov:")]
+
+
+def test_ver_mas_del_saldo_cacheado_sin_tocar_la_db(bot):
+    # 7 MOVIMIENTOS: SE MUESTRAN DEL 7 AL 3 Y "VER MAS" SIGUE DESPUES DEL 3
+    _cargar_movimientos(7)
+    autenticacion.grant_session(1)
+    try:
+        main.handle_non_command_message(_mensaje("ver mi saldo", 1))
+        checkouts = conexiones.pool_stats()["checkouts"]
+        main.handle_non_command_message(_mensaje("ver mi saldo", 1))
+        assert conexiones.pool_stats()["checkouts"] == checkouts
+    finally:
+        autenticacion.revoke_session(1)
+    primero, segundo = bot.botones
+    assert _ver_mas(primero) == _ver_mas(segundo) == ["mov:2026-01-03 10:00:00|3"]
+
+
+def test_sin_ver_mas_si_no_hay_mas_movimientos(bot):
+    _cargar_movimientos(main.ULTIMOS_MOVIMIENTOS)
+    texto, markup = main.run_protected_action("saldo", 1)
+    assert "mov 1" in texto
+    assert _ver_mas(markup) == []
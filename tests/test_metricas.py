@@ -0,0 +1,36 @@
+import asyncio
+
+import telebot
+from telebot import asyncio_helper, apihelper
+from telebot.async_telebot import AsyncTeleBot
+
+import metricas
+
+MENSAJE = {"message_id": 2, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "hola"}
+
+
+def _observaciones() -> dict:
+    lineas = metricas.render_prometheus().splitlines()
+    return {linea.split(" ")[0]: float(linea.split(" ")[1]) for linea in lineas if linea.startswith("bot_telegram_send_seconds_count")}
+
+
+def test_reply_to_se_mide_una_sola_vez(monkeypatch):
+    metricas.reset()
+    monkeypatch.setattr(apihelper, "send_message", lambda *args, **kwargs: MENSAJE)
+    bot = metricas.instrument_bot(telebot.TeleBot("123:abc", validate_token=False))
+    bot.reply_to(telebot.types.Message.de_json(MENSAJE), "respuesta")
+    assert _observaciones() == {'bot_telegram_send_seconds_count{method="send_message"}': 1}
+    metricas.reset()
+
+
+def test_reply_to_async_se_mide_una_sola_vez(monkeypatch):
+    metricas.reset()
+
+    async def _enviar(*args, **kwargs):
+        return MENSAJE
+
+    monkeypatch.setattr(asyncio_helper, "send_message", _enviar)
+    bot = metricas.instrument_bot(AsyncTeleBot("123:abc", validate_token=False))
+    asyncio.run(bot.reply_to(telebot.types.Message.de_json(MENSAJE), "respuesta"))
+    assert _observaciones() == {'bot_telegram_send_seconds_count{method="send_message"}': 1}
+    metricas.reset()
@@ -0,0 +1,83 @@
+import pytest
+
+import planificador_llm
+from planificador_llm import CircuitBreaker, LLMScheduler, LLMUnavailable
+
+
+class ServiceUnavailable(Exception):
+    pass
+
+
+class ProveedorFalso:
+    def __init__(self, chunks=("Hola", " mundo"), error=None, error_en_chunk=None):
+        self.chunks = chunks
+        self.error = error
+        self.error_en_chunk = error_en_chunk
+
+    def generate_content(self, prompt_content, stream=False):
+        if self.error:
+            raise self.error
+        return RespuestaFalsa(self.chunks, self.error_en_chunk)
+
+
+class RespuestaFalsa:
+    text = "Hola mundo"
+
+    def __init__(self, chunks, error_en_chunk):
+        self.chunks = chunks
+        self.error_en_chunk = error_en_chunk
+
+    def __iter__(self):
+        for i, chunk in enumerate(self.chunks):
+            if i == self.error_en_chunk:
+                raise ServiceUnavailable("503")
+            yield chunk
+
+
+def _planificador(proveedor, failure_threshold=1):
+    return LLMScheduler(proveedor, rpm=6000, burst=10, max_retries=0, breaker=CircuitBreaker(failure_threshold, 60))
+
+
+def test_stream_ocupa_el_lugar_hasta_terminar():
+    planificador = _planificador(ProveedorFalso())
+    response = planificador.generate_content("hola", stream=True)
+    assert planificador.stats()["in_flight"] == 1
+    assert planificador.stats()["completed"] == 0
+    assert list(response) == ["Hola", " mundo"]
+    assert response.text == "Hola mundo"
+    assert planificador.stats()["in_flight"] == 0
+    assert planificador.stats()["completed"] == 1
+
+
+def test_stream_cerrado_antes_de_terminar_libera_el_lugar():
+    planificador = _planificador(ProveedorFalso())
+    response = planificador.generate_content("hola", stream=True)
+    next(response)
+    response.close()
+    assert planificador.stats()["in_flight"] == 0
+
+
+def test_error_a_mitad_del_stream_cuenta_como_falla():
+    planificador = _planificador(ProveedorFalso(error_en_chunk=1))
+    response = planificador.generate_content("hola", stream=True)
+    with pytest.raises(LLMUnavailable):
+        list(response)
+    assert planificador.stats()["in_flight"] == 0
+    assert planificador.breaker.is_open
+
+
+def test_error_no_reintentable_no_abre_el_breaker():
+    planificador = _planificador(ProveedorFalso(error=ValueError("prompt inválido")))
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            planificador.generate_content("hola")
+    assert planificador.breaker.state == CircuitBreaker.CLOSED
+    assert planificador.stats()["failures"] == 3
+
+
+def test_error_de_disponibilidad_abre_el_breaker(monkeypatch):
+    monkeypatch.setattr(planificador_llm, "backoff_delay", lambda attempt: 0)
+    planificador = _planificador(ProveedorFalso(error=ServiceUnavailable("503")))
+    with pytest.raises(LLMUnavailable):
+        planificador.generate_content("hola")
+    assert planificador.breaker.is_open
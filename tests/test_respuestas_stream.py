@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+import pytest
+
+import respuestas_stream
+
+
+class BotFalso:
+    def __init__(self):
+        self.borrados = []
+        self.ediciones = []
+
+    def reply_to(self, message, text):
+        return SimpleNamespace(chat=SimpleNamespace(id=1), message_id=10)
+
+    def edit_message_text(self, text, chat_id, message_id):
+        self.ediciones.append(text)
+
+    def delete_message(self, chat_id, message_id):
+        self.borrados.append(message_id)
+
+
+def _chunk(texto):
+    parte = SimpleNamespace(text=texto)
+    return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[parte]))])
+
+
+class ModeloQueSeCorta:
+    def generate_content(self, prompt_content, stream=False):
+        def chunks():
+            yield _chunk("Hola, te cuento que")
+            raise ConnectionError("stream cortado")
+        return chunks()
+
+
+def test_error_a_mitad_del_stream_borra_el_provisorio():
+    bot = BotFalso()
+    with pytest.raises(ConnectionError):
+        respuestas_stream.stream_reply(bot, None, ModeloQueSeCorta(), "hola", "Ana", lambda *args: ("", False))
+    assert bot.ediciones == ["Hola, te cuento que"]
+    assert bot.borrados == [10]
@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+from db import simuladorPrestamos
+
+
+def test_monto_y_plazo_en_cuotas():
+    assert simuladorPrestamos.parse_loan_request("¿Cuánto pagaría si pido 100.000 en 24 cuotas?") == (100000.0, 24)
+
+
+def test_plazo_en_anos():
+    assert simuladorPrestamos.parse_loan_request("préstamo de 200 mil a 3 años") == (200000.0, 36)
+
+
+def test_consulta_de_deuda_no_es_simulacion():
+    texto = "¿cuánto debo de mi préstamo de 50.000?"
+    assert simuladorPrestamos.parse_loan_request(texto) == (50000.0, None)
+    assert not simuladorPrestamos.is_simulation_request(texto)
+
+
+def test_ano_no_es_monto():
+    texto = "préstamo que vence en 2024"
+    assert simuladorPrestamos.parse_loan_request(texto) == (None, None)
+    assert not simuladorPrestamos.is_simulation_request(texto)
+
+
+def test_ano_con_moneda_es_monto():
+    assert simuladorPrestamos.parse_loan_request("si pido $2000 en 12 cuotas")[0] == 2000.0
+    assert simuladorPrestamos.parse_loan_request("si pido 2000 pesos en 12 cuotas")[0] == 2000.0
+    assert simuladorPrestamos.parse_loan_request("si pido u$s 1999 en 12 cuotas")[0] == 1999.0
+
+
+def test_ano_junto_a_monto_real():
+    assert simuladorPrestamos.parse_loan_request("en 2025 quiero pedir 80.000 en 12 cuotas") == (80000.0, 12)
+
+
+def test_simulacion_con_monto_y_plazo():
+    assert simuladorPrestamos.is_simulation_request("préstamo de 50.000 en 12 meses")
+
+
+def test_numpy_no_se_importa_al_cargar_el_modulo():
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    codigo = "import sys; from db import simuladorPrestamos; simuladorPrestamos.is_simulation_request('100.000 en 12 cuotas'); print('numpy' in sys.modules)"
+    salida = subprocess.run([sys.executable, "-c", codigo], cwd=raiz, capture_output=True, text=True, check=True).stdout
+    assert salida.strip() == "False"
+
+
+def test_formato_de_simulacion():
+    texto = simuladorPrestamos.format_simulation(100000.0, 24, "estandar")
+    assert "- 24 cuotas de $" in texto and "<- tu consulta" in texto
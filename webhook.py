@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import telebot
+
+logger = logging.getLogger(__name__)
+
+# MODO WEBHOOK: UN SERVIDOR HTTP LOCAL RECIBE LOS UPDATES DE TELEGRAM Y LOS ENCOLA SIN PROCESARLOS
+# UN GRUPO DE WORKERS VACIA LA COLA CON bot.process_new_updates, ASI RECIBIR Y ATENDER QUEDAN SEPARADOS
+# SI LA COLA ESTA LLENA SE RESPONDE 503 PARA QUE TELEGRAM REINTENTE MAS TARDE (BACKPRESSURE)
+# PRUEBA SIN CONEXION: curl -X POST -d @update.json http://127.0.0.1:8080/webhook
+
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+MAX_BODY_BYTES = 1024 * 1024
+WEBHOOK_READ_TIMEOUT_S = float(os.getenv("WEBHOOK_READ_TIMEOUT_S", "10"))
+
+_STOP = object()
+
+_stats_lock = threading.Lock()
+_stats = {
+    "received": 0,
+    "enqueued": 0,
+    "dropped": 0,
+    "rejected": 0,
+    "processed": 0,
+    "errors": 0,
+    "queue_high_watermark": 0,
+}
+_update_queue = None
+
+def _sumar(clave: str, cantidad: int = 1):
+    with _stats_lock:
+        _stats[clave] += cantidad
+
+# FUNCION PARA CONSULTAR LAS METRICAS DEL WEBHOOK (RECIBIDOS, DESCARTADOS POR COLA LLENA, PROCESADOS, ERRORES)
+def webhook_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["queue_depth"] = _update_queue.qsize() if _update_queue is not None else 0
+    stats["queue_size"] = _update_queue.maxsize if _update_queue is not None else 0
+    return stats
+
+# FUNCION PARA ENCOLAR UN UPDATE CRUDO, DEVUELVE FALSE SI LA COLA ESTA LLENA (SE CUENTA COMO DESCARTADO)
+def enqueue_update(raw_update: dict) -> bool:
+    _sumar("received")
+    try:
+        _update_queue.put_nowait(raw_update)
+    except queue.Full:
+        _sumar("dropped")
+        return False
+    with _stats_lock:
+        _stats["enqueued"] += 1
+        _stats["queue_high_watermark"] = max(_stats["queue_high_watermark"], _update_queue.qsize())
+    return True
+
+def _worker(bot: telebot.TeleBot):
+    while True:
+        raw_update = _update_queue.get()
+        try:
+            if raw_update is _STOP:
+                return
+            update = telebot.types.Update.de_json(raw_update)
+            bot.process_new_updates([update])
+            _sumar("processed")
+        except Exception as e:
+            _sumar("errors")
+            logger.error(f"Error procesando update del webhook: {e}", exc_info=True)
+        finally:
+            _update_queue.task_done()
+
+# FUNCION PARA LEER EL HEADER Content-Length SIN CONFIAR EN EL CLIENTE, DEVUELVE NONE SI NO ES UN ENTERO
+def _content_length(valor):
+    try:
+        return int(valor or 0)
+    except ValueError:
+        return None
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    # UN CLIENTE QUE ANUNCIA MAS BYTES DE LOS QUE ENVIA NO DEJA UN HILO DEL SERVIDOR ESPERANDO PARA SIEMPRE
+    timeout = WEBHOOK_READ_TIMEOUT_S
+
+    def do_POST(self):
+        if self.path != WEBHOOK_PATH:
+            self._responder(404)
+            return
+        if WEBHOOK_SECRET and self.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            _sumar("rejected")
+            self._responder(403)
+            return
+        length = _content_length(self.headers.get("Content-Length"))
+        if length is None or length <= 0 or length > MAX_BODY_BYTES:
+            _sumar("rejected")
+            # EL CUERPO NO SE LEE, LA CONEXION SE CIERRA PARA QUE NO SE INTERPRETE COMO EL PROXIMO PEDIDO
+            self.close_connection = True
+            self._responder(413 if length is not None and length > MAX_BODY_BYTES else 400)
+            return
+        try:
+            raw_update = json.loads(self.rfile.read(length))
+        except OSError:
+            # TIMEOUT O CONEXION CORTADA A MITAD DEL CUERPO, NO HAY A QUIEN RESPONDER
+            _sumar("rejected")
+            self.close_connection = True
+            return
+        except (ValueError, UnicodeDecodeError):
+            _sumar("rejected")
+            self._responder(400)
+            return
+        self._responder(200 if enqueue_update(raw_update) else 503)
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            self._responder(200, json.dumps(webhook_stats()).encode("utf-8"), "application/json")
+        else:
+            self._responder(404)
+
+    def _responder(self, status: int, body: bytes = b"", content_type: str = "text/plain"):
+        self.send_response(status)
+        if status == 503:
+            self.send_header("Retry-After", "1")
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"webhook {self.address_string()} - {format % args}")
+
+# FUNCION PARA CREAR EL SERVIDOR Y LOS WORKERS SIN BLOQUEAR (UTIL PARA PRUEBAS LOCALES)
+# LOS HANDLERS SE EJECUTAN DIRECTAMENTE EN LOS WORKERS, POR ESO SE DESACTIVA EL POOL DE HILOS INTERNO DE TELEBOT
+def start_webhook_server(bot: telebot.TeleBot, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT,
+                         workers: int = WEBHOOK_WORKERS, queue_size: int = WEBHOOK_QUEUE_SIZE):
+    global _update_queue
+    _update_queue = queue.Queue(maxsize=queue_size)
+    bot.threaded = False
+    worker_threads = [
+        threading.Thread(target=_worker, args=(bot,), name=f"webhook-worker-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    for thread in worker_threads:
+        thread.start()
+    server = ThreadingHTTPServer((host, port), _WebhookHandler)
+    threading.Thread(target=server.serve_forever, name="webhook-http", daemon=True).start()
+    logger.info(f"Webhook escuchando en http://{host}:{server.server_port}{WEBHOOK_PATH} con {workers} workers (cola de {queue_size}).")
+    return server, worker_threads
+
+# FUNCION PARA DETENER EL SERVIDOR: DEJA DE ACEPTAR UPDATES Y ESPERA A QUE LOS WORKERS VACIEN LA COLA
+def stop_webhook_server(server, worker_threads):
+    server.shutdown()
+    server.server_close()
+    for _ in worker_threads:
+        _update_queue.put(_STOP)
+    for thread in worker_threads:
+        thread.join()
+    logger.info(f"Webhook detenido. Métricas finales: {webhook_stats()}")
+
+# FUNCION PRINCIPAL DEL MODO WEBHOOK, SI HAY WEBHOOK_URL SE REGISTRA EN TELEGRAM, SI NO SOLO ESCUCHA EN LOCAL
+def run_webhook(bot: telebot.TeleBot):
+    server, worker_threads = start_webhook_server(bot)
+    if WEBHOOK_URL:
+        bot.remove_webhook()
+        bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+        logger.info(f"Webhook registrado en Telegram: {WEBHOOK_URL}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        logger.info("Deteniendo el modo webhook...")
+    finally:
+        stop_webhook_server(server, worker_threads)